@@ -0,0 +1,31 @@
+"""Add the product category registry with per-category counts."""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_category_registry"
+down_revision = "20261019_product_row_versions"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if "product_categories" not in set(sa.inspect(op.get_bind()).get_table_names()):
+        op.create_table(
+            "product_categories",
+            sa.Column("name", sa.String(), primary_key=True),
+            sa.Column("product_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("active_count", sa.Integer(), nullable=False, server_default="0"),
+        )
+
+    op.execute("DELETE FROM product_categories")
+    op.execute(
+        "INSERT INTO product_categories (name, product_count, active_count) "
+        "SELECT category, COUNT(*), SUM(CASE WHEN is_archived THEN 0 ELSE 1 END) "
+        "FROM products WHERE category IS NOT NULL GROUP BY category"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("product_categories")
@@ -0,0 +1,22 @@
+"""Widen sync_counters.value so it can hold PostgreSQL transaction ID watermarks."""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_counter_bigint"
+down_revision = "20261019_rollup_slots"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("sync_counters") as batch_op:
+        batch_op.alter_column("value", existing_type=sa.Integer(), type_=sa.BigInteger(), existing_nullable=False)
+
+
+def downgrade() -> None:
+    # Transaction ID watermarks may not fit; the reorder job recomputes everything without one
+    op.execute("DELETE FROM sync_counters WHERE name = 'reorder_last_txid'")
+    with op.batch_alter_table("sync_counters") as batch_op:
+        batch_op.alter_column("value", existing_type=sa.BigInteger(), type_=sa.Integer(), existing_nullable=False)
@@ -0,0 +1,49 @@
+"""Add the change history archive table."""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "20261019_history_archive"
+down_revision = "20261019_inventory_snapshots"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if "change_history_archive" in set(sa.inspect(op.get_bind()).get_table_names()):
+        return
+    # Enum types already exist on PostgreSQL from change_history
+    action = postgresql.ENUM(
+        "add", "update", "sell", "create", "archive", "restore", "delete", "mark_paid",
+        name="changerequestaction", create_type=False,
+    )
+    status = postgresql.ENUM("pending", "approved", "rejected", name="changerequeststatus", create_type=False)
+    payment_status = postgresql.ENUM("paid", "unpaid", name="paymentstatus", create_type=False)
+    op.create_table(
+        "change_history_archive",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("product_id", sa.Integer(), nullable=True),
+        sa.Column("quantity_change", sa.Integer(), nullable=True),
+        sa.Column("action", action, nullable=False),
+        sa.Column("status", status, nullable=False),
+        sa.Column("requester_id", sa.Integer(), nullable=True),
+        sa.Column("reviewer_id", sa.Integer(), nullable=True),
+        sa.Column("timestamp", sa.DateTime(), nullable=False),
+        sa.Column("buyer_name", sa.String(), nullable=True),
+        sa.Column("payment_status", payment_status, nullable=True),
+        sa.Column("unit_price", sa.Float(), nullable=True),
+        sa.Column("product_name", sa.String(), nullable=True),
+        sa.Column("barcode", sa.String(), nullable=True),
+        sa.Column("requester_username", sa.String(), nullable=True),
+        sa.Column("reviewer_username", sa.String(), nullable=True),
+    )
+    op.create_index("ix_change_history_archive_product_id", "change_history_archive", ["product_id"])
+    op.create_index(
+        "ix_change_history_archive_timestamp_id", "change_history_archive", ["timestamp", "id"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("change_history_archive")
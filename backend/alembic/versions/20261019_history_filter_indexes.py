@@ -0,0 +1,32 @@
+"""Index change history columns used by history filters and keyset paging."""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_history_filter_indexes"
+down_revision = "20261019_receivables_index"
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    "ix_change_history_timestamp_id": ["timestamp", "id"],
+    "ix_change_history_action_timestamp": ["action", "timestamp"],
+    "ix_change_history_product_id": ["product_id"],
+    "ix_change_history_requester_id": ["requester_id"],
+    "ix_change_history_reviewer_id": ["reviewer_id"],
+    "ix_change_history_buyer_name": ["buyer_name"],
+    "ix_change_history_barcode": ["barcode"],
+}
+
+
+def upgrade() -> None:
+    existing = {index["name"] for index in sa.inspect(op.get_bind()).get_indexes("change_history")}
+    for name, columns in INDEXES.items():
+        if name not in existing:
+            op.create_index(name, "change_history", columns)
+
+
+def downgrade() -> None:
+    for name in reversed(list(INDEXES)):
+        op.drop_index(name, table_name="change_history")
@@ -0,0 +1,64 @@
+"""
+Snapshot price, product and usernames on change history rows.
+
+Existing rows are backfilled from the product and users as they are at
+migration time, not as they were when each row was written. A sale made
+before a later price change or rename is therefore recorded at the current
+price and name, which misstates revenue and receivables for those rows.
+Rows whose product was already deleted keep empty snapshot columns.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_history_snapshots"
+down_revision = "20261019_sales_rollup"
+branch_labels = None
+depends_on = None
+
+SNAPSHOT_COLUMNS = (
+    ("unit_price", sa.Float()),
+    ("product_name", sa.String()),
+    ("barcode", sa.String()),
+    ("requester_username", sa.String()),
+    ("reviewer_username", sa.String()),
+)
+
+# Rows updated per statement; each batch commits on its own to keep locks short
+BACKFILL_BATCH_SIZE = 5000
+
+BACKFILL_SQL = sa.text(
+    "UPDATE change_history SET "
+    "unit_price = COALESCE(unit_price, "
+    "(SELECT p.price FROM products p WHERE p.id = change_history.product_id)), "
+    "product_name = COALESCE(product_name, "
+    "(SELECT p.name FROM products p WHERE p.id = change_history.product_id)), "
+    "barcode = COALESCE(barcode, "
+    "(SELECT p.barcode FROM products p WHERE p.id = change_history.product_id)), "
+    "requester_username = COALESCE(requester_username, "
+    "(SELECT u.username FROM users u WHERE u.id = change_history.requester_id)), "
+    "reviewer_username = COALESCE(reviewer_username, "
+    "(SELECT u.username FROM users u WHERE u.id = change_history.reviewer_id)) "
+    "WHERE id >= :low AND id < :high"
+)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    existing = {column["name"] for column in sa.inspect(bind).get_columns("change_history")}
+    for name, column_type in SNAPSHOT_COLUMNS:
+        if name not in existing:
+            op.add_column("change_history", sa.Column(name, column_type, nullable=True))
+
+    with op.get_context().autocommit_block():
+        low, high = bind.execute(sa.text("SELECT MIN(id), MAX(id) FROM change_history")).one()
+        if low is None:
+            return
+        for start in range(low, high + 1, BACKFILL_BATCH_SIZE):
+            bind.execute(BACKFILL_SQL, {"low": start, "high": start + BACKFILL_BATCH_SIZE})
+
+
+def downgrade() -> None:
+    for name, _ in reversed(SNAPSHOT_COLUMNS):
+        op.drop_column("change_history", name)
@@ -0,0 +1,61 @@
+"""Add the stock movement log and inventory snapshots for as-of queries."""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_inventory_snapshots"
+down_revision = "20261019_history_filter_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+    if "stock_movements" not in tables:
+        op.create_table(
+            "stock_movements",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("product_id", sa.Integer(), nullable=False),
+            sa.Column("quantity_delta", sa.Integer(), nullable=False),
+            sa.Column("price", sa.Float(), nullable=True),
+            sa.Column("deleted", sa.Boolean(), nullable=False, server_default=sa.false()),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+        )
+        op.create_index("ix_stock_movements_id", "stock_movements", ["id"])
+        op.create_index("ix_stock_movements_product_id", "stock_movements", ["product_id"])
+        op.create_index("ix_stock_movements_created_at", "stock_movements", ["created_at"])
+
+    if "inventory_snapshots" not in tables:
+        op.create_table(
+            "inventory_snapshots",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("taken_at", sa.DateTime(), nullable=False),
+            sa.Column("last_movement_id", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("product_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("total_quantity", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("total_value", sa.Float(), nullable=False, server_default="0"),
+        )
+        op.create_index("ix_inventory_snapshots_id", "inventory_snapshots", ["id"])
+        op.create_index("ix_inventory_snapshots_taken_at", "inventory_snapshots", ["taken_at"])
+
+    if "inventory_snapshot_items" not in tables:
+        op.create_table(
+            "inventory_snapshot_items",
+            sa.Column(
+                "snapshot_id",
+                sa.Integer(),
+                sa.ForeignKey("inventory_snapshots.id", ondelete="CASCADE"),
+                primary_key=True,
+            ),
+            sa.Column("product_id", sa.Integer(), primary_key=True),
+            sa.Column("quantity", sa.Integer(), nullable=False),
+            sa.Column("price", sa.Float(), nullable=False),
+        )
+    # The baseline snapshot is taken at startup (ensure_inventory_snapshot)
+
+
+def downgrade() -> None:
+    op.drop_table("inventory_snapshot_items")
+    op.drop_table("inventory_snapshots")
+    op.drop_table("stock_movements")
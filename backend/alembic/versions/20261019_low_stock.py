@@ -0,0 +1,42 @@
+"""Add reorder thresholds and the maintained low-stock set."""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_low_stock"
+down_revision = "20261019_history_archive"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+    product_columns = {column["name"] for column in inspector.get_columns("products")}
+    if "reorder_threshold" not in product_columns:
+        op.add_column("products", sa.Column("reorder_threshold", sa.Integer(), nullable=True))
+
+    if "category_reorder_thresholds" not in tables:
+        op.create_table(
+            "category_reorder_thresholds",
+            sa.Column("category", sa.String(), primary_key=True),
+            sa.Column("threshold", sa.Integer(), nullable=False),
+        )
+
+    if "low_stock_items" not in tables:
+        op.create_table(
+            "low_stock_items",
+            sa.Column("product_id", sa.Integer(), primary_key=True),
+            sa.Column("quantity", sa.Integer(), nullable=False),
+            sa.Column("threshold", sa.Integer(), nullable=False),
+            sa.Column("since", sa.DateTime(), nullable=False),
+        )
+    # The set is filled at startup (ensure_low_stock)
+
+
+def downgrade() -> None:
+    op.drop_table("low_stock_items")
+    op.drop_table("category_reorder_thresholds")
+    with op.batch_alter_table("products") as batch_op:
+        batch_op.drop_column("reorder_threshold")
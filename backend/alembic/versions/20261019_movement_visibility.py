@@ -0,0 +1,34 @@
+"""Record transaction visibility on stock movements and inventory snapshots."""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_movement_visibility"
+down_revision = "20261019_review_leases"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    movement_columns = {column["name"] for column in inspector.get_columns("stock_movements")}
+    if "txid" not in movement_columns:
+        # Existing rows stay NULL; their snapshots replay by ID as before
+        op.add_column("stock_movements", sa.Column("txid", sa.BigInteger(), nullable=True))
+        op.create_index("ix_stock_movements_txid", "stock_movements", ["txid"])
+
+    snapshot_columns = {column["name"] for column in inspector.get_columns("inventory_snapshots")}
+    if "visibility" not in snapshot_columns:
+        op.add_column("inventory_snapshots", sa.Column("visibility", sa.String(), nullable=True))
+    if "visibility_xmin" not in snapshot_columns:
+        op.add_column("inventory_snapshots", sa.Column("visibility_xmin", sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("inventory_snapshots") as batch_op:
+        batch_op.drop_column("visibility_xmin")
+        batch_op.drop_column("visibility")
+    op.drop_index("ix_stock_movements_txid", table_name="stock_movements")
+    with op.batch_alter_table("stock_movements") as batch_op:
+        batch_op.drop_column("txid")
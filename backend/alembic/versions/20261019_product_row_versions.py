@@ -0,0 +1,70 @@
+"""Add product row versions, tombstones and sync counters for delta sync."""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_product_row_versions"
+down_revision = "20251215_nullable_master_fk"
+branch_labels = None
+depends_on = None
+
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+
+def _column_names(table_name: str) -> set[str]:
+    return {column["name"] for column in _inspector().get_columns(table_name)}
+
+
+def upgrade() -> None:
+    # Tables may already exist when AUTO_CREATE_TABLES ran create_all first.
+    existing_tables = set(_inspector().get_table_names())
+
+    if "sync_counters" not in existing_tables:
+        op.create_table(
+            "sync_counters",
+            sa.Column("name", sa.String(), primary_key=True),
+            sa.Column("value", sa.Integer(), nullable=False, server_default="0"),
+        )
+
+    if "product_tombstones" not in existing_tables:
+        op.create_table(
+            "product_tombstones",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("product_id", sa.Integer(), nullable=False),
+            sa.Column("barcode", sa.String(), nullable=False),
+            sa.Column("row_version", sa.Integer(), nullable=False),
+            sa.Column("deleted_at", sa.DateTime(), nullable=False),
+        )
+        op.create_index("ix_product_tombstones_id", "product_tombstones", ["id"])
+        op.create_index("ix_product_tombstones_product_id", "product_tombstones", ["product_id"])
+        op.create_index("ix_product_tombstones_row_version", "product_tombstones", ["row_version"])
+
+    columns = _column_names("products")
+    with op.batch_alter_table("products", schema=None) as batch_op:
+        if "row_version" not in columns:
+            batch_op.add_column(sa.Column("row_version", sa.Integer(), nullable=False, server_default="0"))
+            batch_op.create_index("ix_products_row_version", ["row_version"])
+        if "updated_at" not in columns:
+            batch_op.add_column(
+                sa.Column("updated_at", sa.DateTime(), nullable=False, server_default=sa.func.now())
+            )
+
+    # Give existing rows distinct versions and start the counter after them.
+    op.execute("UPDATE products SET row_version = id WHERE row_version = 0")
+    op.execute("DELETE FROM sync_counters WHERE name = 'products'")
+    op.execute(
+        "INSERT INTO sync_counters (name, value) "
+        "SELECT 'products', COALESCE(MAX(row_version), 0) FROM products"
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("products", schema=None) as batch_op:
+        batch_op.drop_index("ix_products_row_version")
+        batch_op.drop_column("updated_at")
+        batch_op.drop_column("row_version")
+    op.drop_table("product_tombstones")
+    op.drop_table("sync_counters")
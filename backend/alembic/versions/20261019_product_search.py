@@ -0,0 +1,39 @@
+"""Add trigram and barcode-prefix indexes for product search (PostgreSQL)."""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_product_search"
+down_revision = "20261019_category_registry"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        # SQLite builds its FTS5 table at startup (see app/search.py)
+        return
+
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_products_barcode_pattern "
+        "ON products (barcode varchar_pattern_ops)"
+    )
+    try:
+        with bind.begin_nested():
+            bind.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except sa.exc.DBAPIError:
+        # Without the extension search falls back to the in-process trigram index
+        return
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_products_name_trgm "
+        "ON products USING gin (name gin_trgm_ops)"
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("DROP INDEX IF EXISTS ix_products_name_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_products_barcode_pattern")
@@ -0,0 +1,26 @@
+"""Add the per-product quantity delta ledger."""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_quantity_ledger"
+down_revision = "20261019_stocktakes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if "product_quantity_deltas" not in set(inspector.get_table_names()):
+        op.create_table(
+            "product_quantity_deltas",
+            sa.Column("product_id", sa.Integer(), primary_key=True),
+            sa.Column("slot", sa.Integer(), primary_key=True),
+            sa.Column("delta", sa.Integer(), nullable=False, server_default="0"),
+        )
+
+
+def downgrade() -> None:
+    # Pending deltas should be folded first: python -m app.quantity_ledger
+    op.drop_table("product_quantity_deltas")
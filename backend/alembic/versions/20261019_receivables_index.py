@@ -0,0 +1,22 @@
+"""Index change history by payment status and buyer for the receivables ledger."""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_receivables_index"
+down_revision = "20261019_history_snapshots"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    indexes = {index["name"] for index in sa.inspect(op.get_bind()).get_indexes("change_history")}
+    if "ix_change_history_payment_buyer" not in indexes:
+        op.create_index(
+            "ix_change_history_payment_buyer", "change_history", ["payment_status", "buyer_name"]
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_change_history_payment_buyer", table_name="change_history")
@@ -0,0 +1,33 @@
+"""Add the cached reorder suggestions table."""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_reorder_suggestions"
+down_revision = "20261019_low_stock"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+    if "reorder_suggestions" not in tables:
+        op.create_table(
+            "reorder_suggestions",
+            sa.Column("product_id", sa.Integer(), primary_key=True),
+            sa.Column("quantity", sa.Integer(), nullable=False),
+            sa.Column("velocity", sa.Float(), nullable=False),
+            sa.Column("recent_velocity", sa.Float(), nullable=False),
+            sa.Column("days_of_cover", sa.Float(), nullable=True),
+            sa.Column("reorder_quantity", sa.Integer(), nullable=False),
+            sa.Column("computed_at", sa.DateTime(), nullable=False),
+        )
+        op.create_index(
+            "ix_reorder_suggestions_reorder_quantity", "reorder_suggestions", ["reorder_quantity"]
+        )
+    # Filled by the first refresh (python -m app.reorder)
+
+
+def downgrade() -> None:
+    op.drop_table("reorder_suggestions")
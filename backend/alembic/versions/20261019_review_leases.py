@@ -0,0 +1,30 @@
+"""Add review leases for the multi-reviewer request queue."""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_review_leases"
+down_revision = "20261019_quantity_ledger"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if "review_leases" not in set(inspector.get_table_names()):
+        op.create_table(
+            "review_leases",
+            sa.Column("request_id", sa.Integer(), primary_key=True),
+            sa.Column("reviewer_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("claimed_at", sa.DateTime(), nullable=False),
+            sa.Column("expires_at", sa.DateTime(), nullable=False),
+        )
+        op.create_index("ix_review_leases_reviewer_id", "review_leases", ["reviewer_id"])
+        op.create_index("ix_review_leases_expires_at", "review_leases", ["expires_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_review_leases_expires_at", table_name="review_leases")
+    op.drop_index("ix_review_leases_reviewer_id", table_name="review_leases")
+    op.drop_table("review_leases")
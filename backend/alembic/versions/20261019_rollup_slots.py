@@ -0,0 +1,60 @@
+"""Key the daily sales rollup by slot so quantity-ledger sales spread over several rows."""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_rollup_slots"
+down_revision = "20261019_movement_visibility"
+branch_labels = None
+depends_on = None
+
+_COLUMNS = "day, product_id, product_name, category, units, revenue, sale_count"
+
+
+def _create(name: str, with_slot: bool) -> None:
+    columns = [
+        sa.Column("day", sa.Date(), primary_key=True),
+        sa.Column("product_id", sa.Integer(), primary_key=True),
+    ]
+    if with_slot:
+        columns.append(sa.Column("slot", sa.Integer(), primary_key=True, server_default="0"))
+    op.create_table(
+        name,
+        *columns,
+        sa.Column("product_name", sa.String(), nullable=True),
+        sa.Column("category", sa.String(), nullable=True),
+        sa.Column("units", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("revenue", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("sale_count", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def _swap_in(name: str) -> None:
+    op.drop_table("sales_daily_rollups")
+    op.rename_table(name, "sales_daily_rollups")
+    op.create_index("ix_sales_daily_rollups_product_id", "sales_daily_rollups", ["product_id"])
+    op.create_index("ix_sales_daily_rollups_category", "sales_daily_rollups", ["category"])
+
+
+def upgrade() -> None:
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("sales_daily_rollups")}
+    if "slot" in columns:
+        return
+    # The primary key changes, so copy into a new table
+    _create("sales_daily_rollups_slotted", with_slot=True)
+    op.execute(
+        f"INSERT INTO sales_daily_rollups_slotted ({_COLUMNS}, slot) "
+        f"SELECT {_COLUMNS}, 0 FROM sales_daily_rollups"
+    )
+    _swap_in("sales_daily_rollups_slotted")
+
+
+def downgrade() -> None:
+    _create("sales_daily_rollups_unslotted", with_slot=False)
+    op.execute(
+        f"INSERT INTO sales_daily_rollups_unslotted ({_COLUMNS}) "
+        "SELECT day, product_id, MAX(product_name), MAX(category), SUM(units), SUM(revenue), SUM(sale_count) "
+        "FROM sales_daily_rollups GROUP BY day, product_id"
+    )
+    _swap_in("sales_daily_rollups_unslotted")
@@ -0,0 +1,42 @@
+"""Add the daily sales rollup used by sales reports."""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_sales_rollup"
+down_revision = "20261019_product_search"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if "sales_daily_rollups" not in set(sa.inspect(op.get_bind()).get_table_names()):
+        op.create_table(
+            "sales_daily_rollups",
+            sa.Column("day", sa.Date(), primary_key=True),
+            sa.Column("product_id", sa.Integer(), primary_key=True),
+            sa.Column("product_name", sa.String(), nullable=True),
+            sa.Column("category", sa.String(), nullable=True),
+            sa.Column("units", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("revenue", sa.Float(), nullable=False, server_default="0"),
+            sa.Column("sale_count", sa.Integer(), nullable=False, server_default="0"),
+        )
+        op.create_index("ix_sales_daily_rollups_product_id", "sales_daily_rollups", ["product_id"])
+        op.create_index("ix_sales_daily_rollups_category", "sales_daily_rollups", ["category"])
+
+    # Past sales did not record their price; backfill with the current one
+    op.execute("DELETE FROM sales_daily_rollups")
+    op.execute(
+        "INSERT INTO sales_daily_rollups "
+        "(day, product_id, product_name, category, units, revenue, sale_count) "
+        "SELECT DATE(h.timestamp), p.id, p.name, p.category, "
+        "SUM(ABS(h.quantity_change)), SUM(ABS(h.quantity_change) * p.price), COUNT(h.id) "
+        "FROM change_history h JOIN products p ON p.id = h.product_id "
+        "WHERE h.action = 'sell' AND h.status = 'approved' "
+        "GROUP BY DATE(h.timestamp), p.id, p.name, p.category"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("sales_daily_rollups")
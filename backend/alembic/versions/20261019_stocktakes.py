@@ -0,0 +1,55 @@
+"""Add stocktake sessions and their counted lines."""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261019_stocktakes"
+down_revision = "20261019_reorder_suggestions"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+    if "stocktake_sessions" not in tables:
+        op.create_table(
+            "stocktake_sessions",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column(
+                "status",
+                sa.Enum("open", "applied", "cancelled", name="stocktakestatus"),
+                nullable=False,
+                server_default="open",
+            ),
+            sa.Column("note", sa.String(), nullable=True),
+            sa.Column("created_by_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="SET NULL"), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.Column("applied_by_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="SET NULL"), nullable=True),
+            sa.Column("applied_at", sa.DateTime(), nullable=True),
+        )
+        op.create_index("ix_stocktake_sessions_id", "stocktake_sessions", ["id"])
+        op.create_index("ix_stocktake_sessions_status", "stocktake_sessions", ["status"])
+
+    if "stocktake_counts" not in tables:
+        op.create_table(
+            "stocktake_counts",
+            sa.Column(
+                "session_id",
+                sa.Integer(),
+                sa.ForeignKey("stocktake_sessions.id", ondelete="CASCADE"),
+                primary_key=True,
+            ),
+            sa.Column("product_id", sa.Integer(), primary_key=True),
+            sa.Column("counted_quantity", sa.Integer(), nullable=False),
+            sa.Column("system_quantity", sa.Integer(), nullable=False),
+            sa.Column("variance", sa.Integer(), nullable=False),
+            sa.Column("counted_at", sa.DateTime(), nullable=False),
+            sa.Column("applied", sa.Boolean(), nullable=False, server_default=sa.false()),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("stocktake_counts")
+    op.drop_table("stocktake_sessions")
+    sa.Enum(name="stocktakestatus").drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,187 @@
+"""
+In-process cache of barcode -> product snapshot for the scan hot path.
+
+Writes made through this worker invalidate the affected barcodes right after
+their transaction commits (old and new barcode, so renames are covered).
+Writes made by other workers are picked up from the product row-version
+change log: at most every ``BARCODE_CACHE_SYNC_INTERVAL_SECONDS`` a lookup
+reads the products counter and, if it moved, drops the entries for the
+products and tombstones written since the last check. When the quantity
+ledger counters moved, it drops the products that have pending deltas.
+Entries also expire after ``BARCODE_CACHE_TTL_SECONDS`` as a backstop.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from . import models, schemas, versioning
+from .config import settings
+
+# Beyond this many changed rows a full clear is cheaper than precise invalidation
+_MAX_PRECISE_INVALIDATIONS = 1000
+
+
+class BarcodeCache:
+    def __init__(self, max_size: int, ttl_seconds: float, sync_interval_seconds: float) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.sync_interval_seconds = sync_interval_seconds
+        self._entries: OrderedDict[str, tuple[float, schemas.Product]] = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so a fill that raced a write is discarded
+        self._epoch = 0
+        self._seen_version: Optional[int] = None
+        self._seen_ledger = 0
+        self._last_sync = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get_or_load(
+        self, db: Session, barcode: str, loader: Callable[[], Optional[models.Product]]
+    ) -> Optional[schemas.Product]:
+        if not self.enabled:
+            product = loader()
+            return schemas.Product.model_validate(product) if product else None
+
+        self._sync_from_change_log(db)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(barcode)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(barcode)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            epoch = self._epoch
+
+        product = loader()
+        if product is None:
+            # Misses are not cached so a newly created product is found immediately
+            return None
+        snapshot = schemas.Product.model_validate(product)
+        with self._lock:
+            if epoch == self._epoch:
+                self._entries[barcode] = (now + self.ttl_seconds, snapshot)
+                self._entries.move_to_end(barcode)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, barcodes) -> None:
+        with self._lock:
+            self._epoch += 1
+            for barcode in barcodes:
+                self._entries.pop(barcode, None)
+
+    def invalidate_product_ids(self, product_ids) -> None:
+        ids = set(product_ids)
+        with self._lock:
+            self._epoch += 1
+            stale = [key for key, (_, snapshot) in self._entries.items() if snapshot.id in ids]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            }
+
+    def _sync_from_change_log(self, db: Session) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sync < self.sync_interval_seconds:
+                return
+            # Claimed under the lock: one lookup per interval reads the counter
+            self._last_sync = now
+        versions = versioning.current_versions(db, [versioning.PRODUCTS_COUNTER])
+        version, ledger = versions[versioning.PRODUCTS_COUNTER], versions[versioning.LEDGER_COUNTER]
+        with self._lock:
+            seen, seen_ledger = self._seen_version, self._seen_ledger
+            # A slower concurrent sync may already have moved past these versions
+            if seen is not None and version <= seen and ledger <= seen_ledger:
+                return
+            self._seen_version = max(version, seen or 0)
+            self._seen_ledger = max(ledger, seen_ledger)
+        if seen is None:
+            return
+        if ledger > seen_ledger:
+            # Ledger writes leave row versions alone; drop every product with pending deltas
+            delta = models.ProductQuantityDelta
+            pending = db.query(models.Product.id, models.Product.barcode).filter(
+                models.Product.id.in_(db.query(delta.product_id))
+            ).all()
+            self.invalidate([barcode for _, barcode in pending])
+            self.invalidate_product_ids([product_id for product_id, _ in pending])
+        if version <= seen:
+            return
+        if version - seen > _MAX_PRECISE_INVALIDATIONS:
+            self.clear()
+            return
+        changed = db.query(models.Product.id, models.Product.barcode).filter(
+            models.Product.row_version > seen
+        ).all()
+        removed = db.query(models.ProductTombstone.product_id, models.ProductTombstone.barcode).filter(
+            models.ProductTombstone.row_version > seen
+        ).all()
+        rows = changed + removed
+        # By id as well as barcode: another worker may have renamed the barcode
+        self.invalidate([barcode for _, barcode in rows])
+        self.invalidate_product_ids([product_id for product_id, _ in rows])
+
+
+barcode_cache = BarcodeCache(
+    max_size=settings.BARCODE_CACHE_SIZE,
+    ttl_seconds=settings.BARCODE_CACHE_TTL_SECONDS,
+    sync_interval_seconds=settings.BARCODE_CACHE_SYNC_INTERVAL_SECONDS,
+)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_written_barcodes(session: Session, flush_context, instances) -> None:
+    touched = session.info.setdefault("written_barcodes", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, models.Product):
+            continue
+        if obj.barcode:
+            touched.add(obj.barcode)
+        # Include the previous barcode when it is being changed
+        touched.update(b for b in inspect(obj).attrs.barcode.history.deleted if b)
+
+
+def invalidate_on_commit(session: Session, barcodes) -> None:
+    """Invalidate barcodes written by set-based statements, which the flush hook cannot see."""
+    session.info.setdefault("written_barcodes", set()).update(barcodes)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_barcodes(session: Session) -> None:
+    touched = session.info.pop("written_barcodes", None)
+    if touched:
+        barcode_cache.invalidate(touched)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_barcodes(session: Session) -> None:
+    session.info.pop("written_barcodes", None)
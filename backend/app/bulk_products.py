@@ -0,0 +1,165 @@
+"""
+Set-based archive, restore and delete for many products at once.
+
+Targets are picked by ID list or by category and locked, then changed with
+one ``UPDATE`` or ``DELETE`` per chunk of IDs. Because these statements
+bypass the ORM flush hooks, this module does the same bookkeeping
+explicitly:
+
+- row versions and tombstones, stamped at commit (versioning.py)
+- category counts (category_registry.py)
+- stock movements (stock_snapshots.py)
+- the low-stock set (low_stock.py)
+- barcode cache invalidation
+
+Every product gets a history row, and all the rows are written in one
+multi-row insert. The whole operation is announced as one
+``product.updated`` event listing the affected products.
+"""
+from __future__ import annotations
+
+import datetime
+from collections import defaultdict
+from typing import Optional
+
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session
+
+from . import category_registry, crud, low_stock, models, stock_snapshots, versioning
+from .barcode_cache import invalidate_on_commit
+from .events import hub
+
+ACTION_ARCHIVE = "archive"
+ACTION_RESTORE = "restore"
+ACTION_DELETE = "delete"
+
+# Keeps IN lists well under SQLite's bound-parameter limit
+_CHUNK_SIZE = 500
+
+
+def _chunks(ids: list[int]):
+    for start in range(0, len(ids), _CHUNK_SIZE):
+        yield start, ids[start:start + _CHUNK_SIZE]
+
+
+def _targets(db: Session, action: str, product_ids: Optional[list[int]], category: Optional[str]) -> list:
+    """Products the action applies to, locked for the rest of the transaction."""
+    product = models.Product
+    query = db.query(
+        product.id, product.barcode, product.name, product.price, product.category, product.is_archived
+    )
+    if action == ACTION_ARCHIVE:
+        query = query.filter(product.is_archived.is_(False))
+    elif action == ACTION_RESTORE:
+        query = query.filter(product.is_archived.is_(True))
+    if category is not None:
+        query = query.filter(product.category == category)
+    if product_ids is None:
+        return query.order_by(product.id).with_for_update().all()
+    rows = []
+    for _, chunk in _chunks(sorted(set(product_ids))):
+        rows.extend(query.filter(product.id.in_(chunk)).order_by(product.id).with_for_update().all())
+    return rows
+
+
+def _write_history(db: Session, action: str, rows: list, user: models.User) -> list[int]:
+    usernames = crud.history_snapshot(db, None, user.id, user.id)
+    entries = [
+        models.ChangeHistory(
+            # Deleted products keep only the snapshot, as with single deletes
+            product_id=None if action == ACTION_DELETE else row.id,
+            quantity_change=None,
+            action=models.ChangeRequestAction[action],
+            status=models.ChangeRequestStatus.approved,
+            requester_id=user.id,
+            reviewer_id=user.id,
+            **{**usernames, "unit_price": row.price, "product_name": row.name, "barcode": row.barcode},
+        )
+        for row in rows
+    ]
+    db.add_all(entries)
+    db.flush()
+    return [entry.id for entry in entries]
+
+
+def _set_archived(connection, ids: list[int], archived: bool) -> None:
+    products = models.Product.__table__
+    now = datetime.datetime.utcnow()
+    for _, chunk in _chunks(ids):
+        connection.execute(
+            update(products).where(products.c.id.in_(chunk)).values(is_archived=archived, updated_at=now)
+        )
+
+
+def _delete(connection, rows: list) -> None:
+    products = models.Product.__table__
+    ids = [row.id for row in rows]
+    for _, chunk in _chunks(ids):
+        stock_snapshots.log_deleted_products(connection, chunk)
+        # Keep history and requests, unlinked, as single deletes do
+        for table in (
+            models.ChangeHistory.__table__,
+            models.ChangeHistoryArchive.__table__,
+            models.ChangeRequest.__table__,
+        ):
+            connection.execute(update(table).where(table.c.product_id.in_(chunk)).values(product_id=None))
+        connection.execute(delete(products).where(products.c.id.in_(chunk)))
+
+
+def _category_deltas(action: str, rows: list) -> dict:
+    deltas = defaultdict(lambda: [0, 0])
+    for row in rows:
+        if row.category is None:
+            continue
+        if action == ACTION_DELETE:
+            deltas[row.category][0] -= 1
+            if not row.is_archived:
+                deltas[row.category][1] -= 1
+        else:
+            deltas[row.category][1] += 1 if action == ACTION_RESTORE else -1
+    return {name: tuple(delta) for name, delta in deltas.items()}
+
+
+def bulk_update_products(
+    db: Session,
+    action: str,
+    user: models.User,
+    product_ids: Optional[list[int]] = None,
+    category: Optional[str] = None,
+) -> dict:
+    """
+    Archive, restore or delete the given products (or every product in
+    ``category``) in one transaction. Products already in the target state
+    or not found are skipped.
+    """
+    rows = _targets(db, action, product_ids, category)
+    ids = [row.id for row in rows]
+    skipped = sorted(set(product_ids) - set(ids)) if product_ids is not None else []
+    if not rows:
+        db.rollback()
+        return {"action": action, "product_ids": [], "history_ids": [], "skipped": skipped}
+
+    history_ids = _write_history(db, action, rows, user)
+    connection = db.connection()
+    if action == ACTION_DELETE:
+        _delete(connection, rows)
+        versioning.record_product_deletes(db, rows)
+    else:
+        _set_archived(connection, ids, archived=action == ACTION_ARCHIVE)
+        versioning.record_product_writes(db, ids)
+    category_registry.apply_category_deltas(connection, _category_deltas(action, rows))
+    for _, chunk in _chunks(ids):
+        low_stock.refresh_low_stock(db, product_ids=chunk)
+    invalidate_on_commit(db, [row.barcode for row in rows])
+    db.commit()
+
+    # One event for the whole batch; clients refetch the listed products
+    hub.publish_from_thread({
+        "type": "product.updated",
+        "action": action,
+        "deleted": action == ACTION_DELETE,
+        "product_ids": ids,
+        "categories": sorted({row.category for row in rows if row.category}),
+        "history_ids": history_ids,
+    })
+    return {"action": action, "product_ids": ids, "history_ids": history_ids, "skipped": skipped}
@@ -0,0 +1,120 @@
+"""
+Maintained product category registry.
+
+``product_categories`` holds one row per category with the number of
+products (and non-archived products) in it. A flush hook applies the deltas
+for every product insert, delete, category change or archive toggle in the
+same transaction, so reads are O(categories) instead of a ``SELECT DISTINCT``
+over the whole products table.
+"""
+from collections import defaultdict
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+
+
+def apply_category_deltas(connection, deltas: dict) -> None:
+    """Upsert ``{category: (product_delta, active_delta)}`` into the registry."""
+    table = models.ProductCategory.__table__
+    dialect_insert = postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+    for name in sorted(deltas):
+        product_delta, active_delta = deltas[name]
+        if not product_delta and not active_delta:
+            continue
+        stmt = dialect_insert(table).values(
+            name=name,
+            product_count=max(product_delta, 0),
+            active_count=max(active_delta, 0),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.name],
+            set_={
+                "product_count": table.c.product_count + product_delta,
+                "active_count": table.c.active_count + active_delta,
+            },
+        )
+        connection.execute(stmt)
+
+
+def rebuild_category_registry(db: Session) -> None:
+    """Recompute the registry from the products table."""
+    rows = db.execute(
+        select(
+            models.Product.category,
+            func.count(models.Product.id),
+            func.count(models.Product.id).filter(models.Product.is_archived == False),
+        )
+        .where(models.Product.category.isnot(None))
+        .group_by(models.Product.category)
+    ).all()
+    db.query(models.ProductCategory).delete(synchronize_session=False)
+    for name, product_count, active_count in rows:
+        db.add(models.ProductCategory(name=name, product_count=product_count, active_count=active_count))
+    db.commit()
+
+
+def ensure_category_registry() -> None:
+    """Populate the registry on startup when it is empty but products exist (e.g. fresh create_all)."""
+    db = SessionLocal()
+    try:
+        has_registry = db.query(models.ProductCategory.name).first() is not None
+        has_products = db.query(models.Product.id).first() is not None
+        if has_products and not has_registry:
+            rebuild_category_registry(db)
+    finally:
+        db.close()
+
+
+def _category_or_archive_changed(product: models.Product) -> bool:
+    state = inspect(product)
+    return state.attrs.category.history.has_changes() or state.attrs.is_archived.history.has_changes()
+
+
+@event.listens_for(Session, "before_flush")
+def _track_category_counts(session: Session, flush_context, instances) -> None:
+    deltas = defaultdict(lambda: [0, 0])
+
+    def add(category, archived, sign):
+        if category is None:
+            return
+        deltas[category][0] += sign
+        if not archived:
+            deltas[category][1] += sign
+
+    for obj in session.new:
+        if isinstance(obj, models.Product):
+            add(obj.category, bool(obj.is_archived), +1)
+
+    # Quantity-only writes (every sale) leave the registry untouched
+    changed = [
+        obj for obj in session.dirty
+        if isinstance(obj, models.Product) and _category_or_archive_changed(obj)
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, models.Product)]
+    if changed or deleted:
+        # Read the committed values rather than trusting attribute history,
+        # which is empty when the old value was never loaded.
+        ids = [obj.id for obj in changed + deleted if obj.id is not None]
+        committed = {
+            row.id: (row.category, row.is_archived)
+            for row in session.connection().execute(
+                select(models.Product.id, models.Product.category, models.Product.is_archived)
+                .where(models.Product.id.in_(ids))
+            )
+        } if ids else {}
+        for obj in changed:
+            if obj.id in committed:
+                old_category, old_archived = committed[obj.id]
+                add(old_category, bool(old_archived), -1)
+            add(obj.category, bool(obj.is_archived), +1)
+        for obj in deleted:
+            if obj.id in committed:
+                old_category, old_archived = committed[obj.id]
+                add(old_category, bool(old_archived), -1)
+
+    if deltas:
+        apply_category_deltas(session.connection(), {name: tuple(d) for name, d in deltas.items()})
@@ -0,0 +1,65 @@
+"""
+Conditional GET support.
+
+List endpoints declare which resource families their payload depends on.
+The weak ETag is derived from those families' counters in ``sync_counters``,
+the query string and an optional extra key, so a client whose
+``If-None-Match`` still matches gets a bare 304 after a single primary-key
+lookup, skipping the list query and Pydantic serialization entirely. The counters live in the database rather
+than in process memory so every worker agrees on them.
+"""
+import hashlib
+from typing import Callable, Optional
+
+from fastapi import Depends, HTTPException, Request, Response
+from sqlalchemy.orm import Session
+
+from . import versioning
+from .database import get_db
+
+# Query parameters that do not change the payload
+_IGNORED_PARAMS = {"token"}
+
+
+def make_etag(versions: dict[str, int], request: Request, extra=None) -> str:
+    params = sorted(
+        (key, value) for key, value in request.query_params.multi_items() if key not in _IGNORED_PARAMS
+    )
+    # Accept is part of the key: the same URL can be served as JSON or NDJSON
+    key = (request.url.path, params, request.headers.get("accept", ""), extra)
+    digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]
+    version_part = ".".join(str(versions[name]) for name in sorted(versions))
+    return f'W/"{version_part}-{digest}"'
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: ignore the W/ prefix on either side
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def etag_headers(etag: str) -> dict[str, str]:
+    """Headers to attach when an endpoint returns its own Response object."""
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def conditional_get(*families: str, extra_key: Optional[Callable[[], object]] = None):
+    """
+    Dependency factory: sets an ETag on the response, or short-circuits with 304
+    when the client's If-None-Match matches. Declare it after the endpoint's auth
+    dependency so permissions are checked first. ``extra_key`` adds a value the
+    payload depends on besides the counters, such as the current day.
+    """
+    def dependency(request: Request, response: Response, db: Session = Depends(get_db)) -> str:
+        versions = versioning.current_versions(db, families)
+        etag = make_etag(versions, request, extra_key() if extra_key else None)
+        headers = etag_headers(etag)
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _matches(if_none_match, etag):
+            raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return etag
+
+    return dependency
@@ -37,6 +37,33 @@ class Settings(BaseSettings):
     HOST_raw: str = Field("0.0.0.0", alias='HOST')
     PORT_raw: int = Field(8000, alias='PORT')
 
+    # Realtime WebSocket Configuration
+    # Must be positive: it is the receive timeout, and 0 would spin the socket loop
+    WS_HEARTBEAT_INTERVAL_SECONDS_raw: float = Field(25.0, gt=0, alias='WS_HEARTBEAT_INTERVAL_SECONDS')
+    WS_IDLE_TIMEOUT_SECONDS_raw: float = Field(75.0, alias='WS_IDLE_TIMEOUT_SECONDS')
+    WS_MAX_CONNECTIONS_raw: int = Field(1000, alias='WS_MAX_CONNECTIONS')
+    WS_MAX_CONNECTIONS_PER_USER_raw: int = Field(10, alias='WS_MAX_CONNECTIONS_PER_USER')
+    WS_MAX_TOPICS_PER_CONNECTION_raw: int = Field(100, alias='WS_MAX_TOPICS_PER_CONNECTION')
+
+    # Barcode Lookup Cache Configuration
+    BARCODE_CACHE_SIZE_raw: int = Field(10000, alias='BARCODE_CACHE_SIZE')
+    BARCODE_CACHE_TTL_SECONDS_raw: float = Field(300.0, alias='BARCODE_CACHE_TTL_SECONDS')
+    BARCODE_CACHE_SYNC_INTERVAL_SECONDS_raw: float = Field(1.0, alias='BARCODE_CACHE_SYNC_INTERVAL_SECONDS')
+    SINGLEFLIGHT_WINDOW_SECONDS_raw: float = Field(0.0, alias='SINGLEFLIGHT_WINDOW_SECONDS')
+    INVENTORY_SNAPSHOT_INTERVAL_SECONDS_raw: float = Field(86400.0, alias='INVENTORY_SNAPSHOT_INTERVAL_SECONDS')
+    HISTORY_ARCHIVE_AFTER_DAYS_raw: float = Field(0.0, alias='HISTORY_ARCHIVE_AFTER_DAYS')
+    LOW_STOCK_DEFAULT_THRESHOLD_raw: int = Field(0, alias='LOW_STOCK_DEFAULT_THRESHOLD')
+    REORDER_VELOCITY_WINDOW_DAYS_raw: int = Field(28, alias='REORDER_VELOCITY_WINDOW_DAYS')
+    REORDER_RECENT_WINDOW_DAYS_raw: int = Field(7, alias='REORDER_RECENT_WINDOW_DAYS')
+    REORDER_LEAD_TIME_DAYS_raw: int = Field(7, alias='REORDER_LEAD_TIME_DAYS')
+    REORDER_COVER_DAYS_raw: int = Field(14, alias='REORDER_COVER_DAYS')
+    QUANTITY_LEDGER_SLOTS_raw: int = Field(0, alias='QUANTITY_LEDGER_SLOTS')
+    QUANTITY_LEDGER_COMPACT_SECONDS_raw: float = Field(2.0, alias='QUANTITY_LEDGER_COMPACT_SECONDS')
+    QUANTITY_LEDGER_SAFETY_STOCK_raw: int = Field(50, alias='QUANTITY_LEDGER_SAFETY_STOCK')
+    REVIEW_LEASE_SECONDS_raw: float = Field(300.0, alias='REVIEW_LEASE_SECONDS')
+    REVIEW_AGING_MINUTES_raw: float = Field(60.0, alias='REVIEW_AGING_MINUTES')
+    DASHBOARD_CACHE_SECONDS_raw: float = Field(5.0, alias='DASHBOARD_CACHE_SECONDS')
+
     # --- Part 2: Create computed properties that the rest of your app will use ---
     # These have the clean, public names that your app expects.
     
@@ -135,5 +162,131 @@ class Settings(BaseSettings):
     def PORT(self) -> int:
         return self.PORT_raw
 
+    @computed_field
+    @property
+    def WS_HEARTBEAT_INTERVAL_SECONDS(self) -> float:
+        return self.WS_HEARTBEAT_INTERVAL_SECONDS_raw
+
+    @computed_field
+    @property
+    def WS_IDLE_TIMEOUT_SECONDS(self) -> float:
+        """Close sockets silent for this long; 0 disables the idle check."""
+        return self.WS_IDLE_TIMEOUT_SECONDS_raw
+
+    @computed_field
+    @property
+    def WS_MAX_CONNECTIONS(self) -> int:
+        return self.WS_MAX_CONNECTIONS_raw
+
+    @computed_field
+    @property
+    def WS_MAX_CONNECTIONS_PER_USER(self) -> int:
+        return self.WS_MAX_CONNECTIONS_PER_USER_raw
+
+    @computed_field
+    @property
+    def WS_MAX_TOPICS_PER_CONNECTION(self) -> int:
+        """Topics one socket may subscribe to; 0 means unlimited."""
+        return self.WS_MAX_TOPICS_PER_CONNECTION_raw
+
+    @computed_field
+    @property
+    def BARCODE_CACHE_SIZE(self) -> int:
+        """Maximum cached barcodes per worker; 0 disables the cache."""
+        return self.BARCODE_CACHE_SIZE_raw
+
+    @computed_field
+    @property
+    def BARCODE_CACHE_TTL_SECONDS(self) -> float:
+        return self.BARCODE_CACHE_TTL_SECONDS_raw
+
+    @computed_field
+    @property
+    def BARCODE_CACHE_SYNC_INTERVAL_SECONDS(self) -> float:
+        return self.BARCODE_CACHE_SYNC_INTERVAL_SECONDS_raw
+
+    @computed_field
+    @property
+    def SINGLEFLIGHT_WINDOW_SECONDS(self) -> float:
+        """Reuse a coalesced list response for this long after it completes; 0 disables."""
+        return self.SINGLEFLIGHT_WINDOW_SECONDS_raw
+
+    @computed_field
+    @property
+    def INVENTORY_SNAPSHOT_INTERVAL_SECONDS(self) -> float:
+        """How often workers take an inventory snapshot; 0 leaves it to an external cron job."""
+        return self.INVENTORY_SNAPSHOT_INTERVAL_SECONDS_raw
+
+    @computed_field
+    @property
+    def HISTORY_ARCHIVE_AFTER_DAYS(self) -> float:
+        """Age after which history rows move to the archive table; 0 disables archival."""
+        return self.HISTORY_ARCHIVE_AFTER_DAYS_raw
+
+    @computed_field
+    @property
+    def LOW_STOCK_DEFAULT_THRESHOLD(self) -> int:
+        """Reorder threshold for products with none of their own or of their category; 0 disables."""
+        return self.LOW_STOCK_DEFAULT_THRESHOLD_raw
+
+    @computed_field
+    @property
+    def REORDER_VELOCITY_WINDOW_DAYS(self) -> int:
+        """Days of sales averaged into a product's velocity."""
+        return self.REORDER_VELOCITY_WINDOW_DAYS_raw
+
+    @computed_field
+    @property
+    def REORDER_RECENT_WINDOW_DAYS(self) -> int:
+        """Shorter window so a recent surge in sales raises the suggestion."""
+        return self.REORDER_RECENT_WINDOW_DAYS_raw
+
+    @computed_field
+    @property
+    def REORDER_LEAD_TIME_DAYS(self) -> int:
+        return self.REORDER_LEAD_TIME_DAYS_raw
+
+    @computed_field
+    @property
+    def REORDER_COVER_DAYS(self) -> int:
+        """Days of demand a reorder should cover once it arrives."""
+        return self.REORDER_COVER_DAYS_raw
+
+    @computed_field
+    @property
+    def QUANTITY_LEDGER_SLOTS(self) -> int:
+        """Delta rows per product in quantity-ledger mode; 0 updates products.quantity directly."""
+        return self.QUANTITY_LEDGER_SLOTS_raw
+
+    @computed_field
+    @property
+    def QUANTITY_LEDGER_COMPACT_SECONDS(self) -> float:
+        """How often each worker folds pending deltas into products.quantity."""
+        return self.QUANTITY_LEDGER_COMPACT_SECONDS_raw
+
+    @computed_field
+    @property
+    def QUANTITY_LEDGER_SAFETY_STOCK(self) -> int:
+        """Stock that ledger sales may take between them unseen; larger or riskier sales lock the row."""
+        return self.QUANTITY_LEDGER_SAFETY_STOCK_raw
+
+    @computed_field
+    @property
+    def REVIEW_LEASE_SECONDS(self) -> float:
+        """How long claimed requests stay reserved for their reviewer."""
+        return self.REVIEW_LEASE_SECONDS_raw
+
+    @computed_field
+    @property
+    def REVIEW_AGING_MINUTES(self) -> float:
+        """Requests pending this long are claimed ahead of newer ones regardless of action."""
+        return self.REVIEW_AGING_MINUTES_raw
+
+    @computed_field
+    @property
+    def DASHBOARD_CACHE_SECONDS(self) -> float:
+        """Upper bound on how long the dashboard summary is reused while its data is unchanged."""
+        return self.DASHBOARD_CACHE_SECONDS_raw
+
 
 settings = Settings()
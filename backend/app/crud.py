@@ -1,9 +1,12 @@
+from sqlalchemy import or_, select, union_all
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy.exc import IntegrityError
-from . import models, schemas, auth
+from . import models, schemas, auth, versioning, category_registry, search, sales_rollup, reports, stock_snapshots, history_archive, low_stock, quantity_ledger, review_queue
 from .config import settings
 from datetime import datetime, timezone
+import base64
 from .events import hub
+from .barcode_cache import barcode_cache
 
 # User CRUD
 def get_user_by_username(db: Session, username: str):
@@ -46,6 +49,23 @@ def delete_user(db: Session, user: models.User):
 def get_product_by_barcode(db: Session, barcode: str):
     return db.query(models.Product).filter(models.Product.barcode == barcode).first()
 
+# Keep IN lists well below driver/database parameter limits
+BARCODE_CHUNK_SIZE = 500
+
+def get_products_by_barcodes(db: Session, barcodes) -> dict[str, models.Product]:
+    """Resolve many barcodes with chunked IN queries; returns {barcode: product} for those found."""
+    unique = list(dict.fromkeys(barcodes))
+    found: dict[str, models.Product] = {}
+    for start in range(0, len(unique), BARCODE_CHUNK_SIZE):
+        chunk = unique[start:start + BARCODE_CHUNK_SIZE]
+        for product in db.query(models.Product).filter(models.Product.barcode.in_(chunk)):
+            found[product.barcode] = product
+    return found
+
+def lookup_product_by_barcode(db: Session, barcode: str) -> schemas.Product | None:
+    """Read-only product snapshot for a barcode, served from the lookup cache when possible."""
+    return barcode_cache.get_or_load(db, barcode, lambda: get_product_by_barcode(db, barcode))
+
 def get_product_by_id(db: Session, product_id: int):
     return db.query(models.Product).filter(models.Product.id == product_id).first()
 
@@ -55,8 +75,112 @@ def get_products(db: Session, skip: int = 0, limit: int = 100, include_archived:
         query = query.filter(models.Product.is_archived == False)
     return query.offset(skip).limit(limit).all()
 
+def product_rows_query(db: Session, include_archived: bool = False):
+    """Product columns (schemas.Product shape) as a projection, for streaming without ORM objects."""
+    query = db.query(
+        models.Product.id,
+        models.Product.barcode,
+        models.Product.name,
+        models.Product.price,
+        quantity_ledger.available_quantity_column(),
+        models.Product.category,
+        models.Product.is_archived,
+        models.Product.row_version,
+        models.Product.updated_at,
+    )
+    if not include_archived:
+        query = query.filter(models.Product.is_archived == False)
+    return query.order_by(models.Product.id)
+
+def get_product_changes(db: Session, since: int, limit: int = 500):
+    """
+    Return products written and tombstones recorded after version ``since``,
+    merged in version order and capped at ``limit`` entries.
+    """
+    # Read the counter first: anything committed after this point has a higher
+    # version and will be picked up by the next call.
+    current = versioning.current_version(db)
+    changed = db.query(models.Product).filter(
+        models.Product.row_version > since
+    ).order_by(models.Product.row_version).limit(limit + 1).all()
+    deleted = db.query(models.ProductTombstone).filter(
+        models.ProductTombstone.row_version > since
+    ).order_by(models.ProductTombstone.row_version).limit(limit + 1).all()
+
+    merged = sorted(changed + deleted, key=lambda row: row.row_version)
+    has_more = len(merged) > limit
+    merged = merged[:limit]
+    version = merged[-1].row_version if has_more else max(current, since)
+    # A product id can be reused after a delete; the newer live row wins.
+    live_versions = {p.id: p.row_version for p in merged if isinstance(p, models.Product)}
+    changed = [row for row in merged if isinstance(row, models.Product)]
+    if not has_more and quantity_ledger.enabled():
+        # Ledger writes keep the row version until they are folded, so the
+        # last page re-sends every product with pending deltas
+        delta = models.ProductQuantityDelta
+        changed += db.query(models.Product).filter(
+            models.Product.id.in_(db.query(delta.product_id)),
+            models.Product.id.notin_(list(live_versions)),
+        ).order_by(models.Product.row_version).all()
+    return {
+        "version": version,
+        "changed": changed,
+        "deleted": [
+            row for row in merged
+            if isinstance(row, models.ProductTombstone)
+            and live_versions.get(row.product_id, -1) < row.row_version
+        ],
+        "has_more": has_more,
+    }
+
+def get_product_snapshot(db: Session):
+    """Return (version, rows) for a full first sync, rows as compact tuples."""
+    version = versioning.current_version(db)
+    rows = db.query(
+        models.Product.id,
+        models.Product.barcode,
+        models.Product.name,
+        models.Product.price,
+        quantity_ledger.available_quantity_column(),
+        models.Product.category,
+        models.Product.is_archived,
+        models.Product.row_version,
+    ).order_by(models.Product.id).all()
+    return version, rows
+
+def search_products(
+    db: Session,
+    q: str | None = None,
+    barcode_prefix: str | None = None,
+    category: str | None = None,
+    include_archived: bool = False,
+    limit: int = 50,
+):
+    results = search.search_products(
+        db,
+        q=q,
+        barcode_prefix=barcode_prefix,
+        category=category,
+        include_archived=include_archived,
+        limit=limit,
+    )
+    return [
+        schemas.ProductSearchResult(**schemas.Product.model_validate(product).model_dump(), score=score)
+        for product, score in results
+    ]
+
 def get_product_categories(db: Session):
-    return db.query(models.Product.category).distinct().all()
+    return db.query(models.ProductCategory.name).filter(
+        models.ProductCategory.product_count > 0
+    ).order_by(models.ProductCategory.name).all()
+
+def get_product_category_counts(db: Session, include_archived: bool = True):
+    query = db.query(models.ProductCategory)
+    if include_archived:
+        query = query.filter(models.ProductCategory.product_count > 0)
+    else:
+        query = query.filter(models.ProductCategory.active_count > 0)
+    return query.order_by(models.ProductCategory.name).all()
 
 def create_product(db: Session, product: schemas.ProductCreate) -> models.Product:
     db_product = models.Product(**product.model_dump())
@@ -66,6 +190,8 @@ def create_product(db: Session, product: schemas.ProductCreate) -> models.Produc
 
 def update_product(db: Session, product: models.Product, product_in: schemas.ProductCreate) -> models.Product:
     update_data = product_in.model_dump(exclude_unset=True)
+    if "quantity" in update_data:
+        quantity_ledger.discard_pending(db, product.id)
     for field, value in update_data.items():
         setattr(product, field, value)
     db.add(product)
@@ -92,10 +218,36 @@ def delete_product(db: Session, product: models.Product):
     db.query(models.ChangeHistory).filter(models.ChangeHistory.product_id == product.id).update(
         {models.ChangeHistory.product_id: None}, synchronize_session=False
     )
+    db.query(models.ChangeHistoryArchive).filter(models.ChangeHistoryArchive.product_id == product.id).update(
+        {models.ChangeHistoryArchive.product_id: None}, synchronize_session=False
+    )
     db.delete(product)
     db.commit()
     return product
 
+# Realtime event payloads. Each carries the committed row so clients can patch
+# their local state instead of refetching whole lists.
+def product_event(product: models.Product, deleted: bool = False) -> dict:
+    """Build the realtime event announcing a change to ``product``."""
+    return {
+        "type": "product.updated",
+        "product_id": product.id,
+        "category": product.category,
+        "deleted": deleted,
+        "product": schemas.Product.model_validate(product).model_dump(mode="json"),
+    }
+
+def history_event(entry: models.ChangeHistory) -> dict:
+    return {
+        "type": "history.updated",
+        "action": entry.action.value,
+        "history_id": entry.id,
+        "entry": schemas.ChangeHistory.model_validate(entry).model_dump(mode="json"),
+    }
+
+def request_resolved_event(request_id: int) -> dict:
+    return {"type": "requests.updated", "request_id": request_id, "resolved": True}
+
 # Change Request CRUD
 def create_change_request(db: Session, request: schemas.ChangeRequestCreate, user_id: int):
     db_request = models.ChangeRequest(
@@ -115,13 +267,16 @@ def create_change_request(db: Session, request: schemas.ChangeRequestCreate, use
     db.add(db_request)
     db.commit()
     db.refresh(db_request)
+    hub.publish_from_thread({
+        "type": "requests.updated",
+        "request_id": db_request.id,
+        "resolved": False,
+        "request": schemas.ChangeRequest.model_validate(db_request).model_dump(mode="json"),
+    })
     return db_request
 
-def get_pending_change_requests(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.ChangeRequest).options(
-        joinedload(models.ChangeRequest.product),
-        joinedload(models.ChangeRequest.requester)
-    ).filter(models.ChangeRequest.status == models.ChangeRequestStatus.pending).offset(skip).limit(limit).all()
+def get_pending_change_requests(db: Session, skip: int = 0, limit: int = 100, unclaimed_only: bool = False):
+    return review_queue.pending_queue(db, unclaimed_only=unclaimed_only, skip=skip, limit=limit)
 
 def has_pending_product_creation_request(db: Session, barcode: str):
     """Check if there's already a pending request to create a product with the given barcode"""
@@ -131,27 +286,244 @@ def has_pending_product_creation_request(db: Session, barcode: str):
         models.ChangeRequest.status == models.ChangeRequestStatus.pending
     ).first() is not None
 
+def get_pending_creation_barcodes(db: Session, barcodes) -> set[str]:
+    """Batched has_pending_product_creation_request: the subset of barcodes with a pending create."""
+    unique = list(dict.fromkeys(barcodes))
+    pending: set[str] = set()
+    for start in range(0, len(unique), BARCODE_CHUNK_SIZE):
+        chunk = unique[start:start + BARCODE_CHUNK_SIZE]
+        rows = db.query(models.ChangeRequest.new_product_barcode).filter(
+            models.ChangeRequest.action == models.ChangeRequestAction.create,
+            models.ChangeRequest.status == models.ChangeRequestStatus.pending,
+            models.ChangeRequest.new_product_barcode.in_(chunk),
+        ).distinct()
+        pending.update(barcode for (barcode,) in rows)
+    return pending
+
+def lookup_products(db: Session, barcodes):
+    """Resolve scanned barcodes in bulk; unknown ones are flagged when a create request is pending."""
+    found = get_products_by_barcodes(db, barcodes)
+    unknown = [barcode for barcode in dict.fromkeys(barcodes) if barcode not in found]
+    pending = get_pending_creation_barcodes(db, unknown) if unknown else set()
+    return {
+        "found": [found[barcode] for barcode in dict.fromkeys(barcodes) if barcode in found],
+        "unknown": [{"barcode": barcode, "pending_creation": barcode in pending} for barcode in unknown],
+    }
+
+# History listings. Each view is a set of filters shared by the full (nested
+# ORM) and compact (flat SQL projection) variants.
+HISTORY_VIEW_ALL = "all"
+HISTORY_VIEW_SALES = "sales"
+HISTORY_VIEW_UNPAID = "unpaid"
+
+def _history_filters(view: str, table=models.ChangeHistory) -> list:
+    # Sales of since-deleted products stay listed: rows render from their snapshot columns
+    if view == HISTORY_VIEW_SALES:
+        return [table.action == models.ChangeRequestAction.sell]
+    if view == HISTORY_VIEW_UNPAID:
+        return [
+            table.action == models.ChangeRequestAction.sell,
+            table.payment_status == models.PaymentStatus.unpaid,
+        ]
+    return []
+
+def encode_history_cursor(timestamp: datetime, history_id: int) -> str:
+    """Opaque keyset cursor pointing just past the given row in newest-first order."""
+    raw = f"{timestamp.isoformat()}|{history_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_history_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, history_id = base64.urlsafe_b64decode(padded).decode("utf-8").split("|")
+        return datetime.fromisoformat(timestamp), int(history_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+def _history_query_filters(
+    view: str,
+    filters: schemas.HistoryFilter | None,
+    cursor: str | None,
+    table=models.ChangeHistory,
+) -> list:
+    """View filters plus the caller's filters and keyset cursor, all as SQL predicates on ``table``."""
+    clauses = _history_filters(view, table)
+    if filters is not None:
+        if filters.start is not None:
+            clauses.append(table.timestamp >= filters.start)
+        if filters.end is not None:
+            clauses.append(table.timestamp < filters.end)
+        for column, value in (
+            (table.action, filters.action),
+            (table.status, filters.status),
+            (table.product_id, filters.product_id),
+            (table.barcode, filters.barcode),
+            (table.requester_id, filters.requester_id),
+            (table.reviewer_id, filters.reviewer_id),
+            (table.buyer_name, filters.buyer_name),
+            (table.payment_status, filters.payment_status),
+        ):
+            if value is not None:
+                clauses.append(column == value)
+    if cursor:
+        timestamp, history_id = decode_history_cursor(cursor)
+        # Row-value comparison spelled out so it works on every backend; the
+        # leading bound lets the planner seek the (timestamp, id) index
+        clauses.append(table.timestamp <= timestamp)
+        clauses.append(or_(table.timestamp < timestamp, table.id < history_id))
+    return clauses
+
+def _history_order(table=models.ChangeHistory):
+    # Newest first; id breaks timestamp ties so keyset cursors are stable
+    return (table.timestamp.desc(), table.id.desc())
+
+def _archive_cutoff_for(db: Session, filters: schemas.HistoryFilter | None):
+    """The archive cutoff when this query's date range reaches into the archive, else None."""
+    cutoff = history_archive.archive_cutoff(db)
+    start = filters.start if filters is not None else None
+    return cutoff if history_archive.reaches_archive(cutoff, start) else None
+
+def _page_with_archive(db: Session, filters, skip: int, limit: int, cursor, fetch, timestamp_of) -> list:
+    """
+    One page of newest-first history, reading the archive only when needed.
+    ``fetch(table, offset, count)`` returns rows of ``table`` in history order.
+    """
+    offset = 0 if cursor else skip
+    cutoff = _archive_cutoff_for(db, filters)
+    if cutoff is None:
+        return fetch(models.ChangeHistory, offset, limit)
+
+    needed = offset + limit
+    hot = fetch(models.ChangeHistory, 0, needed)
+    # Archived rows are all older than the cutoff, so a full page ending after it is complete
+    if len(hot) == needed and timestamp_of(hot[-1]) >= cutoff:
+        return hot[offset:]
+    cold = fetch(models.ChangeHistoryArchive, 0, needed)
+    merged = sorted(hot + cold, key=lambda row: (timestamp_of(row), _row_id(row)), reverse=True)
+    return merged[offset:needed]
+
+def _row_id(row):
+    return row["id"] if isinstance(row, dict) else row.id
+
+def get_history(
+    db: Session,
+    view: str,
+    skip: int,
+    limit: int,
+    filters: schemas.HistoryFilter | None = None,
+    cursor: str | None = None,
+):
+    """
+    History rows with nested product/users. With ``cursor`` (from a previous
+    page) ``skip`` is ignored and the page starts right after the cursor row.
+    """
+    def fetch(table, offset, count):
+        return db.query(table).options(
+            joinedload(table.product),
+            joinedload(table.requester),
+            joinedload(table.reviewer)
+        ).filter(*_history_query_filters(view, filters, cursor, table)).order_by(
+            *_history_order(table)
+        ).offset(offset).limit(count).all()
+
+    return _page_with_archive(db, filters, skip, limit, cursor, fetch, lambda row: row.timestamp)
+
 def get_change_history(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.ChangeHistory).options(
-        joinedload(models.ChangeHistory.product),
-        joinedload(models.ChangeHistory.requester),
-        joinedload(models.ChangeHistory.reviewer)
-    ).order_by(models.ChangeHistory.timestamp.desc()).offset(skip).limit(limit).all()
+    return get_history(db, HISTORY_VIEW_ALL, skip, limit)
 
 def get_sales_history(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.ChangeHistory).options(
-        joinedload(models.ChangeHistory.product),
-        joinedload(models.ChangeHistory.requester),
-        joinedload(models.ChangeHistory.reviewer)
-    ).filter(
-        models.ChangeHistory.action == models.ChangeRequestAction.sell,
-        models.ChangeHistory.product_id.isnot(None) # Ensure product exists
-    ).order_by(models.ChangeHistory.timestamp.desc()).offset(skip).limit(limit).all()
+    return get_history(db, HISTORY_VIEW_SALES, skip, limit)
+
+def get_unpaid_sales(db: Session, skip: int = 0, limit: int = 100):
+    return get_history(db, HISTORY_VIEW_UNPAID, skip, limit)
+
+def _history_items_select(table, view: str, filters, cursor):
+    return select(
+        table.id,
+        table.product_id,
+        table.product_name,
+        table.barcode.label("product_barcode"),
+        table.unit_price.label("product_price"),
+        table.quantity_change,
+        table.action,
+        table.status,
+        table.requester_id,
+        table.requester_username,
+        table.reviewer_id,
+        table.reviewer_username,
+        table.timestamp,
+        table.buyer_name,
+        table.payment_status,
+    ).where(*_history_query_filters(view, filters, cursor, table))
+
+def history_items_query(
+    db: Session,
+    view: str = HISTORY_VIEW_ALL,
+    filters: schemas.HistoryFilter | None = None,
+    cursor: str | None = None,
+):
+    """
+    Flat history rows (schemas.ChangeHistoryItem shape) straight from a SQL
+    projection over the snapshot columns: no joins, no ORM hydration and no
+    nested product/user objects. Archived rows are included (UNION ALL) when
+    the date range reaches into the archive.
+    """
+    source = _history_items_select(models.ChangeHistory, view, filters, cursor)
+    if _archive_cutoff_for(db, filters) is not None:
+        source = union_all(
+            source, _history_items_select(models.ChangeHistoryArchive, view, filters, cursor)
+        )
+    rows = source.subquery()
+    return db.query(rows).order_by(rows.c.timestamp.desc(), rows.c.id.desc())
+
+def get_history_items(
+    db: Session,
+    view: str = HISTORY_VIEW_ALL,
+    skip: int = 0,
+    limit: int = 100,
+    filters: schemas.HistoryFilter | None = None,
+    cursor: str | None = None,
+) -> list[dict]:
+    def fetch(table, offset, count):
+        query = _history_items_select(table, view, filters, cursor).order_by(
+            *_history_order(table)
+        ).offset(offset).limit(count)
+        return [row._asdict() for row in db.execute(query)]
+
+    return _page_with_archive(db, filters, skip, limit, cursor, fetch, lambda row: row["timestamp"])
+
+def history_snapshot(db: Session, product, requester_id, reviewer_id, request=None) -> dict:
+    """
+    Snapshot columns for a new ChangeHistory row: the product's price, name and
+    barcode (or those proposed by ``request`` when there is no product yet) and
+    both usernames as they are now.
+    """
+    user_ids = {user_id for user_id in (requester_id, reviewer_id) if user_id is not None}
+    usernames = dict(
+        db.query(models.User.id, models.User.username).filter(models.User.id.in_(user_ids)).all()
+    ) if user_ids else {}
+    if product is not None:
+        unit_price, product_name, barcode = product.price, product.name, product.barcode
+    elif request is not None:
+        unit_price = request.new_product_price
+        product_name = request.new_product_name
+        barcode = request.new_product_barcode
+    else:
+        unit_price = product_name = barcode = None
+    return {
+        "unit_price": unit_price,
+        "product_name": product_name,
+        "barcode": barcode,
+        "requester_username": usernames.get(requester_id),
+        "reviewer_username": usernames.get(reviewer_id),
+    }
 
 def approve_change_request(db: Session, request_id: int, reviewer_id: int):
     db_request = db.query(models.ChangeRequest).filter(models.ChangeRequest.id == request_id).first()
     if not db_request or db_request.status != models.ChangeRequestStatus.pending:
         return None
+    if not review_queue.resolve(db, request_id, reviewer_id):
+        return None
 
     db_product = None
     if db_request.product_id:
@@ -159,12 +531,20 @@ def approve_change_request(db: Session, request_id: int, reviewer_id: int):
 
     if db_request.action == models.ChangeRequestAction.add:
         if db_product:
-            db_product.quantity += db_request.quantity_change
+            if quantity_ledger.adjust_quantity(db, db_product, db_request.quantity_change) is not None:
+                stock_snapshots.log_ledger_write(db.connection(), db_product, db_request.quantity_change)
+                low_stock.recheck_ledger_write(db, db_product)
     elif db_request.action == models.ChangeRequestAction.sell:
         if db_product:
-            if db_product.quantity < db_request.quantity_change:
-                raise ValueError("Not enough stock to sell.")
-            db_product.quantity -= db_request.quantity_change
+            slot = quantity_ledger.adjust_quantity(db, db_product, -db_request.quantity_change)
+            if slot is not None:
+                # The product row is untouched, so the flush hooks do not see the sale
+                stock_snapshots.log_ledger_write(db.connection(), db_product, -db_request.quantity_change)
+                low_stock.recheck_ledger_write(db, db_product)
+            # Same transaction as the history row, at the price in effect now
+            sales_rollup.record_sale(
+                db.connection(), datetime.now(timezone.utc).date(), db_product, db_request.quantity_change, slot or 0
+            )
     elif db_request.action == models.ChangeRequestAction.update:
         # Apply field updates to the existing product
         if not db_product:
@@ -181,6 +561,7 @@ def approve_change_request(db: Session, request_id: int, reviewer_id: int):
         if db_request.new_product_price is not None:
             update_fields['price'] = db_request.new_product_price
         if db_request.new_product_quantity is not None:
+            quantity_ledger.discard_pending(db, db_product.id)
             update_fields['quantity'] = db_request.new_product_quantity
         if db_request.new_product_category is not None:
             update_fields['category'] = db_request.new_product_category
@@ -230,8 +611,12 @@ def approve_change_request(db: Session, request_id: int, reviewer_id: int):
         db.commit()
         # Notify clients
         if db_product:
-            hub.publish_from_thread({"type": "product.updated", "product_id": db_product.id})
-        hub.publish_from_thread({"type": "history.updated"})
+            hub.publish_from_thread(product_event(db_product))
+        if updated_history:
+            hub.publish_from_thread(history_event(updated_history))
+        else:
+            hub.publish_from_thread({"type": "history.updated", "action": db_request.action.value})
+        hub.publish_from_thread(request_resolved_event(request_id))
         return updated_history
 
     # Log to history before deleting the product
@@ -250,26 +635,33 @@ def approve_change_request(db: Session, request_id: int, reviewer_id: int):
         requester_id=db_request.requester_id,
         reviewer_id=reviewer_id,
         buyer_name=db_request.buyer_name,
-        payment_status=db_request.payment_status
+        payment_status=db_request.payment_status,
+        **history_snapshot(db, db_product, db_request.requester_id, reviewer_id, db_request),
     )
     db.add(history_entry)
 
     # Apply post-history action
+    deleted_event = None
     if db_product:
         if db_request.action == models.ChangeRequestAction.archive:
             archive_product(db, db_product)
         elif db_request.action == models.ChangeRequestAction.restore:
             unarchive_product(db, db_product)
         elif db_request.action == models.ChangeRequestAction.delete:
+            # Snapshot the row before the delete detaches it
+            deleted_event = product_event(db_product, deleted=True)
             delete_product(db, db_product)
 
     # Delete the original request
     db.delete(db_request)
     db.commit()
     # Broadcast changes
-    if db_product:
-        hub.publish_from_thread({"type": "product.updated", "product_id": db_product.id})
-    hub.publish_from_thread({"type": "history.updated"})
+    if deleted_event:
+        hub.publish_from_thread(deleted_event)
+    elif db_product:
+        hub.publish_from_thread(product_event(db_product))
+    hub.publish_from_thread(history_event(history_entry))
+    hub.publish_from_thread(request_resolved_event(request_id))
     return history_entry
 
 
@@ -277,6 +669,8 @@ def reject_change_request(db: Session, request_id: int, reviewer_id: int):
     db_request = db.query(models.ChangeRequest).filter(models.ChangeRequest.id == request_id).first()
     if not db_request or db_request.status != models.ChangeRequestStatus.pending:
         return None
+    if not review_queue.resolve(db, request_id, reviewer_id):
+        return None
 
     # Log to history
     history_entry = models.ChangeHistory(
@@ -287,11 +681,65 @@ def reject_change_request(db: Session, request_id: int, reviewer_id: int):
         requester_id=db_request.requester_id,
         reviewer_id=reviewer_id,
         buyer_name=db_request.buyer_name,
-        payment_status=db_request.payment_status
+        payment_status=db_request.payment_status,
+        **history_snapshot(db, db_request.product, db_request.requester_id, reviewer_id, db_request),
     )
     db.add(history_entry)
 
     # Delete the original request
     db.delete(db_request)
     db.commit()
+    hub.publish_from_thread(history_event(history_entry))
+    hub.publish_from_thread(request_resolved_event(request_id))
     return history_entry
+
+
+def settle_buyer_receivables(db: Session, buyer_name: str, user: models.User, history_ids=None) -> dict:
+    """
+    Mark all (or the selected) unpaid sales of ``buyer_name`` paid in one
+    transaction, with a single mark_paid history row recording how many sales
+    were settled, and a single broadcast.
+    """
+    query = db.query(models.ChangeHistory.id, reports.sale_amount()).filter(
+        *reports.receivable_filters(), models.ChangeHistory.buyer_name == buyer_name
+    )
+    if history_ids:
+        query = query.filter(models.ChangeHistory.id.in_(set(history_ids)))
+    # Lock the rows so a concurrent settlement cannot count them twice (no-op on SQLite)
+    rows = query.with_for_update().all()
+    if history_ids:
+        missing = set(history_ids) - {row_id for row_id, _ in rows}
+        if missing:
+            raise ValueError(f"Not unpaid sales of {buyer_name}: {sorted(missing)}")
+    if not rows:
+        raise ValueError(f"No unpaid sales for {buyer_name}.")
+
+    settled_ids = sorted(row_id for row_id, _ in rows)
+    db.query(models.ChangeHistory).filter(models.ChangeHistory.id.in_(settled_ids)).update(
+        {models.ChangeHistory.payment_status: models.PaymentStatus.paid}, synchronize_session=False
+    )
+    audit_entry = models.ChangeHistory(
+        product_id=None,
+        quantity_change=len(settled_ids),
+        action=models.ChangeRequestAction.mark_paid,
+        status=models.ChangeRequestStatus.approved,
+        requester_id=user.id,
+        reviewer_id=user.id,
+        buyer_name=buyer_name,
+        payment_status=models.PaymentStatus.paid,
+        **history_snapshot(db, None, user.id, user.id),
+    )
+    db.add(audit_entry)
+    db.commit()
+    db.refresh(audit_entry)
+
+    event = history_event(audit_entry)
+    event["settled_ids"] = settled_ids
+    hub.publish_from_thread(event)
+    return {
+        "buyer_name": buyer_name,
+        "settled_ids": settled_ids,
+        "settled_count": len(settled_ids),
+        "settled_amount": float(sum(amount or 0.0 for _, amount in rows)),
+        "history": audit_entry,
+    }
@@ -0,0 +1,127 @@
+"""
+Home-screen summary: counts and totals the app used to derive from full lists.
+
+Everything comes from two aggregate statements. The first counts pending
+requests grouped by action. The second reads every other figure from
+single-row subqueries over:
+
+- ``change_history`` for unpaid sales
+- ``sales_daily_rollups`` for today's sales
+- ``low_stock_items`` for stock alerts
+- ``product_categories`` for the catalogue size, plus ``products`` rows
+  without a category
+- ``review_leases`` for pending requests no reviewer has claimed
+
+The result is cached in process for ``DASHBOARD_CACHE_SECONDS``. The cache
+key holds the products (and ledger), history and requests counters from
+``sync_counters`` and the UTC day, so any write to those families, from any
+worker, is seen on the next read. Concurrent misses share one computation.
+Review claims and threshold changes do not move a counter and show up once
+the entry expires.
+"""
+from __future__ import annotations
+
+import datetime
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import case, exists, func, select, true
+from sqlalchemy.orm import Session
+
+from . import models, reports, versioning
+from .config import settings
+from .singleflight import single_flight
+
+_FAMILIES = (versioning.PRODUCTS_COUNTER, versioning.HISTORY_COUNTER, versioning.REQUESTS_COUNTER)
+
+_lock = threading.Lock()
+# (key, expires at, summary)
+_cached: Optional[tuple[tuple, float, dict]] = None
+
+
+def compute_summary(db: Session, today: datetime.date) -> dict:
+    request = models.ChangeRequest
+    pending = models.ChangeRequestStatus.pending
+    by_action = {
+        action.value: count for action, count in
+        db.query(request.action, func.count(request.id)).filter(request.status == pending).group_by(request.action)
+    }
+
+    history = models.ChangeHistory
+    rollup = models.SalesDailyRollup
+    product = models.Product
+    category = models.ProductCategory
+    lease = models.ReviewLease
+    low = models.LowStockItem
+    now = datetime.datetime.utcnow()
+    # Single-row subqueries side by side: one statement, one row
+    unpaid = select(
+        func.count(history.id).label("unpaid_count"),
+        func.coalesce(func.sum(reports.sale_amount()), 0.0).label("unpaid_amount"),
+        func.count(history.buyer_name.distinct()).label("unpaid_buyers"),
+    ).where(*reports.receivable_filters()).subquery()
+    sales = select(
+        func.coalesce(func.sum(rollup.revenue), 0.0).label("sales_today_revenue"),
+        func.coalesce(func.sum(rollup.units), 0).label("sales_today_units"),
+        func.coalesce(func.sum(rollup.sale_count), 0).label("sales_today_count"),
+    ).where(rollup.day == today).subquery()
+    stock = select(
+        func.count(low.product_id).label("low_stock_count"),
+        func.coalesce(func.sum(case((low.quantity <= 0, 1), else_=0)), 0).label("out_of_stock_count"),
+    ).subquery()
+    # Catalogue size from the maintained category registry; products without
+    # a category are not in it and are counted through the category index
+    registry = select(
+        func.coalesce(func.sum(category.product_count), 0).label("products"),
+        func.coalesce(func.sum(category.active_count), 0).label("active"),
+        func.count(category.name).filter(category.product_count > 0).label("categories"),
+    ).subquery()
+    uncategorized = select(
+        func.count(product.id).label("products"),
+        func.coalesce(func.sum(case((product.is_archived.is_(False), 1), else_=0)), 0).label("active"),
+    ).where(product.category.is_(None)).subquery()
+    catalogue = select(
+        (registry.c.products + uncategorized.c.products).label("product_count"),
+        (registry.c.active + uncategorized.c.active).label("active_product_count"),
+        registry.c.categories.label("category_count"),
+    ).select_from(registry.join(uncategorized, true())).subquery()
+    unclaimed = select(func.count(request.id)).where(
+        request.status == pending,
+        ~exists().where(lease.request_id == request.id, lease.expires_at > now),
+    ).scalar_subquery().label("pending_unclaimed")
+    totals = db.execute(
+        select(unpaid, sales, stock, catalogue, unclaimed).select_from(
+            unpaid.join(sales, true()).join(stock, true()).join(catalogue, true())
+        )
+    ).one()._asdict()
+
+    return {
+        **totals,
+        "as_of": today,
+        "computed_at": now,
+        "pending_total": sum(by_action.values()),
+        "pending_by_action": by_action,
+    }
+
+
+def get_summary(db: Session) -> dict:
+    """The cached summary, recomputed when its counters or day moved or it expired."""
+    global _cached
+    today = datetime.datetime.utcnow().date()
+    versions = versioning.current_versions(db, _FAMILIES)
+    # Includes the ledger counters, which move with every ledger sale
+    key = (today, *(versions[name] for name in sorted(versions)))
+    now = time.monotonic()
+    with _lock:
+        if _cached is not None and _cached[0] == key and _cached[1] > now:
+            return _cached[2]
+
+    def produce() -> dict:
+        global _cached
+        summary = compute_summary(db, today)
+        with _lock:
+            _cached = (key, time.monotonic() + settings.DASHBOARD_CACHE_SECONDS, summary)
+        return summary
+
+    return single_flight.do(("dashboard", key), produce)
@@ -1,38 +1,216 @@
 from __future__ import annotations
 
-from typing import Set, Any, Dict
+from typing import Set, Any, Dict, Iterable, Optional
 import json
 
 from fastapi import WebSocket
 import anyio
 
+from .config import settings
+
+
+# Topics a client can subscribe to. Product and category topics are
+# parameterised, e.g. "product:42" or "category:Drinks".
+TOPIC_PRODUCTS = "products"
+TOPIC_HISTORY = "history"
+TOPIC_PENDING_REQUESTS = "requests.pending"
+TOPIC_SALES = "sales"
+TOPIC_STOCK = "stock"
+STATIC_TOPICS = {TOPIC_PRODUCTS, TOPIC_HISTORY, TOPIC_PENDING_REQUESTS, TOPIC_SALES, TOPIC_STOCK}
+PRODUCT_TOPIC_PREFIX = "product:"
+CATEGORY_TOPIC_PREFIX = "category:"
+
+
+def product_topic(product_id: int) -> str:
+    return f"{PRODUCT_TOPIC_PREFIX}{product_id}"
+
+
+def category_topic(category: str) -> str:
+    return f"{CATEGORY_TOPIC_PREFIX}{category}"
+
+
+def is_valid_topic(topic: Any) -> bool:
+    if not isinstance(topic, str) or not topic:
+        return False
+    if topic in STATIC_TOPICS:
+        return True
+    if topic.startswith(PRODUCT_TOPIC_PREFIX):
+        return topic[len(PRODUCT_TOPIC_PREFIX):].isdigit()
+    if topic.startswith(CATEGORY_TOPIC_PREFIX):
+        return len(topic) > len(CATEGORY_TOPIC_PREFIX)
+    return False
+
+
+def topics_for_message(message: Dict[str, Any]) -> Set[str]:
+    """Derive the topics an event belongs to from its type and payload."""
+    event_type = message.get("type")
+    topics: Set[str] = set()
+    if event_type == "product.updated":
+        topics.add(TOPIC_PRODUCTS)
+        if message.get("product_id") is not None:
+            topics.add(product_topic(message["product_id"]))
+        if message.get("category"):
+            topics.add(category_topic(message["category"]))
+        # Bulk operations announce every product, category and history row in one event
+        topics.update(product_topic(product_id) for product_id in message.get("product_ids", ()))
+        topics.update(category_topic(category) for category in message.get("categories", ()))
+        if message.get("history_ids"):
+            topics.add(TOPIC_HISTORY)
+    elif event_type == "history.updated":
+        topics.add(TOPIC_HISTORY)
+        if message.get("action") in ("sell", "mark_paid"):
+            topics.add(TOPIC_SALES)
+    elif event_type == "requests.updated":
+        topics.add(TOPIC_PENDING_REQUESTS)
+    elif event_type == "stocktake.applied":
+        topics.update((TOPIC_PRODUCTS, TOPIC_HISTORY))
+        topics.update(product_topic(product_id) for product_id in message.get("product_ids", ()))
+    elif event_type == "stock.low":
+        topics.add(TOPIC_STOCK)
+        for item in message.get("items", ()):
+            topics.add(product_topic(item["product_id"]))
+            if item.get("category"):
+                topics.add(category_topic(item["category"]))
+    return topics
+
 
 class WebSocketHub:
-    def __init__(self) -> None:
+    def __init__(
+        self, max_connections: int = 0, max_connections_per_user: int = 0, max_topics_per_connection: int = 0
+    ) -> None:
+        # Caps of 0 mean unlimited
+        self.max_connections = max_connections
+        self.max_connections_per_user = max_connections_per_user
+        self.max_topics_per_connection = max_topics_per_connection
         self._connections: Set[WebSocket] = set()
+        self._user_connections: Dict[str, Set[WebSocket]] = {}
+        self._socket_users: Dict[WebSocket, str] = {}
+        # Sockets that never sent a subscribe message keep receiving every event,
+        # so older clients continue to work unchanged.
+        self._firehose: Set[WebSocket] = set()
+        self._topic_index: Dict[str, Set[WebSocket]] = {}
+        self._subscriptions: Dict[WebSocket, Set[str]] = {}
 
-    async def connect(self, websocket: WebSocket) -> None:
-        await websocket.accept()
+    @property
+    def connection_count(self) -> int:
+        return len(self._connections)
+
+    def user_connection_count(self, user_key: str) -> int:
+        return len(self._user_connections.get(user_key, ()))
+
+    async def connect(self, websocket: WebSocket, user_key: Optional[str] = None) -> bool:
+        """
+        Accept and register a socket. Returns False (after closing the socket)
+        when the global or per-user connection cap is reached.
+        """
+        if self.max_connections and len(self._connections) >= self.max_connections:
+            await websocket.close(code=1013)
+            return False
+        if (
+            user_key is not None
+            and self.max_connections_per_user
+            and self.user_connection_count(user_key) >= self.max_connections_per_user
+        ):
+            await websocket.close(code=4429)
+            return False
+
+        # Register before awaiting accept so concurrent handshakes see the slot as taken
         self._connections.add(websocket)
+        if user_key is not None:
+            self._user_connections.setdefault(user_key, set()).add(websocket)
+            self._socket_users[websocket] = user_key
+        try:
+            await websocket.accept()
+        except Exception:
+            self.disconnect(websocket)
+            raise
+        self._firehose.add(websocket)
+        return True
 
     def disconnect(self, websocket: WebSocket) -> None:
         self._connections.discard(websocket)
+        self._firehose.discard(websocket)
+        user_key = self._socket_users.pop(websocket, None)
+        if user_key is not None:
+            sockets = self._user_connections.get(user_key)
+            if sockets is not None:
+                sockets.discard(websocket)
+                if not sockets:
+                    del self._user_connections[user_key]
+        for topic in self._subscriptions.pop(websocket, set()):
+            self._remove_from_topic(topic, websocket)
+
+    def subscribe(self, websocket: WebSocket, topics: Iterable[str]) -> Set[str]:
+        """
+        Add topics to the socket's subscriptions. Raises ValueError, leaving
+        them unchanged, when the result would exceed the per-connection cap.
+        """
+        if websocket not in self._connections:
+            return set()
+        topics = set(topics)
+        current = self._subscriptions.get(websocket, set())
+        if self.max_topics_per_connection and len(current | topics) > self.max_topics_per_connection:
+            raise ValueError(f"At most {self.max_topics_per_connection} topics per connection")
+        self._firehose.discard(websocket)
+        current = self._subscriptions.setdefault(websocket, set())
+        for topic in topics:
+            current.add(topic)
+            self._topic_index.setdefault(topic, set()).add(websocket)
+        return set(current)
+
+    def unsubscribe(self, websocket: WebSocket, topics: Iterable[str]) -> Set[str]:
+        current = self._subscriptions.get(websocket)
+        if current is None:
+            return set()
+        for topic in topics:
+            current.discard(topic)
+            self._remove_from_topic(topic, websocket)
+        return set(current)
 
-    async def broadcast_json(self, message: Dict[str, Any]) -> None:
+    def subscriptions(self, websocket: WebSocket) -> Optional[Set[str]]:
+        """Return the socket's topics, or None when it still receives everything."""
+        current = self._subscriptions.get(websocket)
+        return set(current) if current is not None else None
+
+    def _remove_from_topic(self, topic: str, websocket: WebSocket) -> None:
+        sockets = self._topic_index.get(topic)
+        if sockets is None:
+            return
+        sockets.discard(websocket)
+        if not sockets:
+            del self._topic_index[topic]
+
+    def _recipients(self, topics: Iterable[str]) -> Set[WebSocket]:
+        recipients = set(self._firehose)
+        for topic in topics:
+            sockets = self._topic_index.get(topic)
+            if sockets:
+                recipients |= sockets
+        return recipients
+
+    async def broadcast_json(self, message: Dict[str, Any], topics: Optional[Iterable[str]] = None) -> None:
+        if topics is None:
+            topics = topics_for_message(message)
+        recipients = self._recipients(topics)
+        if not recipients:
+            return
+        text = json.dumps(message)
         dead: Set[WebSocket] = set()
-        for ws in list(self._connections):
+        for ws in recipients:
             try:
-                await ws.send_text(json.dumps(message))
+                await ws.send_text(text)
             except Exception:
                 dead.add(ws)
         for ws in dead:
             self.disconnect(ws)
 
     # Safe to call from normal (threadpool) code
-    def publish_from_thread(self, message: Dict[str, Any]) -> None:
-        anyio.from_thread.run(self.broadcast_json, message)
-
-
-hub = WebSocketHub()
+    def publish_from_thread(self, message: Dict[str, Any], topics: Optional[Iterable[str]] = None) -> None:
+        anyio.from_thread.run(self.broadcast_json, message, topics)
 
 
+hub = WebSocketHub(
+    max_connections=settings.WS_MAX_CONNECTIONS,
+    max_connections_per_user=settings.WS_MAX_CONNECTIONS_PER_USER,
+    max_topics_per_connection=settings.WS_MAX_TOPICS_PER_CONNECTION,
+)
@@ -0,0 +1,138 @@
+"""
+Tiered storage for cold change history.
+
+``archive_cold_history`` moves rows older than ``HISTORY_ARCHIVE_AFTER_DAYS``
+from ``change_history`` into ``change_history_archive`` in id batches. Each
+batch is one ``INSERT ... SELECT`` plus one ``DELETE`` in a single
+transaction, and it is rolled back unless both touch exactly the selected
+rows. Unpaid sales stay in the hot table so receivables and mark-paid keep
+working on them.
+
+The archive cutoff (a watermark that only moves forward) and the running
+total of archived rows live in ``sync_counters``. History reads consult the
+archive only when their date range starts before the cutoff and the hot
+table alone cannot fill the page; ``check_archive_integrity`` compares the
+archive's row count with the running total.
+
+Run it from cron with ``python -m app.history_archive`` or via
+``POST /api/history/archive``.
+"""
+from __future__ import annotations
+
+import datetime
+from typing import Optional
+
+from sqlalchemy import and_, delete, func, insert, not_, select
+from sqlalchemy.orm import Session
+
+from . import models, versioning
+from .config import settings
+from .database import SessionLocal
+
+# Counters in sync_counters; the cutoff is stored as Unix seconds
+ARCHIVE_CUTOFF_COUNTER = "history_archive_cutoff"
+ARCHIVED_ROWS_COUNTER = "history_archived_rows"
+
+ARCHIVE_BATCH_SIZE = 1000
+
+_COLUMNS = [column.name for column in models.ChangeHistoryArchive.__table__.columns]
+
+
+class ArchiveIntegrityError(RuntimeError):
+    pass
+
+
+def _to_epoch(value: datetime.datetime) -> int:
+    return int(value.replace(tzinfo=datetime.timezone.utc).timestamp())
+
+
+def _from_epoch(value: int) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(value, datetime.timezone.utc).replace(tzinfo=None)
+
+
+def archive_cutoff(db: Session) -> Optional[datetime.datetime]:
+    """Rows older than this may be in the archive; None when nothing was ever archived."""
+    value = versioning.current_version(db, ARCHIVE_CUTOFF_COUNTER)
+    return _from_epoch(value) if value else None
+
+
+def reaches_archive(cutoff: Optional[datetime.datetime], start: Optional[datetime.datetime]) -> bool:
+    return cutoff is not None and (start is None or start < cutoff)
+
+
+def archive_cold_history(db: Session, older_than_days: Optional[float] = None) -> dict:
+    """Move cold history into the archive; returns the cutoff used and rows moved."""
+    days = settings.HISTORY_ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    if days <= 0:
+        raise ValueError("History archival is disabled (HISTORY_ARCHIVE_AFTER_DAYS is 0).")
+    # Whole seconds, so the stored watermark is exactly the cutoff used
+    cutoff = (datetime.datetime.utcnow() - datetime.timedelta(days=days)).replace(microsecond=0)
+    previous = archive_cutoff(db)
+    if previous is not None and previous > cutoff:
+        # The watermark never moves back: older rows may already be archived
+        cutoff = previous
+
+    history = models.ChangeHistory
+    hot = history.__table__
+    archive = models.ChangeHistoryArchive.__table__
+    # SQLite reuses the highest rowid once it is deleted, so never move the newest row
+    newest_id = db.query(func.max(history.id)).scalar() or 0
+    cold = and_(
+        history.timestamp < cutoff,
+        history.id < newest_id,
+        not_(and_(
+            history.action == models.ChangeRequestAction.sell,
+            history.payment_status == models.PaymentStatus.unpaid,
+        )),
+    )
+
+    moved = 0
+    while True:
+        ids = [
+            row_id for (row_id,) in
+            db.query(history.id).filter(cold).order_by(history.id).limit(ARCHIVE_BATCH_SIZE)
+        ]
+        if not ids:
+            break
+        connection = db.connection()
+        inserted = connection.execute(
+            insert(archive).from_select(
+                _COLUMNS, select(*[hot.c[name] for name in _COLUMNS]).where(hot.c.id.in_(ids))
+            )
+        ).rowcount
+        deleted = connection.execute(delete(hot).where(hot.c.id.in_(ids))).rowcount
+        if inserted != len(ids) or deleted != len(ids):
+            db.rollback()
+            raise ArchiveIntegrityError(
+                f"Archive batch moved {inserted} rows and deleted {deleted}, expected {len(ids)}"
+            )
+        versioning.reserve_versions(connection, ARCHIVED_ROWS_COUNTER, len(ids))
+        versioning.reserve_versions(connection, versioning.HISTORY_COUNTER, 1)
+        versioning.set_counter(connection, ARCHIVE_CUTOFF_COUNTER, _to_epoch(cutoff))
+        db.commit()
+        moved += len(ids)
+    return {"cutoff": cutoff, "moved": moved}
+
+
+def check_archive_integrity(db: Session) -> dict:
+    """Compare the archive's row count with the number of rows ever moved into it."""
+    archived = versioning.current_version(db, ARCHIVED_ROWS_COUNTER)
+    archive_count = db.query(func.count(models.ChangeHistoryArchive.id)).scalar()
+    return {
+        "cutoff": archive_cutoff(db),
+        "hot_count": db.query(func.count(models.ChangeHistory.id)).scalar(),
+        "archive_count": archive_count,
+        "archived_rows": archived,
+        "consistent": archive_count == archived,
+    }
+
+
+if __name__ == "__main__":
+    # Cron entry point: python -m app.history_archive
+    session = SessionLocal()
+    try:
+        result = archive_cold_history(session)
+        status = check_archive_integrity(session)
+        print(f"Archived {result['moved']} rows older than {result['cutoff']}; consistent={status['consistent']}")
+    finally:
+        session.close()
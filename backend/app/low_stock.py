@@ -0,0 +1,307 @@
+"""
+Incrementally maintained low-stock set.
+
+A product is low on stock when it is not archived and its quantity is at or
+below its reorder threshold: the product's own ``reorder_threshold``, else
+the threshold set for its category, else ``LOW_STOCK_DEFAULT_THRESHOLD``.
+A threshold of 0 turns tracking off for that product.
+
+``low_stock_items`` holds one row per low product. A flush hook re-evaluates
+only the products written in that flush (approvals, edits, imports, archive
+toggles, deletes), so ``GET /api/inventory/low-stock`` reads the set instead
+of scanning products. Products entering or leaving the set are announced
+after commit as one ``stock.low`` event per transaction.
+
+Quantities include pending quantity-ledger deltas (see quantity_ledger.py).
+A ledger write leaves the product row alone, so the approval re-checks the
+product with ``recheck_ledger_write``. It writes the set only when the
+product enters or leaves it, so sales of a low product do not all queue on
+its row, and the listing reads the live quantity rather than the stored one.
+"""
+from __future__ import annotations
+
+import datetime
+import logging
+from typing import Optional
+
+from sqlalchemy import delete, event, func, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models, quantity_ledger
+from .config import settings
+from .database import SessionLocal
+from .events import hub
+
+logger = logging.getLogger(__name__)
+
+# Attributes that can move a product in or out of the set
+_WATCHED = ("quantity", "reorder_threshold", "category", "is_archived")
+
+
+def _watched_changed(product: models.Product) -> bool:
+    state = inspect(product)
+    return any(state.attrs[name].history.has_changes() for name in _WATCHED)
+
+
+def _threshold_expression():
+    """SQL for a product's effective threshold; needs the outer join from ``_scope_select``."""
+    return func.coalesce(
+        models.Product.reorder_threshold,
+        models.CategoryReorderThreshold.threshold,
+        settings.LOW_STOCK_DEFAULT_THRESHOLD,
+    )
+
+
+def _scope_select(category: Optional[str] = None, product_ids: Optional[list[int]] = None):
+    """Products currently low, with their quantity and effective threshold."""
+    product = models.Product
+    quantity = quantity_ledger.available_quantity_column()
+    threshold = _threshold_expression()
+    stmt = select(product.id, quantity, threshold).outerjoin(
+        models.CategoryReorderThreshold,
+        models.CategoryReorderThreshold.category == product.category,
+    ).where(
+        product.is_archived.is_(False),
+        threshold > 0,
+        quantity <= threshold,
+    )
+    if category is not None:
+        stmt = stmt.where(product.category == category)
+    if product_ids is not None:
+        stmt = stmt.where(product.id.in_(product_ids))
+    return stmt
+
+
+def _upsert(connection, rows: list[dict]) -> None:
+    if not rows:
+        return
+    table = models.LowStockItem.__table__
+    dialect_insert = postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+    stmt = dialect_insert(table)
+    # ``since`` keeps the time the product first became low
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.product_id],
+        set_={"quantity": stmt.excluded.quantity, "threshold": stmt.excluded.threshold},
+    )
+    connection.execute(stmt, rows)
+
+
+def _transition(product, quantity: int, threshold: int, low: bool) -> dict:
+    return {
+        "product_id": product.id,
+        "name": product.name,
+        "category": product.category,
+        "quantity": quantity,
+        "threshold": threshold,
+        "low": low,
+    }
+
+
+def _queue(session: Session, transitions: list[dict]) -> None:
+    if transitions:
+        session.info.setdefault("low_stock_transitions", []).extend(transitions)
+
+
+@event.listens_for(Session, "after_flush")
+def _maintain_low_stock(session: Session, flush_context) -> None:
+    # After the flush new products have IDs; new/dirty/deleted still describe this flush
+    written = [
+        obj for obj in list(session.new) + list(session.dirty)
+        if isinstance(obj, models.Product) and (obj in session.new or _watched_changed(obj))
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, models.Product)]
+    if not (written or deleted):
+        return
+
+    connection = session.connection()
+    table = models.LowStockItem.__table__
+    ids = [obj.id for obj in written + deleted]
+    was_low = set(connection.execute(select(table.c.product_id).where(table.c.product_id.in_(ids))).scalars())
+
+    categories = {obj.category for obj in written if obj.category is not None}
+    category_thresholds = dict(
+        connection.execute(
+            select(models.CategoryReorderThreshold.category, models.CategoryReorderThreshold.threshold)
+            .where(models.CategoryReorderThreshold.category.in_(categories))
+        ).all()
+    ) if categories else {}
+    pending = {}
+    if quantity_ledger.enabled() and written:
+        delta = models.ProductQuantityDelta
+        pending = dict(connection.execute(
+            select(delta.product_id, func.sum(delta.delta))
+            .where(delta.product_id.in_([obj.id for obj in written]))
+            .group_by(delta.product_id)
+        ).all())
+
+    now = datetime.datetime.utcnow()
+    low_rows, cleared, transitions = [], [], []
+    for obj in written:
+        threshold = obj.reorder_threshold
+        if threshold is None:
+            threshold = category_thresholds.get(obj.category, settings.LOW_STOCK_DEFAULT_THRESHOLD)
+        quantity = obj.quantity + pending.get(obj.id, 0)
+        is_low = not obj.is_archived and threshold > 0 and quantity <= threshold
+        if is_low:
+            low_rows.append({"product_id": obj.id, "quantity": quantity, "threshold": threshold, "since": now})
+            if obj.id not in was_low:
+                transitions.append(_transition(obj, quantity, threshold, True))
+        elif obj.id in was_low:
+            cleared.append(obj.id)
+            transitions.append(_transition(obj, quantity, threshold, False))
+    for obj in deleted:
+        if obj.id in was_low:
+            cleared.append(obj.id)
+            transitions.append(_transition(obj, 0, 0, False))
+
+    _upsert(connection, low_rows)
+    if cleared:
+        connection.execute(delete(table).where(table.c.product_id.in_(cleared)))
+    _queue(session, transitions)
+
+
+def recheck_ledger_write(db: Session, product: models.Product) -> None:
+    """
+    Re-evaluate ``product`` after a quantity-ledger write in this transaction.
+    Writes only when it enters or leaves the set.
+    """
+    table = models.LowStockItem.__table__
+    threshold = _threshold_expression()
+    quantity, threshold, was_low = db.execute(
+        select(
+            quantity_ledger.available_quantity_column(),
+            threshold,
+            select(table.c.product_id).where(table.c.product_id == models.Product.id).exists(),
+        ).outerjoin(
+            models.CategoryReorderThreshold,
+            models.CategoryReorderThreshold.category == models.Product.category,
+        ).where(models.Product.id == product.id)
+    ).one()
+    is_low = not product.is_archived and threshold > 0 and quantity <= threshold
+    if is_low == was_low:
+        return
+    connection = db.connection()
+    if is_low:
+        _upsert(connection, [{
+            "product_id": product.id, "quantity": quantity, "threshold": threshold,
+            "since": datetime.datetime.utcnow(),
+        }])
+    else:
+        connection.execute(delete(table).where(table.c.product_id == product.id))
+    _queue(db, [_transition(product, quantity, threshold, is_low)])
+
+
+def publish_transitions(transitions: list[dict]) -> None:
+    try:
+        hub.publish_from_thread({"type": "stock.low", "items": transitions})
+    except RuntimeError:
+        # Not on a request worker thread (startup, cron, shell); nobody to notify
+        logger.debug("Skipped stock.low event outside a worker thread")
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_low_stock(session: Session) -> None:
+    transitions = session.info.pop("low_stock_transitions", None)
+    if transitions:
+        publish_transitions(transitions)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_low_stock(session: Session) -> None:
+    session.info.pop("low_stock_transitions", None)
+
+
+def refresh_low_stock(
+    db: Session, category: Optional[str] = None, product_ids: Optional[list[int]] = None
+) -> list[dict]:
+    """
+    Recompute the set in SQL for one category, the given products (or every
+    product) after a threshold change or a set-based write that bypassed the
+    flush hook. Returns the products that entered or left the set; the caller
+    commits, which publishes them as a single event.
+    """
+    table = models.LowStockItem.__table__
+    product = models.Product
+    connection = db.connection()
+    current = {row.id: row for row in connection.execute(_scope_select(category, product_ids))}
+
+    existing_stmt = select(table.c.product_id)
+    if category is not None:
+        existing_stmt = existing_stmt.join(product.__table__, product.id == table.c.product_id).where(
+            product.category == category
+        )
+    if product_ids is not None:
+        existing_stmt = existing_stmt.where(table.c.product_id.in_(product_ids))
+    existing = set(connection.execute(existing_stmt).scalars())
+
+    now = datetime.datetime.utcnow()
+    _upsert(connection, [
+        {"product_id": row.id, "quantity": row.quantity, "threshold": row[2], "since": now}
+        for row in current.values()
+    ])
+    stale = existing - current.keys()
+    if stale:
+        connection.execute(delete(table).where(table.c.product_id.in_(stale)))
+
+    changed_ids = (current.keys() - existing) | stale
+    if not changed_ids:
+        return []
+    transitions = []
+    threshold = _threshold_expression()
+    for row in connection.execute(
+        select(product.id, product.name, product.category, quantity_ledger.available_quantity_column(), threshold)
+        .outerjoin(models.CategoryReorderThreshold, models.CategoryReorderThreshold.category == product.category)
+        .where(product.id.in_(changed_ids))
+        .order_by(product.id)
+    ):
+        transitions.append(_transition(row, row.quantity, row[4], row.id in current))
+    _queue(db, transitions)
+    return transitions
+
+
+def set_category_threshold(db: Session, category: str, threshold: Optional[int]) -> list[dict]:
+    """Set (or with None, clear) a category's reorder threshold and commit; returns the set changes."""
+    existing = db.get(models.CategoryReorderThreshold, category)
+    if threshold is None:
+        if existing is not None:
+            db.delete(existing)
+    elif existing is None:
+        db.add(models.CategoryReorderThreshold(category=category, threshold=threshold))
+    else:
+        existing.threshold = threshold
+    db.flush()
+    transitions = refresh_low_stock(db, category)
+    db.commit()
+    return transitions
+
+
+def list_low_stock(db: Session, category: Optional[str] = None) -> list[dict]:
+    """Low products, largest shortfall first."""
+    item = models.LowStockItem
+    product = models.Product
+    # Live, since ledger sales of a product already low do not update its row
+    quantity = quantity_ledger.available_quantity_column()
+    query = db.query(
+        product.id.label("product_id"),
+        product.barcode,
+        product.name,
+        product.category,
+        quantity,
+        item.threshold,
+        item.since,
+    ).join(product, product.id == item.product_id)
+    if category is not None:
+        query = query.filter(product.category == category)
+    rows = query.order_by((quantity - item.threshold).asc(), product.id).all()
+    return [row._asdict() for row in rows]
+
+
+def ensure_low_stock() -> None:
+    """Reconcile the set on startup, e.g. after the migration or a change to the default threshold."""
+    db = SessionLocal()
+    try:
+        refresh_low_stock(db)
+        db.commit()
+    finally:
+        db.close()
@@ -1,12 +1,19 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from .database import engine, Base
 from . import models, auth
-from .routers import users, inventory, products, history
+from .routers import users, inventory, products, history, reports, stocktakes, dashboard
 from .routers import realtime
 from .config import settings
 from .migrations_runner import run_database_migrations
 from .master_account import ensure_master_account
+from .category_registry import ensure_category_registry
+from .search import ensure_search_index
+from .sales_rollup import ensure_sales_rollup
+from .low_stock import ensure_low_stock
+from .quantity_ledger import ensure_ledger_folded, start_ledger_compactor, stop_ledger_compactor
+from .stock_snapshots import ensure_inventory_snapshot, start_snapshot_scheduler, stop_snapshot_scheduler
 
 # In dev with SQLite, auto-create tables for convenience. In production,
 # use proper migrations (e.g., Alembic) and a managed database.
@@ -24,6 +31,7 @@ app = FastAPI(
     openapi_url=openapi_url,
     docs_url=docs_url,
     redoc_url=redoc_url,
+    default_response_class=ORJSONResponse,
 )
 
 # CORS Middleware Configuration
@@ -46,6 +54,9 @@ app.add_middleware(
 app.include_router(inventory.router)
 app.include_router(products.router)
 app.include_router(history.router)
+app.include_router(reports.router)
+app.include_router(stocktakes.router)
+app.include_router(dashboard.router)
 # Users router handles user endpoints (including /api/token and /api/users/*)
 app.include_router(users.router, prefix="/api", tags=["Users"])
 app.include_router(realtime.router)
@@ -78,3 +89,17 @@ def validate_settings_on_startup():
 
     run_database_migrations()
     ensure_master_account()
+    ensure_category_registry()
+    ensure_search_index()
+    ensure_sales_rollup()
+    ensure_ledger_folded()
+    ensure_low_stock()
+    ensure_inventory_snapshot()
+    start_snapshot_scheduler()
+    start_ledger_compactor()
+
+
+@app.on_event("shutdown")
+def stop_background_jobs():
+    stop_snapshot_scheduler()
+    stop_ledger_compactor()
@@ -1,15 +1,19 @@
 import enum
 from sqlalchemy import (
+    BigInteger,
     Column,
     Integer,
     String,
     Float,
     DateTime,
+    Date,
     Boolean,
     ForeignKey,
     Enum,
+    Index,
+    select,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import column_property, relationship
 from sqlalchemy.sql import func
 from .database import Base
 from .config import settings
@@ -49,10 +53,197 @@ class Product(Base):
     quantity = Column(Integer, nullable=False)
     category = Column(String, index=True)
     is_archived = Column(Boolean, default=False, nullable=False)
+    # Bumped from the "products" sync counter on every write (see versioning.py)
+    row_version = Column(Integer, default=0, nullable=False, index=True)
+    updated_at = Column(
+        DateTime,
+        default=datetime.datetime.utcnow,
+        onupdate=datetime.datetime.utcnow,
+        nullable=False,
+    )
+    # Low stock at or below this; when unset the category threshold applies (see low_stock.py)
+    reorder_threshold = Column(Integer, nullable=True)
 
     change_requests = relationship("ChangeRequest", back_populates="product")
     history_entries = relationship("ChangeHistory", back_populates="product")
 
+    @property
+    def available_quantity(self) -> int:
+        """Quantity including ledger deltas not yet folded in (see quantity_ledger.py)."""
+        return self.quantity + (getattr(self, "pending_quantity", None) or 0)
+
+
+class ProductQuantityDelta(Base):
+    """
+    Quantity changes waiting to be folded into products.quantity. Each product
+    has up to QUANTITY_LEDGER_SLOTS rows so concurrent approvals rarely lock
+    the same one.
+    """
+    __tablename__ = "product_quantity_deltas"
+    # Not a foreign key: deletes drop the rows, and the compactor drops those
+    # of ledger sales that raced the delete
+    product_id = Column(Integer, primary_key=True)
+    slot = Column(Integer, primary_key=True)
+    delta = Column(Integer, default=0, nullable=False)
+
+
+if settings.QUANTITY_LEDGER_SLOTS > 0:
+    # Product loads include the pending deltas, so reads see base plus pending
+    Product.pending_quantity = column_property(
+        select(func.coalesce(func.sum(ProductQuantityDelta.delta), 0))
+        .where(ProductQuantityDelta.product_id == Product.id)
+        .correlate_except(ProductQuantityDelta)
+        .scalar_subquery()
+    )
+
+
+class ProductCategory(Base):
+    """Category registry with product counts, maintained by category_registry.py."""
+    __tablename__ = "product_categories"
+    name = Column(String, primary_key=True)
+    product_count = Column(Integer, default=0, nullable=False)
+    active_count = Column(Integer, default=0, nullable=False)
+
+
+class CategoryReorderThreshold(Base):
+    """Reorder threshold shared by products in a category that have none of their own."""
+    __tablename__ = "category_reorder_thresholds"
+    category = Column(String, primary_key=True)
+    threshold = Column(Integer, nullable=False)
+
+
+class LowStockItem(Base):
+    """Products currently below their reorder threshold, maintained by low_stock.py."""
+    __tablename__ = "low_stock_items"
+    # Not a foreign key: the row is removed in the same flush that deletes the product
+    product_id = Column(Integer, primary_key=True)
+    quantity = Column(Integer, nullable=False)
+    threshold = Column(Integer, nullable=False)
+    since = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+
+class ProductTombstone(Base):
+    """Record of a deleted product so delta-sync clients can drop it."""
+    __tablename__ = "product_tombstones"
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, nullable=False, index=True)
+    barcode = Column(String, nullable=False)
+    row_version = Column(Integer, nullable=False, index=True)
+    deleted_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+
+class SyncCounter(Base):
+    """Monotonic per-resource version counters used for delta sync."""
+    __tablename__ = "sync_counters"
+    name = Column(String, primary_key=True)
+    # Wide enough for PostgreSQL transaction ID watermarks
+    value = Column(BigInteger, default=0, nullable=False)
+
+
+class SalesDailyRollup(Base):
+    """Approved sales per product per UTC day, maintained by sales_rollup.py."""
+    __tablename__ = "sales_daily_rollups"
+    day = Column(Date, primary_key=True)
+    # Not a foreign key: the rollup outlives deleted products
+    product_id = Column(Integer, primary_key=True, index=True)
+    # Quantity-ledger sales spread over the product's slots like their deltas;
+    # every other sale uses slot 0. Readers sum over slots.
+    slot = Column(Integer, primary_key=True, default=0)
+    product_name = Column(String, nullable=True)
+    category = Column(String, nullable=True, index=True)
+    units = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0.0, nullable=False)
+    sale_count = Column(Integer, default=0, nullable=False)
+
+
+class StockMovement(Base):
+    """One change to a product's quantity or price, written by stock_snapshots.py on flush."""
+    __tablename__ = "stock_movements"
+    id = Column(Integer, primary_key=True, index=True)
+    # Not a foreign key: movements outlive deleted products
+    product_id = Column(Integer, nullable=False, index=True)
+    quantity_delta = Column(Integer, nullable=False)
+    price = Column(Float, nullable=True)
+    deleted = Column(Boolean, default=False, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False, index=True)
+    # PostgreSQL transaction that wrote the row, so replay can skip exactly what a snapshot saw
+    txid = Column(BigInteger, nullable=True, index=True)
+
+
+class InventorySnapshot(Base):
+    """Periodic copy of every product's quantity and price, the base for as-of queries."""
+    __tablename__ = "inventory_snapshots"
+    id = Column(Integer, primary_key=True, index=True)
+    taken_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False, index=True)
+    # Highest movement ID the snapshot could see; on SQLite every lower ID was visible too
+    last_movement_id = Column(Integer, default=0, nullable=False)
+    # PostgreSQL only: txid_current_snapshot() of the copy and its xmin. Movements
+    # with lower IDs may still have been uncommitted, and these tell them apart
+    visibility = Column(String, nullable=True)
+    visibility_xmin = Column(BigInteger, nullable=True)
+    product_count = Column(Integer, default=0, nullable=False)
+    total_quantity = Column(Integer, default=0, nullable=False)
+    total_value = Column(Float, default=0.0, nullable=False)
+
+
+class InventorySnapshotItem(Base):
+    __tablename__ = "inventory_snapshot_items"
+    snapshot_id = Column(
+        Integer, ForeignKey("inventory_snapshots.id", ondelete="CASCADE"), primary_key=True
+    )
+    product_id = Column(Integer, primary_key=True)
+    quantity = Column(Integer, nullable=False)
+    price = Column(Float, nullable=False)
+
+
+class ReorderSuggestion(Base):
+    """Cached sales velocity and suggested reorder quantity per product, computed by reorder.py."""
+    __tablename__ = "reorder_suggestions"
+    product_id = Column(Integer, primary_key=True)
+    quantity = Column(Integer, nullable=False)
+    # Average units sold per day over the long and the recent window
+    velocity = Column(Float, nullable=False)
+    recent_velocity = Column(Float, nullable=False)
+    # None when the product is not selling
+    days_of_cover = Column(Float, nullable=True)
+    reorder_quantity = Column(Integer, nullable=False, index=True)
+    computed_at = Column(DateTime, nullable=False)
+
+
+class StocktakeStatus(enum.Enum):
+    open = "open"
+    applied = "applied"
+    cancelled = "cancelled"
+
+
+class StocktakeSession(Base):
+    """A physical count of some or all products, reconciled in one go (see stocktake.py)."""
+    __tablename__ = "stocktake_sessions"
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(Enum(StocktakeStatus), default=StocktakeStatus.open, nullable=False, index=True)
+    note = Column(String, nullable=True)
+    created_by_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    applied_by_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    applied_at = Column(DateTime, nullable=True)
+
+    counts = relationship("StocktakeCount", cascade="all, delete-orphan", passive_deletes=True)
+
+
+class StocktakeCount(Base):
+    __tablename__ = "stocktake_counts"
+    session_id = Column(
+        Integer, ForeignKey("stocktake_sessions.id", ondelete="CASCADE"), primary_key=True
+    )
+    # Not a foreign key: a count outlives a product deleted before the session is applied
+    product_id = Column(Integer, primary_key=True)
+    counted_quantity = Column(Integer, nullable=False)
+    # System quantity when the count was recorded; sales after that do not count as variance
+    system_quantity = Column(Integer, nullable=False)
+    variance = Column(Integer, nullable=False)
+    counted_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    applied = Column(Boolean, default=False, nullable=False)
+
 
 class ChangeRequestStatus(enum.Enum):
     pending = "pending"
@@ -122,11 +313,27 @@ class ChangeRequest(Base):
         passive_deletes=True,
     )
 
+class ReviewLease(Base):
+    """A reviewer's time-limited claim on a pending request (see review_queue.py)."""
+    __tablename__ = "review_leases"
+    # Not a foreign key: resolving a request deletes its lease in the same transaction
+    request_id = Column(Integer, primary_key=True)
+    reviewer_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    claimed_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
 class ChangeHistory(Base):
     __tablename__ = "change_history"
+    __table_args__ = (
+        # Receivables: unpaid sales grouped per buyer
+        Index("ix_change_history_payment_buyer", "payment_status", "buyer_name"),
+        # Newest-first listings and keyset cursors, optionally narrowed by action
+        Index("ix_change_history_timestamp_id", "timestamp", "id"),
+        Index("ix_change_history_action_timestamp", "action", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    product_id = Column(Integer, ForeignKey("products.id"), nullable=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=True, index=True)
     quantity_change = Column(Integer, nullable=True) # Now nullable
     action = Column(Enum(ChangeRequestAction), nullable=False)
     status = Column(Enum(ChangeRequestStatus), nullable=False) # approved or rejected
@@ -134,18 +341,31 @@ class ChangeHistory(Base):
         Integer,
         ForeignKey("users.id", ondelete="SET NULL"),
         nullable=True,
+        index=True,
     )
     reviewer_id = Column(
         Integer,
         ForeignKey("users.id", ondelete="SET NULL"),
         nullable=True,
+        index=True,
     )
     timestamp = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
 
     # Fields to store details from the original request
-    buyer_name = Column(String, nullable=True)
+    buyer_name = Column(String, nullable=True, index=True)
     payment_status = Column(Enum(PaymentStatus), nullable=True)
 
+    # Snapshot taken when the row is written, so listings, exports and reports
+    # need no joins and keep the price and names in effect at the time. Rows
+    # older than the 20261019_history_snapshots migration were backfilled from
+    # the product and users as they were then, so their price and names may be
+    # later than the sale; rows of products deleted before it have no snapshot.
+    unit_price = Column(Float, nullable=True)
+    product_name = Column(String, nullable=True)
+    barcode = Column(String, nullable=True, index=True)
+    requester_username = Column(String, nullable=True)
+    reviewer_username = Column(String, nullable=True)
+
     product = relationship("Product", back_populates="history_entries")
     requester = relationship(
         "User",
@@ -157,3 +377,41 @@ class ChangeHistory(Base):
         foreign_keys=[reviewer_id],
         passive_deletes=True,
     )
+
+
+class ChangeHistoryArchive(Base):
+    """
+    Cold change history moved out of ``change_history`` by history_archive.py.
+    Same columns and IDs; no foreign keys so the archive never blocks deletes.
+    """
+    __tablename__ = "change_history_archive"
+    __table_args__ = (
+        Index("ix_change_history_archive_timestamp_id", "timestamp", "id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, nullable=True, index=True)
+    quantity_change = Column(Integer, nullable=True)
+    action = Column(Enum(ChangeRequestAction), nullable=False)
+    status = Column(Enum(ChangeRequestStatus), nullable=False)
+    requester_id = Column(Integer, nullable=True)
+    reviewer_id = Column(Integer, nullable=True)
+    timestamp = Column(DateTime, nullable=False)
+    buyer_name = Column(String, nullable=True)
+    payment_status = Column(Enum(PaymentStatus), nullable=True)
+    unit_price = Column(Float, nullable=True)
+    product_name = Column(String, nullable=True)
+    barcode = Column(String, nullable=True)
+    requester_username = Column(String, nullable=True)
+    reviewer_username = Column(String, nullable=True)
+
+    # Read-only links so archived rows serialize like live ones
+    product = relationship(
+        "Product", primaryjoin="foreign(ChangeHistoryArchive.product_id) == Product.id", viewonly=True
+    )
+    requester = relationship(
+        "User", primaryjoin="foreign(ChangeHistoryArchive.requester_id) == User.id", viewonly=True
+    )
+    reviewer = relationship(
+        "User", primaryjoin="foreign(ChangeHistoryArchive.reviewer_id) == User.id", viewonly=True
+    )
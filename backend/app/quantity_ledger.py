@@ -0,0 +1,311 @@
+"""
+Optional quantity-delta ledger for hot products.
+
+Normally every approved sale updates the product's ``quantity``, so sales of
+one best-selling product serialize on that row. With
+``QUANTITY_LEDGER_SLOTS > 0`` approved adds and sales instead upsert a signed
+delta into one of N ``product_quantity_deltas`` rows for the product, chosen
+at random, so concurrent approvals rarely wait on each other.
+
+- Reads: product loads add the pending deltas (``Product.pending_quantity``),
+  so API responses show base plus pending.
+- Compaction: a background thread in each worker folds the deltas into
+  ``products.quantity`` every ``QUANTITY_LEDGER_COMPACT_SECONDS``.
+- Stock movements: the approval logs a ledger write's movement right away,
+  so as-of replay and snapshots see base plus pending. Folds and discards
+  note the pending amount they took out of the ledger, and the flush hook
+  in stock_snapshots.py logs only the net change of the product.
+- Low stock: a ledger write re-checks its product against the low-stock set
+  and writes the set only when the product enters or leaves it (see
+  low_stock.py). The fold re-checks again, which settles concurrent sales
+  that could not see each other's slots.
+- Versions: a ledger write does not touch the ``products`` row. At commit
+  it bumps the ``products.ledger.<slot>`` counter of its slot, so ETags
+  change right away. Delta sync re-sends products that have pending deltas,
+  and other workers' barcode caches drop them when the ledger counters
+  move. The fold then stamps a new row version, as for any product write.
+- Safety stock: a sale first takes its slot row, then checks base plus all
+  pending deltas against ``QUANTITY_LEDGER_SAFETY_STOCK``. The check cannot
+  see sales still in flight on the other slots, at most one per slot, so
+  only sales of up to ``QUANTITY_LEDGER_SAFETY_STOCK // (SLOTS - 1)`` units
+  use the ledger. Together those in-flight sales take at most the safety
+  stock, so stock never goes below zero. Larger sales, and sales the check
+  rejects, lock every slot and the product row, fold the deltas and update
+  the row, so the "not enough stock" check stays exact near zero.
+- Sales rollup: ledger sales add to the ``sales_daily_rollups`` row of the
+  slot they used, so the rollup is not a per-product hotspot either.
+- Absolute writes: edits and imports that set a quantity outright discard
+  the product's pending deltas, since the new value replaces them.
+- Deletes: single and bulk deletes drop the product's deltas and log them
+  as part of the delete's stock movement (stock_snapshots.py).
+"""
+from __future__ import annotations
+
+import logging
+import random
+import threading
+from typing import Optional
+
+from sqlalchemy import delete, func, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models, versioning
+from .barcode_cache import invalidate_on_commit
+from .config import settings
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Products folded per compaction transaction
+_COMPACT_BATCH = 200
+
+
+def enabled() -> bool:
+    return settings.QUANTITY_LEDGER_SLOTS > 0
+
+
+def _dialect_insert(connection):
+    return postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+
+
+def record_delta(connection, product_id: int, delta: int, slot: Optional[int] = None) -> int:
+    """
+    Add ``delta`` to a slot of ``product_id``, random unless given; locks only
+    that slot row. Returns the slot.
+    """
+    table = models.ProductQuantityDelta.__table__
+    if slot is None:
+        slot = random.randrange(settings.QUANTITY_LEDGER_SLOTS)
+    stmt = _dialect_insert(connection)(table).values(product_id=product_id, slot=slot, delta=delta)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.product_id, table.c.slot],
+        set_={"delta": table.c.delta + stmt.excluded.delta},
+    )
+    connection.execute(stmt)
+    return slot
+
+
+def ledger_sale_limit() -> int:
+    """Largest sale that may go through the ledger (see the module docstring)."""
+    return max(settings.QUANTITY_LEDGER_SAFETY_STOCK, 0) // max(settings.QUANTITY_LEDGER_SLOTS - 1, 1)
+
+
+def available_quantity_column():
+    """``products.quantity`` for column queries, plus pending deltas in ledger mode."""
+    if not enabled():
+        return models.Product.quantity
+    return (models.Product.quantity + models.Product.pending_quantity).label("quantity")
+
+
+def pending_quantity(db: Session, product_id: int) -> int:
+    delta = models.ProductQuantityDelta
+    return db.query(func.coalesce(func.sum(delta.delta), 0)).filter(delta.product_id == product_id).scalar()
+
+
+def _note_taken(db: Session, pending: dict[int, int]) -> None:
+    taken = db.info.setdefault("ledger_taken", {})
+    for product_id, value in pending.items():
+        taken[product_id] = taken.get(product_id, 0) + value
+
+
+def pop_taken(session: Session, product_id: int) -> int:
+    """
+    Pending deltas folded or discarded for ``product_id`` in this transaction
+    since its last flush; the flush logs the product's change net of them.
+    """
+    return session.info.get("ledger_taken", {}).pop(product_id, 0)
+
+
+def take_pending(connection, product_ids: list[int]) -> dict[int, int]:
+    """
+    Delete the pending deltas of products about to be deleted and return
+    their sums per product, so the delete's stock movement includes them.
+    """
+    if not enabled():
+        return {}
+    table = models.ProductQuantityDelta.__table__
+    pending: dict[int, int] = {}
+    for product_id, value in connection.execute(
+        delete(table).where(table.c.product_id.in_(product_ids)).returning(table.c.product_id, table.c.delta)
+    ):
+        pending[product_id] = pending.get(product_id, 0) + value
+    return pending
+
+
+def _lock_all_slots(db: Session, product_ids: list[int]) -> None:
+    # Locking only the existing rows would miss a slot a concurrent sale is inserting
+    connection = db.connection()
+    table = models.ProductQuantityDelta.__table__
+    connection.execute(
+        _dialect_insert(connection)(table).on_conflict_do_nothing(index_elements=[table.c.product_id, table.c.slot]),
+        [
+            {"product_id": product_id, "slot": slot, "delta": 0}
+            for product_id in product_ids
+            for slot in range(settings.QUANTITY_LEDGER_SLOTS)
+        ],
+    )
+
+
+def fold_pending(db: Session, product_ids: list[int], exclusive: bool = False) -> int:
+    """
+    Move the pending deltas of ``product_ids`` into their products' quantity
+    in the caller's transaction. Returns the number of products changed.
+    With ``exclusive`` every slot stays locked until commit, so no ledger
+    write for these products can run alongside.
+    """
+    delta = models.ProductQuantityDelta
+    if exclusive and enabled():
+        _lock_all_slots(db, product_ids)
+    # Slots first, then products: the same order as approvals that fall back to the row
+    rows = db.query(delta.product_id, delta.slot, delta.delta).filter(
+        delta.product_id.in_(product_ids)
+    ).with_for_update().all()
+    if not rows:
+        return 0
+    pending: dict[int, int] = {}
+    for product_id, _, value in rows:
+        pending[product_id] = pending.get(product_id, 0) + value
+
+    products = db.query(models.Product).filter(
+        models.Product.id.in_(list(pending))
+    ).with_for_update().populate_existing().all()
+    # Only the rows read above; slots created since then wait for the next fold.
+    # Deleted before the products change, so flush hooks never count them twice
+    table = delta.__table__
+    db.execute(delete(table).where(
+        tuple_(table.c.product_id, table.c.slot).in_([(product_id, slot) for product_id, slot, _ in rows])
+    ))
+    for product in products:
+        product.quantity += pending[product.id]
+    _note_taken(db, {product.id: pending[product.id] for product in products})
+    return len(products)
+
+
+def discard_pending(db: Session, product_id: int) -> None:
+    """Drop pending deltas before ``product_id``'s quantity is set outright."""
+    _note_taken(db, take_pending(db.connection(), [product_id]))
+
+
+def _lock_product(db: Session, product: models.Product) -> None:
+    """Lock ``product``'s row and reload its quantity, so the check and update cannot interleave."""
+    connection = db.connection()
+    if connection.dialect.name != "postgresql":
+        # SQLite ignores FOR UPDATE; a write first takes the database lock before the read
+        table = models.Product.__table__
+        connection.execute(
+            update(table).where(table.c.id == product.id)
+            .values(quantity=table.c.quantity, updated_at=table.c.updated_at)
+        )
+    db.refresh(product, ["quantity"], with_for_update=True)
+
+
+def adjust_quantity(db: Session, product: models.Product, delta: int) -> Optional[int]:
+    """
+    Change ``product``'s quantity by ``delta`` for an approval, through the
+    ledger when enabled and the sale is small enough not to run the product
+    out. Returns the ledger slot written, or None when the row was updated.
+    Raises ValueError when a sale exceeds the stock.
+    """
+    if enabled():
+        if delta >= 0 or -delta <= ledger_sale_limit():
+            connection = db.connection()
+            slot = record_delta(connection, product.id, delta)
+            # Read after taking the slot: every sale committed before it is counted
+            available = db.query(available_quantity_column()).filter(models.Product.id == product.id).scalar()
+            if delta >= 0 or available >= max(settings.QUANTITY_LEDGER_SAFETY_STOCK, 0):
+                # Reload so events built from this product include the new delta
+                db.expire(product, ["pending_quantity"])
+                # A slot counter, not the product row or the products counter
+                versioning.record_ledger_write(db, slot)
+                invalidate_on_commit(db, [product.barcode])
+                return slot
+            record_delta(connection, product.id, -delta, slot=slot)
+        # Also locks the product row, whose quantity now includes the folded deltas
+        fold_pending(db, [product.id], exclusive=True)
+    else:
+        _lock_product(db, product)
+    if delta < 0 and product.quantity < -delta:
+        raise ValueError("Not enough stock to sell.")
+    product.quantity += delta
+    return None
+
+
+def compact(db: Session) -> int:
+    """Fold every pending delta, one batch of products per transaction; returns products folded."""
+    delta = models.ProductQuantityDelta
+    folded = 0
+    last_id = None
+    while True:
+        query = db.query(delta.product_id).distinct().order_by(delta.product_id)
+        if last_id is not None:
+            # One pass; deltas arriving behind the cursor wait for the next run
+            query = query.filter(delta.product_id > last_id)
+        product_ids = [product_id for (product_id,) in query.limit(_COMPACT_BATCH)]
+        if not product_ids:
+            return folded
+        last_id = product_ids[-1]
+        changed = fold_pending(db, product_ids)
+        # Deltas of deleted products have nothing to fold into
+        db.query(delta).filter(
+            delta.product_id.in_(product_ids),
+            ~delta.product_id.in_(db.query(models.Product.id).filter(models.Product.id.in_(product_ids))),
+        ).delete(synchronize_session=False)
+        db.commit()
+        folded += changed
+        if len(product_ids) < _COMPACT_BATCH:
+            return folded
+
+
+def run_compaction() -> None:
+    db = SessionLocal()
+    try:
+        compact(db)
+    finally:
+        db.close()
+
+
+def ensure_ledger_folded() -> None:
+    """Fold deltas left from a previous run on startup, also when ledger mode has been turned off."""
+    db = SessionLocal()
+    try:
+        if db.query(models.ProductQuantityDelta.product_id).first() is not None:
+            compact(db)
+    finally:
+        db.close()
+
+
+_stop = threading.Event()
+
+
+def _compactor_loop(interval_seconds: float) -> None:
+    while not _stop.wait(interval_seconds):
+        try:
+            run_compaction()
+        except Exception:
+            logger.exception("Quantity ledger compaction failed")
+
+
+def start_ledger_compactor() -> None:
+    if not enabled():
+        return
+    _stop.clear()
+    threading.Thread(
+        target=_compactor_loop,
+        args=(max(settings.QUANTITY_LEDGER_COMPACT_SECONDS, 0.1),),
+        name="quantity-ledger-compactor",
+        daemon=True,
+    ).start()
+
+
+def stop_ledger_compactor() -> None:
+    _stop.set()
+
+
+if __name__ == "__main__":
+    # Manual fold, e.g. before turning ledger mode off: python -m app.quantity_ledger
+    session = SessionLocal()
+    try:
+        print(f"Folded pending deltas into {compact(session)} products")
+    finally:
+        session.close()
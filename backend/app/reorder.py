@@ -0,0 +1,264 @@
+"""
+Reorder suggestions from sales velocity.
+
+The batch job loads approved sales per product per UTC day from
+``sales_daily_rollups``, which is kept in step with change history on every
+approval. It loads them as NumPy arrays and scatters them into a
+products x days matrix, then derives for every product at once:
+
+- ``velocity``: average units sold per day over ``REORDER_VELOCITY_WINDOW_DAYS``
+- ``recent_velocity``: the same over the last ``REORDER_RECENT_WINDOW_DAYS``
+- ``days_of_cover``: quantity on hand divided by the higher of the two
+- ``reorder_quantity``: enough stock for ``REORDER_LEAD_TIME_DAYS`` +
+  ``REORDER_COVER_DAYS`` of demand at that rate, less the quantity on hand
+
+Results are cached in ``reorder_suggestions``. A refresh recomputes only two
+kinds of product:
+
+- products whose stock moved since the last run (sales, restocks, edits and
+  imports all log a stock movement)
+- products whose older sales have slid out of a window since then
+
+The first run, a change of settings, or ``full=True`` recomputes everything.
+
+Which movements are new since the last run:
+
+- SQLite: writers hold the database lock from their first write to commit,
+  so movements committed after a run always have higher IDs than the highest
+  ID that run saw, and that ID is the watermark.
+- PostgreSQL: IDs come from a sequence before commit, so a slow transaction
+  can commit a lower ID after the run. Each movement records its transaction
+  ID, and the run records the xmin of its visibility before reading stock:
+  every older transaction had finished, so its changes were read. The next
+  run rereads movements from that transaction ID on.
+
+Run it from cron with ``python -m app.reorder`` or via
+``POST /api/inventory/reorder-suggestions/refresh``.
+"""
+from __future__ import annotations
+
+import datetime
+import zlib
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import delete, func, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models, quantity_ledger, versioning
+from .config import settings
+from .database import SessionLocal
+
+# Watermarks in sync_counters
+LAST_MOVEMENT_COUNTER = "reorder_last_movement"
+LAST_TXID_COUNTER = "reorder_last_txid"
+LAST_RUN_DAY_COUNTER = "reorder_last_run_day"
+PARAMETERS_COUNTER = "reorder_parameters"
+
+# IN-list size when loading a subset of products
+_CHUNK_SIZE = 500
+
+
+def _parameters() -> tuple[int, int, int, int]:
+    window = max(settings.REORDER_VELOCITY_WINDOW_DAYS, 1)
+    recent = min(max(settings.REORDER_RECENT_WINDOW_DAYS, 1), window)
+    return window, recent, settings.REORDER_LEAD_TIME_DAYS, settings.REORDER_COVER_DAYS
+
+
+def _parameters_key(parameters: tuple) -> int:
+    # Fits a 32-bit signed counter
+    return zlib.crc32(repr(parameters).encode()) & 0x7FFFFFFF
+
+
+def _rows_for(query, column, product_ids: Optional[list[int]]) -> list:
+    if product_ids is None:
+        return query.all()
+    rows = []
+    for start in range(0, len(product_ids), _CHUNK_SIZE):
+        rows.extend(query.filter(column.in_(product_ids[start:start + _CHUNK_SIZE])).all())
+    return rows
+
+
+def _stale_product_ids(db: Session, new_movements, last_run: datetime.date, today: datetime.date) -> list[int]:
+    """Products whose suggestion may have changed since the run on ``last_run``."""
+    movement = models.StockMovement
+    ids = {product_id for (product_id,) in db.query(movement.product_id).filter(new_movements).distinct()}
+    if last_run < today:
+        rollup = models.SalesDailyRollup
+        for window in _parameters()[:2]:
+            # Days counted in the last run's window but not in today's
+            dropped_from = last_run - datetime.timedelta(days=window - 1)
+            dropped_to = today - datetime.timedelta(days=window)
+            ids.update(
+                product_id for (product_id,) in
+                db.query(rollup.product_id).filter(rollup.day >= dropped_from, rollup.day <= dropped_to).distinct()
+            )
+    return sorted(ids)
+
+
+def compute_suggestions(
+    db: Session, today: datetime.date, product_ids: Optional[list[int]] = None
+) -> list[dict]:
+    """Suggestion rows for ``product_ids`` (every product when None), computed column-wise."""
+    window, recent, lead_time, cover = _parameters()
+    product = models.Product
+    rollup = models.SalesDailyRollup
+    start = today - datetime.timedelta(days=window - 1)
+
+    stock = _rows_for(db.query(product.id, quantity_ledger.available_quantity_column()), product.id, product_ids)
+    if not stock:
+        return []
+    sales = _rows_for(
+        db.query(rollup.product_id, rollup.day, rollup.units).filter(rollup.day >= start, rollup.day <= today),
+        rollup.product_id,
+        product_ids,
+    )
+
+    ids = np.fromiter((row[0] for row in stock), dtype=np.int64, count=len(stock))
+    quantity = np.fromiter((row[1] for row in stock), dtype=np.int64, count=len(stock))
+    order = np.argsort(ids)
+    ids, quantity = ids[order], quantity[order]
+
+    # Units sold per product (row) per day of the window (column)
+    sold = np.zeros((len(ids), window))
+    if sales:
+        sale_ids = np.fromiter((row[0] for row in sales), dtype=np.int64, count=len(sales))
+        offsets = np.fromiter((row[1].toordinal() for row in sales), dtype=np.int64, count=len(sales))
+        offsets -= start.toordinal()
+        units = np.fromiter((row[2] for row in sales), dtype=np.float64, count=len(sales))
+        position = np.searchsorted(ids, sale_ids)
+        # Drop sales of products that no longer exist
+        known = (position < len(ids)) & (ids[np.minimum(position, len(ids) - 1)] == sale_ids)
+        np.add.at(sold, (position[known], offsets[known]), units[known])
+
+    velocity = sold.sum(axis=1) / window
+    recent_velocity = sold[:, window - recent:].sum(axis=1) / recent
+    demand = np.maximum(velocity, recent_velocity)
+    selling = demand > 0
+    days_of_cover = np.divide(quantity, demand, out=np.full(len(ids), np.nan), where=selling)
+    # Rounded first so 1/7 * 7 does not ceil to 2
+    target = np.ceil(np.round(demand * (lead_time + cover), 6))
+    reorder_quantity = np.maximum(target - quantity, 0).astype(np.int64)
+
+    computed_at = datetime.datetime.utcnow()
+    return [
+        {
+            "product_id": product_id,
+            "quantity": qty,
+            "velocity": vel,
+            "recent_velocity": recent_vel,
+            "days_of_cover": None if np.isnan(days) else days,
+            "reorder_quantity": reorder,
+            "computed_at": computed_at,
+        }
+        for product_id, qty, vel, recent_vel, days, reorder in zip(
+            ids.tolist(),
+            quantity.tolist(),
+            velocity.tolist(),
+            recent_velocity.tolist(),
+            days_of_cover.tolist(),
+            reorder_quantity.tolist(),
+        )
+    ]
+
+
+def _upsert(connection, rows: list[dict]) -> None:
+    if not rows:
+        return
+    table = models.ReorderSuggestion.__table__
+    dialect_insert = postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+    stmt = dialect_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.product_id],
+        set_={name: stmt.excluded[name] for name in rows[0] if name != "product_id"},
+    )
+    connection.execute(stmt, rows)
+
+
+def refresh_reorder_suggestions(db: Session, full: bool = False) -> dict:
+    """Recompute stale suggestions (or all of them) and commit."""
+    today = datetime.datetime.utcnow().date()
+    key = _parameters_key(_parameters())
+    postgresql_db = db.connection().dialect.name == "postgresql"
+    counters = versioning.current_versions(
+        db, [LAST_MOVEMENT_COUNTER, LAST_TXID_COUNTER, LAST_RUN_DAY_COUNTER, PARAMETERS_COUNTER]
+    )
+    full = full or counters[LAST_RUN_DAY_COUNTER] == 0 or counters[PARAMETERS_COUNTER] != key
+    # Runs from before the transaction ID watermark existed
+    full = full or (postgresql_db and counters[LAST_TXID_COUNTER] == 0)
+
+    # Taken before reading stock so later movements are picked up next time
+    movement = models.StockMovement
+    last_movement = db.query(func.coalesce(func.max(movement.id), 0)).scalar()
+    last_txid = db.execute(text("SELECT txid_snapshot_xmin(txid_current_snapshot())")).scalar() if postgresql_db else 0
+    if full:
+        product_ids = None
+    else:
+        last_run = datetime.date.fromordinal(counters[LAST_RUN_DAY_COUNTER])
+        if postgresql_db:
+            new_movements = movement.txid >= counters[LAST_TXID_COUNTER]
+        else:
+            new_movements = movement.id > counters[LAST_MOVEMENT_COUNTER]
+        product_ids = _stale_product_ids(db, new_movements, last_run, today)
+
+    rows = compute_suggestions(db, today, product_ids) if product_ids != [] else []
+    table = models.ReorderSuggestion.__table__
+    connection = db.connection()
+    if full:
+        connection.execute(delete(table))
+    elif product_ids:
+        # Products that were deleted since the last run
+        found = {row["product_id"] for row in rows}
+        gone = [product_id for product_id in product_ids if product_id not in found]
+        for start in range(0, len(gone), _CHUNK_SIZE):
+            connection.execute(delete(table).where(table.c.product_id.in_(gone[start:start + _CHUNK_SIZE])))
+    _upsert(connection, rows)
+
+    versioning.set_counter(connection, LAST_MOVEMENT_COUNTER, last_movement)
+    if postgresql_db:
+        versioning.set_counter(connection, LAST_TXID_COUNTER, last_txid)
+    versioning.set_counter(connection, LAST_RUN_DAY_COUNTER, today.toordinal())
+    versioning.set_counter(connection, PARAMETERS_COUNTER, key)
+    db.commit()
+    return {"full": full, "recomputed": len(rows), "as_of": today}
+
+
+def list_suggestions(db: Session, include_all: bool = False, category: Optional[str] = None) -> list[dict]:
+    """Cached suggestions for active products, most urgent first."""
+    suggestion = models.ReorderSuggestion
+    product = models.Product
+    query = db.query(
+        suggestion.product_id,
+        product.barcode,
+        product.name,
+        product.category,
+        suggestion.quantity,
+        suggestion.velocity,
+        suggestion.recent_velocity,
+        suggestion.days_of_cover,
+        suggestion.reorder_quantity,
+        suggestion.computed_at,
+    ).join(product, product.id == suggestion.product_id).filter(product.is_archived.is_(False))
+    if not include_all:
+        query = query.filter(suggestion.reorder_quantity > 0)
+    if category is not None:
+        query = query.filter(product.category == category)
+    # Products that never sold have no cover figure and go last
+    rows = query.order_by(
+        suggestion.days_of_cover.is_(None),
+        suggestion.days_of_cover,
+        suggestion.reorder_quantity.desc(),
+        suggestion.product_id,
+    ).all()
+    return [row._asdict() for row in rows]
+
+
+if __name__ == "__main__":
+    # Cron entry point: python -m app.reorder
+    session = SessionLocal()
+    try:
+        result = refresh_reorder_suggestions(session)
+        print(f"Recomputed {result['recomputed']} reorder suggestions (full={result['full']})")
+    finally:
+        session.close()
@@ -0,0 +1,215 @@
+"""
+Sales analytics computed in SQL.
+
+Time, product and category groupings aggregate the ``sales_daily_rollups``
+table (see sales_rollup.py), which is a few rows per product per day.
+Seller and buyer groupings are not part of the rollup key and aggregate the
+approved sell rows in ``change_history`` directly (plus the archive when the
+date range reaches into it), using the price and usernames recorded on each
+row. Either way the database does the ``GROUP BY``; Python only shapes the
+result.
+
+The receivables ledger sums approved, unpaid sales per buyer into ageing
+buckets with conditional aggregates over the (payment_status, buyer_name)
+index. Ages are whole UTC days, so the buckets only move when history does
+or the day changes.
+"""
+import datetime
+from typing import Optional
+
+from sqlalchemy import Date, case, cast, func, select, union_all
+from sqlalchemy.orm import Session
+
+from . import history_archive, models
+
+GROUP_DAY = "day"
+GROUP_WEEK = "week"
+GROUP_MONTH = "month"
+GROUP_PRODUCT = "product"
+GROUP_CATEGORY = "category"
+GROUP_SELLER = "seller"
+GROUP_BUYER = "buyer"
+
+TIME_GROUPINGS = (GROUP_DAY, GROUP_WEEK, GROUP_MONTH)
+ROLLUP_GROUPINGS = TIME_GROUPINGS + (GROUP_PRODUCT, GROUP_CATEGORY)
+SALES_GROUPINGS = ROLLUP_GROUPINGS + (GROUP_SELLER, GROUP_BUYER)
+
+
+def _period(dialect: str, group_by: str, day_column):
+    """SQL expression truncating a date column to the start of its day/week/month."""
+    if group_by == GROUP_DAY:
+        return day_column
+    if dialect == "postgresql":
+        return cast(func.date_trunc(group_by, day_column), Date)
+    if group_by == GROUP_WEEK:
+        # Monday-based weeks, matching PostgreSQL's date_trunc('week')
+        return func.date(day_column, "weekday 0", "-6 days")
+    return func.strftime("%Y-%m-01", day_column)
+
+
+def _rollup_rows(db: Session, group_by: str, start, end):
+    rollup = models.SalesDailyRollup
+    aggregates = (
+        func.sum(rollup.units),
+        func.sum(rollup.revenue),
+        func.sum(rollup.sale_count),
+    )
+    if group_by in TIME_GROUPINGS:
+        period = _period(db.get_bind().dialect.name, group_by, rollup.day)
+        stmt = select(period, period, *aggregates).group_by(period).order_by(period)
+    elif group_by == GROUP_PRODUCT:
+        stmt = select(
+            rollup.product_id, func.max(rollup.product_name), *aggregates
+        ).group_by(rollup.product_id).order_by(func.sum(rollup.revenue).desc())
+    else:
+        stmt = select(
+            rollup.category, rollup.category, *aggregates
+        ).group_by(rollup.category).order_by(func.sum(rollup.revenue).desc())
+
+    if start:
+        stmt = stmt.where(rollup.day >= start)
+    if end:
+        stmt = stmt.where(rollup.day <= end)
+    return db.execute(stmt).all()
+
+
+def _sales_select(table, start, end):
+    stmt = select(
+        table.id,
+        table.requester_id,
+        table.requester_username,
+        table.buyer_name,
+        table.quantity_change,
+        table.unit_price,
+    ).where(
+        table.action == models.ChangeRequestAction.sell,
+        table.status == models.ChangeRequestStatus.approved,
+    )
+    if start:
+        stmt = stmt.where(table.timestamp >= datetime.datetime.combine(start, datetime.time.min))
+    if end:
+        next_day = end + datetime.timedelta(days=1)
+        stmt = stmt.where(table.timestamp < datetime.datetime.combine(next_day, datetime.time.min))
+    return stmt
+
+
+def _history_rows(db: Session, group_by: str, start, end):
+    # Snapshot columns mean no product or user joins
+    source = _sales_select(models.ChangeHistory, start, end)
+    cutoff = history_archive.archive_cutoff(db)
+    start_at = datetime.datetime.combine(start, datetime.time.min) if start else None
+    if history_archive.reaches_archive(cutoff, start_at):
+        source = union_all(source, _sales_select(models.ChangeHistoryArchive, start, end))
+    sales = source.subquery()
+
+    units = func.abs(sales.c.quantity_change)
+    revenue = func.sum(units * func.coalesce(sales.c.unit_price, 0.0))
+    aggregates = (func.sum(units), revenue, func.count(sales.c.id))
+    if group_by == GROUP_SELLER:
+        stmt = select(
+            sales.c.requester_id, func.max(sales.c.requester_username), *aggregates
+        ).group_by(sales.c.requester_id)
+    else:
+        stmt = select(sales.c.buyer_name, sales.c.buyer_name, *aggregates).group_by(sales.c.buyer_name)
+    return db.execute(stmt.order_by(revenue.desc())).all()
+
+
+def sales_report(
+    db: Session,
+    group_by: str = GROUP_DAY,
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+) -> dict:
+    """Units, revenue and sale count per group for approved sales between ``start`` and ``end`` (inclusive, UTC days)."""
+    if group_by in ROLLUP_GROUPINGS:
+        rows = _rollup_rows(db, group_by, start, end)
+    else:
+        rows = _history_rows(db, group_by, start, end)
+
+    items = []
+    for key, label, units, revenue, sale_count in rows:
+        items.append({
+            "key": None if key is None else str(key),
+            "label": None if label is None else str(label),
+            "units": int(units or 0),
+            "revenue": float(revenue or 0.0),
+            "sale_count": int(sale_count or 0),
+        })
+    return {
+        "group_by": group_by,
+        "start": start,
+        "end": end,
+        "rows": items,
+        "total_units": sum(item["units"] for item in items),
+        "total_revenue": sum(item["revenue"] for item in items),
+        "total_sales": sum(item["sale_count"] for item in items),
+    }
+
+
+def receivable_filters() -> list:
+    """Approved sales still awaiting payment."""
+    return [
+        models.ChangeHistory.payment_status == models.PaymentStatus.unpaid,
+        models.ChangeHistory.action == models.ChangeRequestAction.sell,
+        models.ChangeHistory.status == models.ChangeRequestStatus.approved,
+    ]
+
+
+def sale_amount():
+    """SQL expression for a sale's value at the price recorded on the row."""
+    history = models.ChangeHistory
+    return func.abs(history.quantity_change) * func.coalesce(history.unit_price, 0.0)
+
+
+# (field, lowest age in days, age in days it ends before or None)
+AGEING_BUCKETS = (
+    ("current", 0, 30),
+    ("days_31_60", 30, 60),
+    ("days_61_90", 60, 90),
+    ("over_90", 90, None),
+)
+
+
+def receivables_as_of() -> datetime.date:
+    """The UTC day receivables are aged to; ages only change when it does."""
+    return datetime.datetime.utcnow().date()
+
+
+def receivables_ledger(db: Session, as_of: Optional[datetime.date] = None) -> list[dict]:
+    """
+    Outstanding amount per buyer, largest first, split by how many whole UTC
+    days each sale has been unpaid on ``as_of`` (today by default).
+    """
+    history = models.ChangeHistory
+    as_of = as_of or receivables_as_of()
+    # A sale is at least ``n`` days old when it is before this minus ``n`` days
+    end_of_day = datetime.datetime.combine(as_of + datetime.timedelta(days=1), datetime.time.min)
+    amount = sale_amount()
+    buckets = []
+    for name, low, high in AGEING_BUCKETS:
+        condition = history.timestamp < end_of_day - datetime.timedelta(days=low)
+        if high is not None:
+            condition = condition & (history.timestamp >= end_of_day - datetime.timedelta(days=high))
+        buckets.append(func.sum(case((condition, amount), else_=0.0)).label(name))
+
+    outstanding = func.sum(amount)
+    rows = db.execute(
+        select(
+            history.buyer_name,
+            func.count(history.id).label("sale_count"),
+            outstanding.label("outstanding"),
+            func.min(history.timestamp).label("oldest_sale"),
+            *buckets,
+        )
+        .where(*receivable_filters())
+        .group_by(history.buyer_name)
+        .order_by(outstanding.desc())
+    ).all()
+
+    ledger = []
+    for row in rows:
+        entry = row._asdict()
+        for key in ("outstanding",) + tuple(name for name, _, _ in AGEING_BUCKETS):
+            entry[key] = float(entry[key] or 0.0)
+        ledger.append(entry)
+    return ledger
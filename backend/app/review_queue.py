@@ -0,0 +1,183 @@
+"""
+Claimable queue of pending change requests for several reviewers at once.
+
+A reviewer claims a batch of pending requests and gets a lease on each one
+in ``review_leases``. The lease lasts ``REVIEW_LEASE_SECONDS``, and claiming
+again renews it. While the lease is live, no other reviewer is handed the
+request or can approve or reject it. Resolving a request drops its lease.
+Expired leases are cleared on the next claim, so abandoned work returns to
+the queue.
+
+Unclaimed requests are handed out in this order:
+
+- requests pending for ``REVIEW_AGING_MINUTES`` or more, oldest first
+- then by action: sales and restocks, payments, catalogue edits, and
+  archive/restore/delete last
+- oldest first within each action group
+
+Concurrent claims never get the same request:
+
+- PostgreSQL: candidates are read ``FOR UPDATE SKIP LOCKED``, so each
+  claimer skips rows another one is taking.
+- SQLite: the claim's first statement is a write, which takes the database
+  write lock, so claims run one at a time.
+- Both: leases are inserted with ``ON CONFLICT DO NOTHING``, and only the
+  rows actually inserted count as claimed.
+
+A claim racing an approval or rejection never leaves a lease behind.
+``resolve`` first writes the request row, which takes the row lock on
+PostgreSQL and the database lock on SQLite, and only then checks and drops
+the lease. A claim either commits first, and its lease blocks the other
+reviewer, or runs after the request is gone.
+"""
+from __future__ import annotations
+
+import datetime
+from typing import Optional
+
+from sqlalchemy import case, delete, exists, func, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, joinedload
+
+from . import models
+from .config import settings
+from .events import hub
+
+_ACTION_PRIORITY = {
+    models.ChangeRequestAction.sell: 1,
+    models.ChangeRequestAction.add: 1,
+    models.ChangeRequestAction.mark_paid: 2,
+    models.ChangeRequestAction.create: 3,
+    models.ChangeRequestAction.update: 3,
+    models.ChangeRequestAction.archive: 4,
+    models.ChangeRequestAction.restore: 4,
+    models.ChangeRequestAction.delete: 4,
+}
+
+
+class RequestClaimedError(RuntimeError):
+    """The request is leased to another reviewer."""
+
+
+def _live_lease(now: datetime.datetime):
+    lease = models.ReviewLease
+    return exists().where(lease.request_id == models.ChangeRequest.id, lease.expires_at > now)
+
+
+def _priority():
+    request = models.ChangeRequest
+    aged_before = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        minutes=settings.REVIEW_AGING_MINUTES
+    )
+    return case(
+        (request.request_date <= aged_before, 0),
+        *((request.action == action, rank) for action, rank in _ACTION_PRIORITY.items()),
+    )
+
+
+def pending_queue(db: Session, unclaimed_only: bool = False, skip: int = 0, limit: int = 100):
+    """Pending requests in claim order, optionally only those nobody holds."""
+    request = models.ChangeRequest
+    now = datetime.datetime.utcnow()
+    query = db.query(request).options(
+        joinedload(request.product), joinedload(request.requester)
+    ).filter(request.status == models.ChangeRequestStatus.pending)
+    if unclaimed_only:
+        query = query.filter(~_live_lease(now))
+    return query.order_by(_priority(), request.request_date, request.id).offset(skip).limit(limit).all()
+
+
+def claim(
+    db: Session,
+    reviewer: models.User,
+    limit: int,
+    actions: Optional[list[models.ChangeRequestAction]] = None,
+) -> dict:
+    """
+    Renew ``reviewer``'s leases and top them up to ``limit`` requests from the
+    front of the queue. Returns every request the reviewer now holds.
+    """
+    lease = models.ReviewLease.__table__
+    request = models.ChangeRequest
+    now = datetime.datetime.utcnow()
+    expires_at = now + datetime.timedelta(seconds=settings.REVIEW_LEASE_SECONDS)
+    connection = db.connection()
+    # A write first: on SQLite it takes the database lock before the queue is read
+    connection.execute(delete(lease).where(lease.c.expires_at <= now))
+    connection.execute(update(lease).where(lease.c.reviewer_id == reviewer.id).values(expires_at=expires_at))
+    held = db.query(func.count()).select_from(lease).filter(lease.c.reviewer_id == reviewer.id).scalar()
+
+    claimed: list[int] = []
+    if held < limit:
+        query = db.query(request.id).filter(
+            request.status == models.ChangeRequestStatus.pending, ~_live_lease(now)
+        )
+        if actions:
+            query = query.filter(request.action.in_(actions))
+        candidates = [
+            request_id for (request_id,) in
+            query.order_by(_priority(), request.request_date, request.id)
+            .limit(limit - held)
+            .with_for_update(skip_locked=True, of=request)
+        ]
+        if candidates:
+            dialect_insert = postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+            stmt = dialect_insert(lease).on_conflict_do_nothing(index_elements=[lease.c.request_id])
+            claimed = [
+                request_id for (request_id,) in connection.execute(stmt.returning(lease.c.request_id), [
+                    {"request_id": request_id, "reviewer_id": reviewer.id, "claimed_at": now, "expires_at": expires_at}
+                    for request_id in candidates
+                ])
+            ]
+    db.commit()
+
+    if claimed:
+        hub.publish_from_thread({"type": "requests.updated", "claimed": claimed, "reviewer_id": reviewer.id})
+    held_ids = db.query(lease.c.request_id).filter(lease.c.reviewer_id == reviewer.id)
+    requests = db.query(request).options(
+        joinedload(request.product), joinedload(request.requester)
+    ).filter(request.id.in_(held_ids)).order_by(_priority(), request.request_date, request.id).all()
+    return {"expires_at": expires_at, "requests": requests}
+
+
+def release(db: Session, reviewer: models.User, request_ids: Optional[list[int]] = None) -> list[int]:
+    """Give back the reviewer's leases (all of them when ``request_ids`` is None)."""
+    lease = models.ReviewLease
+    query = db.query(lease).filter(lease.reviewer_id == reviewer.id)
+    if request_ids is not None:
+        query = query.filter(lease.request_id.in_(request_ids))
+    released = sorted(request_id for (request_id,) in query.with_entities(lease.request_id))
+    if released:
+        query.delete(synchronize_session=False)
+    db.commit()
+    if released:
+        hub.publish_from_thread({"type": "requests.updated", "released": released, "reviewer_id": reviewer.id})
+    return released
+
+
+def resolve(db: Session, request_id: int, reviewer_id: int) -> bool:
+    """
+    Take the request and drop its lease as the first step of approving or
+    rejecting it. Returns False when the request is no longer pending and
+    raises RequestClaimedError while another reviewer's lease is live.
+    """
+    request = models.ChangeRequest.__table__
+    lease = models.ReviewLease.__table__
+    connection = db.connection()
+    # A write on the request row: it waits for a claim holding the row and
+    # later claims skip it (PostgreSQL), or takes the database lock (SQLite),
+    # so no lease can be added between this check and the commit.
+    taken = connection.execute(
+        update(request)
+        .where(request.c.id == request_id, request.c.status == models.ChangeRequestStatus.pending)
+        .values(status=request.c.status)
+    ).rowcount
+    if not taken:
+        return False
+    now = datetime.datetime.utcnow()
+    connection.execute(delete(lease).where(
+        lease.c.request_id == request_id, or_(lease.c.reviewer_id == reviewer_id, lease.c.expires_at <= now)
+    ))
+    if connection.execute(select(lease.c.reviewer_id).where(lease.c.request_id == request_id)).first():
+        raise RequestClaimedError("Request is claimed by another reviewer.")
+    return True
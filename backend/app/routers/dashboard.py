@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from .. import auth, dashboard, models, schemas
+from ..database import get_db
+
+router = APIRouter(
+    prefix="/api/dashboard",
+    tags=["dashboard"],
+)
+
+@router.get("/summary", response_model=schemas.DashboardSummary)
+def read_dashboard_summary(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_admin_or_supervisor),
+):
+    """Pending, unpaid, today's sales, low-stock and catalogue counts in one call."""
+    return dashboard.get_summary(db)
@@ -1,85 +1,210 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session, joinedload
-from typing import List
+from sqlalchemy.orm import Session
+from typing import List, Optional
+import orjson
 import pandas as pd
 import io
 
-from .. import crud, schemas, models, auth
+from .. import crud, schemas, models, auth, versioning, reports, history_archive
+from ..conditional import conditional_get, etag_headers
 from ..database import get_db
+from ..streaming import ndjson_response, wants_ndjson
+from ..singleflight import coalesced_json, serialize_rows
 
 router = APIRouter(
     prefix="/api/history",
     tags=["history"],
 )
 
+# History rows embed the product and both users, so any of them changing invalidates the payload
+HISTORY_ETAG = conditional_get(
+    versioning.HISTORY_COUNTER, versioning.PRODUCTS_COUNTER, versioning.USERS_COUNTER
+)
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def _page_headers(rows: list, limit: int, timestamp_of, id_of) -> dict[str, str]:
+    # A full page may have more rows after it; hand out a cursor to continue from
+    if rows and len(rows) >= limit:
+        last = rows[-1]
+        return {NEXT_CURSOR_HEADER: crud.encode_history_cursor(timestamp_of(last), id_of(last))}
+    return {}
+
+def _list_response(
+    request: Request,
+    db: Session,
+    view: str,
+    skip: int,
+    limit: int,
+    compact: bool,
+    filters: schemas.HistoryFilter,
+    cursor: Optional[str],
+    etag: str,
+    user: models.User,
+):
+    if cursor:
+        try:
+            crud.decode_history_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        skip = 0
+
+    if wants_ndjson(request):
+        return ndjson_response(
+            lambda session: crud.history_items_query(session, view, filters, cursor),
+            skip,
+            limit,
+            headers=etag_headers(etag),
+        )
+
+    if compact:
+        # Rows go straight from the SQL projection to orjson, skipping ORM and Pydantic
+        def produce():
+            items = crud.get_history_items(db, view, skip, limit, filters, cursor)
+            headers = _page_headers(items, limit, lambda row: row["timestamp"], lambda row: row["id"])
+            return orjson.dumps(items), headers
+    else:
+        def produce():
+            rows = crud.get_history(db, view, skip, limit, filters, cursor)
+            headers = _page_headers(rows, limit, lambda row: row.timestamp, lambda row: row.id)
+            return serialize_rows(List[schemas.ChangeHistory], rows), headers
+
+    # Identical concurrent reads from the same role share one query and serialization
+    return coalesced_json((etag, user.role.value), produce, etag_headers(etag))
+
 @router.get("/", response_model=List[schemas.ChangeHistory])
 def read_change_history(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
+    compact: bool = False,
+    cursor: Optional[str] = None,
+    filters: schemas.HistoryFilter = Depends(),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_active_admin_or_supervisor),
+    etag: str = Depends(HISTORY_ETAG),
 ):
-    history = crud.get_change_history(db, skip=skip, limit=limit)
-    return history 
+    """History entries, newest first, optionally filtered. `compact=true` returns flat
+    ChangeHistoryItem rows; `Accept: application/x-ndjson` streams them one per line.
+    Full pages carry an `X-Next-Cursor` header; pass it back as `cursor` for the next page."""
+    return _list_response(
+        request, db, crud.HISTORY_VIEW_ALL, skip, limit, compact, filters, cursor, etag, current_user
+    )
 
 @router.get("/sales", response_model=List[schemas.ChangeHistory])
 def read_sales_history(
+    request: Request,
     skip: int = 0,
     limit: int = 1000,
+    compact: bool = False,
+    cursor: Optional[str] = None,
+    filters: schemas.HistoryFilter = Depends(),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_active_admin_or_supervisor),
+    etag: str = Depends(HISTORY_ETAG),
 ):
-    """Get only sales transactions from history"""
-    sales_history = crud.get_sales_history(db, skip=skip, limit=limit)
-    return sales_history
+    """Get only sales transactions from history. Accepts the same filters, `cursor`,
+    `compact` and NDJSON options as the full history."""
+    return _list_response(
+        request, db, crud.HISTORY_VIEW_SALES, skip, limit, compact, filters, cursor, etag, current_user
+    )
 
 @router.get("/unpaid", response_model=List[schemas.ChangeHistory])
 def read_unpaid_sales(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
+    compact: bool = False,
+    cursor: Optional[str] = None,
+    filters: schemas.HistoryFilter = Depends(),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_admin_or_supervisor),
+    etag: str = Depends(HISTORY_ETAG),
+):
+    """Get all sales with an 'unpaid' status. Accepts the same filters, `cursor`,
+    `compact` and NDJSON options as the full history."""
+    return _list_response(
+        request, db, crud.HISTORY_VIEW_UNPAID, skip, limit, compact, filters, cursor, etag, current_user
+    )
+
+
+@router.get("/receivables", response_model=List[schemas.ReceivableBuyer])
+def read_receivables(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_active_admin_or_supervisor),
+    # Ages move with the day even when history does not
+    etag: str = Depends(conditional_get(versioning.HISTORY_COUNTER, extra_key=reports.receivables_as_of)),
+):
+    """Outstanding unpaid sales per buyer with 0-30/31-60/61-90/90+ day ageing buckets."""
+    return reports.receivables_ledger(db)
+
+@router.post("/receivables/settle", response_model=schemas.ReceivablesSettlement)
+def settle_receivables(
+    settlement: schemas.ReceivablesSettleRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_admin),
 ):
-    """Get all sales with an 'unpaid' status."""
-    unpaid_sales = db.query(models.ChangeHistory).options(
-        joinedload(models.ChangeHistory.product),
-        joinedload(models.ChangeHistory.requester),
-        joinedload(models.ChangeHistory.reviewer)
-    ).filter(
-        models.ChangeHistory.action == models.ChangeRequestAction.sell,
-        models.ChangeHistory.payment_status == models.PaymentStatus.unpaid,
-        models.ChangeHistory.product_id.isnot(None)
-    ).order_by(models.ChangeHistory.timestamp.desc()).offset(skip).limit(limit).all()
-    return unpaid_sales
+    """Mark all, or the listed, unpaid sales of a buyer as paid in one step."""
+    try:
+        return crud.settle_buyer_receivables(
+            db, settlement.buyer_name, current_user, history_ids=settlement.history_ids
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/archive", response_model=schemas.HistoryArchiveRun)
+def archive_history(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_admin),
+):
+    """Move history older than HISTORY_ARCHIVE_AFTER_DAYS into the archive table now."""
+    try:
+        return history_archive.archive_cold_history(db)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except history_archive.ArchiveIntegrityError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/archive/status", response_model=schemas.HistoryArchiveStatus)
+def read_history_archive_status(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_admin),
+):
+    """Archive cutoff and row counts, with a check that no archived row went missing."""
+    return history_archive.check_archive_integrity(db)
 
 @router.get("/sales/export", response_class=StreamingResponse)
 def export_sales_to_excel(
+    filters: schemas.HistoryFilter = Depends(),
     db: Session = Depends(get_db), 
     current_user: models.User = Depends(auth.get_current_admin_or_supervisor_for_export)
 ):
-    """Export sales data to Excel file"""
-    sales_only = crud.get_sales_history(db, skip=0, limit=10000) # Use the new function
+    """Export sales data to Excel file, optionally filtered like the history lists"""
+    # Flat snapshot rows: the price and names recorded when each sale was approved
+    sales_only = crud.get_history_items(
+        db, view=crud.HISTORY_VIEW_SALES, skip=0, limit=10000, filters=filters
+    )
     
     if not sales_only:
         raise HTTPException(status_code=404, detail="No sales found to export.")
     
     sales_data = []
     for sale in sales_only:
-        requester_name = sale.requester.username if sale.requester else "Deleted user"
-        reviewer_name = sale.reviewer.username if sale.reviewer else "Deleted user"
+        quantity = abs(sale["quantity_change"]) if sale["quantity_change"] else 0
+        unit_price = sale["product_price"] or 0
+        payment_status = sale["payment_status"]
         sales_data.append({
-            "Date": sale.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-            "Product_Name": sale.product.name if sale.product else "N/A",
-            "Barcode": sale.product.barcode if sale.product else "N/A",
-            "Quantity_Sold": abs(sale.quantity_change) if sale.quantity_change else 0,
-            "Price_Per_Unit": sale.product.price if sale.product else 0,
-            "Total_Amount": (abs(sale.quantity_change) * sale.product.price) if (sale.quantity_change and sale.product) else 0,
-            "Buyer_Name": sale.buyer_name or "N/A",
-            "Payment_Status": sale.payment_status.value if sale.payment_status else "N/A",
-            "Seller": requester_name,
-            "Approved_By": reviewer_name,
+            "Date": sale["timestamp"].strftime("%Y-%m-%d %H:%M:%S"),
+            "Product_Name": sale["product_name"] or "N/A",
+            "Barcode": sale["product_barcode"] or "N/A",
+            "Quantity_Sold": quantity,
+            "Price_Per_Unit": unit_price,
+            "Total_Amount": quantity * unit_price,
+            "Buyer_Name": sale["buyer_name"] or "N/A",
+            "Payment_Status": payment_status.value if payment_status else "N/A",
+            "Seller": sale["requester_username"] or "Deleted user",
+            "Approved_By": sale["reviewer_username"] or "Deleted user",
         })
     
     df = pd.DataFrame(sales_data)
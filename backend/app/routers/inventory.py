@@ -1,8 +1,9 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime, timezone
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 
-from .. import crud, models, schemas
+from .. import crud, low_stock, models, reorder, review_queue, schemas, stock_snapshots
 from ..schemas import ChangeRequestAction
 from ..database import get_db
 from ..auth import (
@@ -34,7 +35,7 @@ def request_inventory_change(
             # For destructive/state actions, the barcode field actually contains the product ID
             product = crud.get_product_by_id(db, product_id=int(request.barcode))
         else:
-            product = crud.get_product_by_barcode(db, barcode=request.barcode)
+            product = crud.lookup_product_by_barcode(db, barcode=request.barcode)
 
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
@@ -42,7 +43,7 @@ def request_inventory_change(
     elif request.action == ChangeRequestAction.create:
         # For create action, validate that barcode doesn't already exist and no pending request exists
         if request.new_product_barcode:
-            existing_product = crud.get_product_by_barcode(db, barcode=request.new_product_barcode)
+            existing_product = crud.lookup_product_by_barcode(db, barcode=request.new_product_barcode)
             if existing_product:
                 raise HTTPException(status_code=400, detail="A product with this barcode already exists")
             
@@ -95,8 +96,29 @@ def request_inventory_change(
 def get_pending_requests(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_admin_or_supervisor),
+    unclaimed: bool = False,
 ):
-    return crud.get_pending_change_requests(db)
+    return crud.get_pending_change_requests(db, unclaimed_only=unclaimed)
+
+@router.post("/requests/claim", response_model=schemas.ReviewClaim)
+def claim_requests(
+    claim: schemas.ReviewClaimRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_admin),
+):
+    """
+    Lease up to ``limit`` pending requests to the caller so other reviewers
+    skip them. Claiming again renews the caller's leases.
+    """
+    return review_queue.claim(db, current_user, claim.limit, claim.actions)
+
+@router.post("/requests/release", response_model=schemas.ReviewRelease)
+def release_requests(
+    release: schemas.ReviewReleaseRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_admin),
+):
+    return {"released": review_queue.release(db, current_user, release.request_ids)}
 
 @router.put("/requests/{request_id}/approve", response_model=schemas.ChangeHistory)
 def approve_request(
@@ -110,6 +132,8 @@ def approve_request(
         if approved_request is None:
             raise HTTPException(status_code=404, detail="Request not found or not pending")
         return approved_request
+    except review_queue.RequestClaimedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -135,7 +159,83 @@ def reject_request(
     current_user: models.User = Depends(get_current_active_admin),
 ):
     # authorization now via get_current_active_admin
-    rejected_request = crud.reject_change_request(db, request_id=request_id, reviewer_id=current_user.id)
+    try:
+        rejected_request = crud.reject_change_request(db, request_id=request_id, reviewer_id=current_user.id)
+    except review_queue.RequestClaimedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     if rejected_request is None:
         raise HTTPException(status_code=404, detail="Request not found or not pending")
     return rejected_request
+
+@router.get("/as-of", response_model=schemas.InventoryAsOf)
+def read_inventory_as_of(
+    ts: datetime = Query(..., description="Point in time; naive values are UTC"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_admin_or_supervisor),
+):
+    """Every product's quantity, price and value at `ts`, rebuilt from the nearest snapshot."""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    result = stock_snapshots.inventory_as_of(db, ts)
+    if result is None:
+        raise HTTPException(status_code=404, detail="No inventory snapshot exists at or before that time")
+    return result
+
+@router.post("/snapshots", response_model=schemas.InventorySnapshot, status_code=201)
+def take_inventory_snapshot(
+    current_user: models.User = Depends(get_current_active_admin),
+):
+    """Take an inventory snapshot now instead of waiting for the scheduled one."""
+    snapshot = stock_snapshots.take_snapshot()
+    if snapshot is None:
+        raise HTTPException(status_code=409, detail="A snapshot is already being taken")
+    return snapshot
+
+@router.get("/low-stock", response_model=List[schemas.LowStockItem])
+def read_low_stock(
+    category: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user),
+):
+    """Products at or below their reorder threshold, read from the maintained set."""
+    return low_stock.list_low_stock(db, category=category)
+
+@router.get("/reorder-thresholds", response_model=List[schemas.CategoryReorderThreshold])
+def read_category_thresholds(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_admin_or_supervisor),
+):
+    return db.query(models.CategoryReorderThreshold).order_by(models.CategoryReorderThreshold.category).all()
+
+@router.put("/reorder-thresholds/{category}", response_model=List[schemas.LowStockChange])
+def update_category_threshold(
+    category: str,
+    update: schemas.ReorderThresholdUpdate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_admin),
+):
+    """
+    Set the reorder threshold for products in `category` that have none of
+    their own (null clears it). Returns the products that entered or left
+    the low-stock set.
+    """
+    return low_stock.set_category_threshold(db, category, update.threshold)
+
+@router.get("/reorder-suggestions", response_model=List[schemas.ReorderSuggestion])
+def read_reorder_suggestions(
+    include_all: bool = Query(False, description="Include products that need no reorder"),
+    category: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_admin_or_supervisor),
+):
+    """Suggested reorder quantities from the last refresh, least days of cover first."""
+    return reorder.list_suggestions(db, include_all=include_all, category=category)
+
+@router.post("/reorder-suggestions/refresh", response_model=schemas.ReorderRefresh)
+def refresh_reorder_suggestions(
+    full: bool = False,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_admin),
+):
+    """Recompute suggestions for products with new stock movements or sales leaving the window."""
+    return reorder.refresh_reorder_suggestions(db, full=full)
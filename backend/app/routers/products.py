@@ -1,15 +1,23 @@
 import pandas as pd
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Request, Response
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+import gzip
 import io
-from typing import List, Union
+import json
+from typing import List, Optional, Union
 
-from .. import crud, models, schemas
+from .. import bulk_products, crud, models, schemas, versioning
+from ..conditional import conditional_get, etag_headers
 from ..events import hub
+from ..barcode_cache import barcode_cache
 from ..database import get_db
+from ..streaming import ndjson_response, wants_ndjson
+from ..singleflight import coalesced_json, serialize_rows, single_flight
 from .. import auth
 
+SNAPSHOT_COLUMNS = ["id", "barcode", "name", "price", "quantity", "category", "is_archived", "row_version"]
+
 router = APIRouter(
     prefix="/api/products",
     tags=["products"],
@@ -27,7 +35,7 @@ def create_products(
 
     created_products_models = []
     for product_data in products:
-        db_product = crud.get_product_by_barcode(db, barcode=product_data.barcode)
+        db_product = crud.lookup_product_by_barcode(db, barcode=product_data.barcode)
         if db_product:
             raise HTTPException(
                 status_code=409, 
@@ -39,25 +47,123 @@ def create_products(
     db.commit()
     for model in created_products_models:
         db.refresh(model)
+        hub.publish_from_thread(crud.product_event(model))
         
     return created_products_models
 
 @router.get("/", response_model=List[schemas.Product])
 def read_products(
+    request: Request,
     skip: int = 0, 
     limit: int = 100, 
     include_archived: bool = False,
     db: Session = Depends(get_db), 
-    current_user: models.User = Depends(auth.get_current_active_user)
+    current_user: models.User = Depends(auth.get_current_active_user),
+    etag: str = Depends(conditional_get(versioning.PRODUCTS_COUNTER)),
 ):
-    products = crud.get_products(db, skip=skip, limit=limit, include_archived=include_archived)
-    return products
+    if wants_ndjson(request):
+        # Large pulls (e.g. reporting) stream one product per line
+        return ndjson_response(
+            lambda session: crud.product_rows_query(session, include_archived=include_archived),
+            skip,
+            limit,
+            headers=etag_headers(etag),
+        )
+    # Every active user sees the same list, so identical concurrent reads share one query
+    return coalesced_json(
+        (etag, "products"),
+        lambda: serialize_rows(
+            List[schemas.Product],
+            crud.get_products(db, skip=skip, limit=limit, include_archived=include_archived),
+        ),
+        etag_headers(etag),
+    )
 
 @router.get("/categories", response_model=List[str])
-def read_product_categories(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+def read_product_categories(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user),
+    etag: str = Depends(conditional_get(versioning.PRODUCTS_COUNTER)),
+):
     categories = crud.get_product_categories(db)
     return [category[0] for category in categories]
 
+@router.get("/categories/counts", response_model=List[schemas.ProductCategory])
+def read_product_category_counts(
+    include_archived: bool = True,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user),
+    etag: str = Depends(conditional_get(versioning.PRODUCTS_COUNTER)),
+):
+    """Categories with their total and non-archived product counts."""
+    return crud.get_product_category_counts(db, include_archived=include_archived)
+
+@router.get("/search", response_model=List[schemas.ProductSearchResult])
+def search_products(
+    q: Optional[str] = Query(None, description="Name substring or fuzzy match"),
+    barcode: Optional[str] = Query(None, description="Barcode prefix"),
+    category: Optional[str] = None,
+    include_archived: bool = False,
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user),
+    etag: str = Depends(conditional_get(versioning.PRODUCTS_COUNTER)),
+):
+    """Ranked product search: exact name, then prefix, then substring, then fuzzy matches."""
+    return crud.search_products(
+        db,
+        q=q.strip() if q else None,
+        barcode_prefix=barcode,
+        category=category,
+        include_archived=include_archived,
+        limit=limit,
+    )
+
+@router.get("/changes", response_model=schemas.ProductChanges)
+def read_product_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Delta sync: products written and deleted after row version `since`.
+    Pass the returned `version` as `since` on the next call; keep paging while `has_more`.
+    """
+    return crud.get_product_changes(db, since=since, limit=limit)
+
+@router.get("/snapshot")
+def read_product_snapshot(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Gzip-compressed full catalogue for a first sync. Rows are arrays in
+    `columns` order; follow up with /changes?since=<version>.
+    """
+    version, rows = crud.get_product_snapshot(db)
+    payload = {
+        "version": version,
+        "columns": SNAPSHOT_COLUMNS,
+        "rows": [list(row) for row in rows],
+    }
+    body = gzip.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"Content-Encoding": "gzip"},
+    )
+
+@router.get("/cache/stats", response_model=dict)
+def read_barcode_cache_stats(current_user: models.User = Depends(auth.get_current_active_admin)):
+    """Hit ratio and size of this worker's barcode lookup cache."""
+    return barcode_cache.stats()
+
+@router.get("/coalescing/stats", response_model=dict)
+def read_coalescing_stats(current_user: models.User = Depends(auth.get_current_active_admin)):
+    """How many list reads this worker executed versus served from a shared in-flight result."""
+    return single_flight.stats()
+
 @router.get("/export", response_class=StreamingResponse)
 def export_products_to_excel(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_admin_or_supervisor_for_export)):
     """
@@ -87,11 +193,23 @@ def read_product(
     db: Session = Depends(get_db), 
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
-    db_product = crud.get_product_by_barcode(db, barcode=barcode)
+    db_product = crud.lookup_product_by_barcode(db, barcode=barcode)
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
     return db_product
 
+@router.post("/lookup", response_model=schemas.ProductLookupResult)
+def lookup_products(
+    lookup: schemas.ProductLookupRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Resolve a batch of scanned barcodes (e.g. a received shipment) in one call.
+    Unknown barcodes report whether a create request is already pending.
+    """
+    return crud.lookup_products(db, lookup.barcodes)
+
 @router.post("/import", response_model=dict)
 def import_products_from_excel(
     file: UploadFile = File(...),
@@ -142,6 +260,10 @@ def import_products_from_excel(
         created_count = 0
         updated_count = 0
         errors = []
+
+        # Resolve every barcode in the sheet up front instead of one query per row
+        sheet_barcodes = df[column_mapping['barcode']].astype(str).tolist()
+        existing_by_barcode = crud.get_products_by_barcodes(db, sheet_barcodes)
         
         for index, row in df.iterrows():
             try:
@@ -152,7 +274,7 @@ def import_products_from_excel(
                 category = str(row[column_mapping['category']])
                 
                 # Check if product exists
-                existing_product = crud.get_product_by_barcode(db, barcode=barcode)
+                existing_product = existing_by_barcode.get(barcode)
                 
                 if existing_product:
                     # Update existing product
@@ -168,13 +290,15 @@ def import_products_from_excel(
                         barcode=barcode, name=name, price=price,
                         quantity=quantity, category=category
                     )
-                    crud.create_product(db=db, product=product_create)
+                    existing_by_barcode[barcode] = crud.create_product(db=db, product=product_create)
                     created_count += 1
                     
             except Exception as e:
                 errors.append(f"Row {index + 2}: {str(e)}")
         
         db.commit()
+        # Too many rows to ship individually; clients refetch on a bare event
+        hub.publish_from_thread({"type": "product.updated"})
         
         return {
             "message": "Import completed",
@@ -187,6 +311,39 @@ def import_products_from_excel(
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to process Excel file: {str(e)}")
 
+# Registered before the /{product_id} routes so "bulk" is not parsed as an ID
+@router.post("/bulk/archive", response_model=schemas.BulkProductResult)
+def bulk_archive_products(
+    selection: schemas.BulkProductSelection,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_admin)
+):
+    """Archive the listed products, or every active product in a category, in one transaction."""
+    return bulk_products.bulk_update_products(
+        db, bulk_products.ACTION_ARCHIVE, current_user, selection.product_ids, selection.category
+    )
+
+@router.post("/bulk/restore", response_model=schemas.BulkProductResult)
+def bulk_restore_products(
+    selection: schemas.BulkProductSelection,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_admin)
+):
+    return bulk_products.bulk_update_products(
+        db, bulk_products.ACTION_RESTORE, current_user, selection.product_ids, selection.category
+    )
+
+@router.post("/bulk/delete", response_model=schemas.BulkProductResult)
+def bulk_delete_products(
+    selection: schemas.BulkProductSelection,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_admin)
+):
+    """Delete products, keeping their history rows (unlinked) as single deletes do."""
+    return bulk_products.bulk_update_products(
+        db, bulk_products.ACTION_DELETE, current_user, selection.product_ids, selection.category
+    )
+
 @router.put("/{product_id}", response_model=schemas.Product)
 def update_product_details(
     product_id: int,
@@ -207,6 +364,7 @@ def update_product_details(
             )
 
     product = crud.update_product(db=db, product=product, product_in=product_in)
+    hub.publish_from_thread(crud.product_event(product))
     return product
 
 @router.delete("/{product_id}", response_model=schemas.Product)
@@ -226,14 +384,17 @@ def remove_product(
         status=models.ChangeRequestStatus.approved,
         requester_id=current_user.id,
         reviewer_id=current_user.id,
+        **crud.history_snapshot(db, product, current_user.id, current_user.id),
     )
     db.add(history_entry)
     db.commit()
+    history_event = crud.history_event(history_entry)
+    deleted_event = crud.product_event(product, deleted=True)
 
     crud.delete_product(db=db, product=product)
-    # Broadcast so clients refresh
-    hub.publish_from_thread({"type": "product.updated", "product_id": product_id})
-    hub.publish_from_thread({"type": "history.updated"})
+    # Broadcast so clients patch their local state
+    hub.publish_from_thread(deleted_event)
+    hub.publish_from_thread(history_event)
     return product
 
 @router.post("/{product_id}/archive", response_model=schemas.Product)
@@ -245,7 +406,9 @@ def archive_product(
     product = db.query(models.Product).filter(models.Product.id == product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return crud.archive_product(db=db, product=product)
+    product = crud.archive_product(db=db, product=product)
+    hub.publish_from_thread(crud.product_event(product))
+    return product
 
 @router.post("/{product_id}/unarchive", response_model=schemas.Product)
 def unarchive_product(
@@ -256,4 +419,6 @@ def unarchive_product(
     product = db.query(models.Product).filter(models.Product.id == product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return crud.unarchive_product(db=db, product=product)
+    product = crud.unarchive_product(db=db, product=product)
+    hub.publish_from_thread(crud.product_event(product))
+    return product
@@ -1,11 +1,85 @@
+import asyncio
+import json
+
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from ..events import hub
+from starlette.concurrency import run_in_threadpool
+from ..events import hub, is_valid_topic
+from ..config import settings
 from .. import auth, crud
 from ..database import SessionLocal
 
 router = APIRouter(prefix="/ws", tags=["realtime"])
 
 
+async def _handle_client_message(websocket: WebSocket, raw: str) -> None:
+    """
+    Apply a subscription message from the client, e.g.
+    {"action": "subscribe", "topics": ["product:12", "category:Drinks", "history"]}
+    """
+    try:
+        message = json.loads(raw)
+    except ValueError:
+        await websocket.send_json({"type": "error", "detail": "Messages must be JSON"})
+        return
+    if not isinstance(message, dict):
+        await websocket.send_json({"type": "error", "detail": "Messages must be JSON objects"})
+        return
+
+    # Heartbeats: any inbound message resets the idle timer, pings get a pong
+    if message.get("type") == "pong":
+        return
+    if message.get("type") == "ping":
+        await websocket.send_json({"type": "pong"})
+        return
+
+    action = message.get("action")
+    topics = message.get("topics") or []
+    if action not in ("subscribe", "unsubscribe"):
+        await websocket.send_json({"type": "error", "detail": f"Unknown action: {action}"})
+        return
+    if not isinstance(topics, list):
+        await websocket.send_json({"type": "error", "detail": "topics must be a list"})
+        return
+    invalid = [topic for topic in topics if not is_valid_topic(topic)]
+    if invalid:
+        await websocket.send_json({"type": "error", "detail": f"Unknown topics: {invalid}"})
+        return
+
+    if action == "subscribe":
+        try:
+            current = hub.subscribe(websocket, topics)
+        except ValueError as e:
+            await websocket.send_json({"type": "error", "detail": str(e)})
+            return
+    else:
+        current = hub.unsubscribe(websocket, topics)
+    await websocket.send_json({"type": "subscriptions", "topics": sorted(current)})
+
+
+def _authenticate(token: str) -> tuple[str | None, int]:
+    """
+    Resolve the token to an active username, returning (username, close_code).
+    The DB session lives only for this lookup so idle sockets do not pin a
+    pooled connection.
+    """
+    try:
+        payload = auth.jwt.decode(token, auth.settings.SECRET_KEY, algorithms=[auth.settings.JWT_ALGORITHM])
+    except auth.JWTError:
+        return None, 4401
+    username = payload.get("sub")
+    if not username:
+        return None, 4401
+
+    db = SessionLocal()
+    try:
+        user = crud.get_user_by_username(db, username=username)
+        if not user or not user.is_active:
+            return None, 4403
+        return user.username, 0
+    finally:
+        db.close()
+
+
 @router.websocket("/updates")
 async def websocket_updates(websocket: WebSocket):
     # Simple token-based auth via query parameter for WebSocket
@@ -14,30 +88,32 @@ async def websocket_updates(websocket: WebSocket):
         await websocket.close(code=4401)
         return
 
-    db = SessionLocal()
-    try:
-        try:
-            payload = auth.jwt.decode(token, auth.settings.SECRET_KEY, algorithms=[auth.settings.JWT_ALGORITHM])
-            username = payload.get("sub")
-            if not username:
-                await websocket.close(code=4401)
-                return
-            user = crud.get_user_by_username(db, username=username)
-            if not user or not user.is_active:
-                await websocket.close(code=4403)
-                return
-        except auth.JWTError:
-            await websocket.close(code=4401)
-            return
-
-        await hub.connect(websocket)
-        try:
-            while True:
-                # Keep the connection alive; we do not expect messages from client
-                await websocket.receive_text()
-        except WebSocketDisconnect:
-            hub.disconnect(websocket)
-    finally:
-        db.close()
+    username, close_code = await run_in_threadpool(_authenticate, token)
+    if username is None:
+        await websocket.close(code=close_code)
+        return
 
+    if not await hub.connect(websocket, user_key=username):
+        return
 
+    heartbeat = settings.WS_HEARTBEAT_INTERVAL_SECONDS
+    idle_timeout = settings.WS_IDLE_TIMEOUT_SECONDS
+    loop = asyncio.get_running_loop()
+    last_seen = loop.time()
+    try:
+        while True:
+            try:
+                raw = await asyncio.wait_for(websocket.receive_text(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                if idle_timeout and loop.time() - last_seen >= idle_timeout:
+                    await websocket.close(code=4408)
+                    break
+                await websocket.send_json({"type": "ping"})
+                continue
+            last_seen = loop.time()
+            # Clients may narrow the events they receive with subscribe/unsubscribe messages
+            await _handle_client_message(websocket, raw)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hub.disconnect(websocket)
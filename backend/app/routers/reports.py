@@ -0,0 +1,30 @@
+from datetime import date
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from .. import auth, models, reports, schemas, versioning
+from ..conditional import conditional_get
+from ..database import get_db
+
+router = APIRouter(
+    prefix="/api/reports",
+    tags=["reports"],
+)
+
+@router.get("/sales", response_model=schemas.SalesReport)
+def read_sales_report(
+    group_by: Literal["day", "week", "month", "product", "category", "seller", "buyer"] = "day",
+    start: Optional[date] = Query(None, description="First UTC day included"),
+    end: Optional[date] = Query(None, description="Last UTC day included"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_admin_or_supervisor),
+    etag: str = Depends(conditional_get(
+        versioning.HISTORY_COUNTER, versioning.PRODUCTS_COUNTER, versioning.USERS_COUNTER
+    )),
+):
+    """Approved sales aggregated per period, product, category, seller or buyer."""
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end.")
+    return reports.sales_report(db, group_by=group_by, start=start, end=end)
@@ -0,0 +1,113 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from sqlalchemy.orm import Session
+
+from .. import auth, models, schemas, stocktake
+from ..database import get_db
+
+router = APIRouter(
+    prefix="/api/stocktakes",
+    tags=["stocktakes"],
+)
+
+@router.post("/", response_model=schemas.StocktakeSession, status_code=201)
+def create_stocktake(
+    stocktake_in: schemas.StocktakeCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user),
+):
+    """Open a stocktake session to collect physical counts."""
+    return stocktake.create_session(db, current_user, note=stocktake_in.note)
+
+@router.get("/", response_model=List[schemas.StocktakeSession])
+def list_stocktakes(
+    skip: int = 0,
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_admin_or_supervisor),
+):
+    return db.query(models.StocktakeSession).order_by(
+        models.StocktakeSession.id.desc()
+    ).offset(skip).limit(limit).all()
+
+@router.get("/{stocktake_id}", response_model=schemas.StocktakeReport)
+def read_stocktake(
+    stocktake_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_admin_or_supervisor),
+):
+    """Counted lines with their variance against the system quantity, plus totals."""
+    report = stocktake.variance_report(db, stocktake_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Stocktake not found")
+    return report
+
+def _record(db: Session, stocktake_id: int, counts) -> dict:
+    try:
+        return stocktake.record_counts(db, stocktake_id, counts)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/{stocktake_id}/counts", response_model=schemas.StocktakeCountResult)
+def submit_counts(
+    stocktake_id: int,
+    submission: schemas.StocktakeCountsSubmit,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user),
+):
+    """Record counted quantities by barcode; unknown barcodes are returned, not stored."""
+    return _record(db, stocktake_id, [(count.barcode, count.counted_quantity) for count in submission.counts])
+
+@router.post("/{stocktake_id}/counts/upload", response_model=schemas.StocktakeCountResult)
+def upload_counts(
+    stocktake_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user),
+):
+    """
+    Record counts from an Excel or CSV sheet. Auto-detects a barcode column
+    and a count column (Count, Quantity, Qty or Stock; case-insensitive).
+    """
+    if not file.filename.lower().endswith(stocktake.SHEET_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="File must be Excel (.xlsx or .xls) or CSV")
+    try:
+        counts = stocktake.read_counts_sheet(file.file.read(), file.filename)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to process count sheet: {str(e)}")
+    return _record(db, stocktake_id, counts)
+
+@router.post("/{stocktake_id}/apply", response_model=schemas.StocktakeApplyResult)
+def apply_stocktake(
+    stocktake_id: int,
+    approval: schemas.StocktakeApply,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_admin),
+):
+    """
+    Adjust product quantities by the approved variances in one transaction
+    and close the session.
+    """
+    try:
+        return stocktake.apply_session(db, stocktake_id, current_user, product_ids=approval.product_ids)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/{stocktake_id}/cancel", response_model=schemas.StocktakeSession)
+def cancel_stocktake(
+    stocktake_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_admin),
+):
+    try:
+        return stocktake.cancel_session(db, stocktake_id)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
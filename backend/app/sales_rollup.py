@@ -0,0 +1,105 @@
+"""
+Incrementally maintained daily sales rollup.
+
+``sales_daily_rollups`` holds the units, revenue and number of approved sales
+per (UTC day, product, slot). ``approve_change_request`` upserts the row for
+each approved sale inside the same transaction, recording revenue at the
+price in effect when the sale was approved. Sales that go through the
+quantity ledger use the slot their delta went to, so they do not all update
+one row per product and day; every other sale uses slot 0. Daily, weekly, monthly,
+product and category reports then aggregate this small table instead of
+scanning change history.
+"""
+import datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+
+
+def record_sale(connection, day: datetime.date, product: models.Product, units: int, slot: int = 0) -> None:
+    """Add one approved sale of ``units`` of ``product`` to the rollup for ``day`` in ``slot``."""
+    table = models.SalesDailyRollup.__table__
+    dialect_insert = postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+    revenue = units * product.price
+    stmt = dialect_insert(table).values(
+        day=day,
+        product_id=product.id,
+        slot=slot,
+        product_name=product.name,
+        category=product.category,
+        units=units,
+        revenue=revenue,
+        sale_count=1,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.day, table.c.product_id, table.c.slot],
+        set_={
+            # Keep the latest name/category so reports label the product as it is now
+            "product_name": stmt.excluded.product_name,
+            "category": stmt.excluded.category,
+            "units": table.c.units + units,
+            "revenue": table.c.revenue + revenue,
+            "sale_count": table.c.sale_count + 1,
+        },
+    )
+    connection.execute(stmt)
+
+
+def rebuild_sales_rollup(db: Session) -> None:
+    """
+    Recompute the rollup from change history, using the price recorded on each
+    sale (or the product's current price for rows written before it was).
+    """
+    history = models.ChangeHistory
+    day = func.date(history.timestamp)
+    units = func.abs(history.quantity_change)
+    rows = db.execute(
+        select(
+            day,
+            models.Product.id,
+            models.Product.name,
+            models.Product.category,
+            func.sum(units),
+            func.sum(units * func.coalesce(history.unit_price, models.Product.price)),
+            func.count(history.id),
+        )
+        .join(models.Product, models.Product.id == history.product_id)
+        .where(
+            history.action == models.ChangeRequestAction.sell,
+            history.status == models.ChangeRequestStatus.approved,
+        )
+        .group_by(day, models.Product.id, models.Product.name, models.Product.category)
+    ).all()
+    db.query(models.SalesDailyRollup).delete(synchronize_session=False)
+    for sale_day, product_id, name, category, total_units, revenue, count in rows:
+        if isinstance(sale_day, str):
+            sale_day = datetime.date.fromisoformat(sale_day)
+        db.add(models.SalesDailyRollup(
+            day=sale_day,
+            product_id=product_id,
+            product_name=name,
+            category=category,
+            units=total_units or 0,
+            revenue=revenue or 0.0,
+            sale_count=count,
+        ))
+    db.commit()
+
+
+def ensure_sales_rollup() -> None:
+    """Populate the rollup on startup when it is empty but sales exist (e.g. fresh create_all)."""
+    db = SessionLocal()
+    try:
+        has_rollup = db.query(models.SalesDailyRollup.day).first() is not None
+        has_sales = db.query(models.ChangeHistory.id).filter(
+            models.ChangeHistory.action == models.ChangeRequestAction.sell,
+            models.ChangeHistory.status == models.ChangeRequestStatus.approved,
+        ).first() is not None
+        if has_sales and not has_rollup:
+            rebuild_sales_rollup(db)
+    finally:
+        db.close()
@@ -1,7 +1,7 @@
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
-from datetime import datetime
-from .models import UserRole, ChangeRequestStatus, ChangeRequestAction, PaymentStatus
+from pydantic import AliasChoices, BaseModel, Field, ConfigDict, model_validator
+from typing import Dict, List, Optional
+from datetime import date, datetime
+from .models import UserRole, ChangeRequestStatus, ChangeRequestAction, PaymentStatus, StocktakeStatus
 
 # Token Schemas
 class Token(BaseModel):
@@ -37,16 +37,79 @@ class ProductBase(BaseModel):
     price: float
     quantity: int
     category: str
+    reorder_threshold: Optional[int] = Field(None, ge=0)
 
 class ProductCreate(ProductBase):
     pass
 
 class Product(ProductBase):
+    # Includes quantity-ledger deltas not yet folded into the row
+    quantity: int = Field(validation_alias=AliasChoices("available_quantity", "quantity"))
     id: int
     is_archived: bool
+    row_version: int = 0
+    updated_at: Optional[datetime] = None
 
     model_config = ConfigDict(from_attributes=True)
 
+MAX_LOOKUP_BARCODES = 1000
+
+class ProductLookupRequest(BaseModel):
+    barcodes: List[str] = Field(..., min_length=1, max_length=MAX_LOOKUP_BARCODES)
+
+class UnknownBarcode(BaseModel):
+    barcode: str
+    pending_creation: bool
+
+class ProductLookupResult(BaseModel):
+    found: List[Product]
+    unknown: List[UnknownBarcode]
+
+class ProductSearchResult(Product):
+    score: float
+
+class ProductCategory(BaseModel):
+    name: str
+    product_count: int
+    active_count: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+class ProductTombstone(BaseModel):
+    product_id: int
+    barcode: str
+    row_version: int
+    deleted_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+class ProductChanges(BaseModel):
+    """Products written and deleted after ``since``; resume from ``version`` next time."""
+    version: int
+    changed: List[Product]
+    deleted: List[ProductTombstone]
+    has_more: bool
+
+MAX_BULK_PRODUCT_IDS = 5000
+
+class BulkProductSelection(BaseModel):
+    """Either explicit product IDs or a whole category."""
+    product_ids: Optional[List[int]] = Field(None, min_length=1, max_length=MAX_BULK_PRODUCT_IDS)
+    category: Optional[str] = None
+
+    @model_validator(mode="after")
+    def _one_selector(self):
+        if (self.product_ids is None) == (self.category is None):
+            raise ValueError("Provide either product_ids or category.")
+        return self
+
+class BulkProductResult(BaseModel):
+    action: str
+    product_ids: List[int]
+    history_ids: List[int]
+    # Requested IDs that were not found or already in the target state
+    skipped: List[int]
+
 # Change Request Schemas
 class ChangeRequestBase(BaseModel):
     product_id: Optional[int] = None
@@ -85,6 +148,24 @@ class ChangeRequest(ChangeRequestCreate):
 
     model_config = ConfigDict(from_attributes=True)
 
+MAX_REVIEW_CLAIM = 100
+
+class ReviewClaimRequest(BaseModel):
+    limit: int = Field(10, ge=1, le=MAX_REVIEW_CLAIM)
+    # Only hand out these actions, e.g. a reviewer who handles sales
+    actions: Optional[List[ChangeRequestAction]] = None
+
+class ReviewClaim(BaseModel):
+    expires_at: datetime
+    requests: List[ChangeRequest]
+
+class ReviewReleaseRequest(BaseModel):
+    # Every lease the reviewer holds when omitted
+    request_ids: Optional[List[int]] = None
+
+class ReviewRelease(BaseModel):
+    released: List[int]
+
 class ChangeHistory(BaseModel):
     id: int
     product: Optional[Product] = None
@@ -96,5 +177,247 @@ class ChangeHistory(BaseModel):
     timestamp: datetime
     buyer_name: Optional[str] = None
     payment_status: Optional[PaymentStatus] = None
+    unit_price: Optional[float] = None
+    product_name: Optional[str] = None
+    barcode: Optional[str] = None
+    requester_username: Optional[str] = None
+    reviewer_username: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class HistoryFilter(BaseModel):
+    """Optional history filters; ``start`` is inclusive and ``end`` exclusive."""
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    action: Optional[ChangeRequestAction] = None
+    status: Optional[ChangeRequestStatus] = None
+    product_id: Optional[int] = None
+    barcode: Optional[str] = None
+    requester_id: Optional[int] = None
+    reviewer_id: Optional[int] = None
+    buyer_name: Optional[str] = None
+    payment_status: Optional[PaymentStatus] = None
+
+class ChangeHistoryItem(BaseModel):
+    """Flat history row for list views: IDs plus the names and price recorded when the row was written."""
+    id: int
+    product_id: Optional[int] = None
+    product_name: Optional[str] = None
+    product_barcode: Optional[str] = None
+    product_price: Optional[float] = None
+    quantity_change: Optional[int] = None
+    action: ChangeRequestAction
+    status: ChangeRequestStatus
+    requester_id: Optional[int] = None
+    requester_username: Optional[str] = None
+    reviewer_id: Optional[int] = None
+    reviewer_username: Optional[str] = None
+    timestamp: datetime
+    buyer_name: Optional[str] = None
+    payment_status: Optional[PaymentStatus] = None
+
+# Report Schemas
+class SalesReportRow(BaseModel):
+    """One group: a period start date, product ID, category, seller ID or buyer name."""
+    key: Optional[str] = None
+    label: Optional[str] = None
+    units: int
+    revenue: float
+    sale_count: int
+
+class SalesReport(BaseModel):
+    group_by: str
+    start: Optional[date] = None
+    end: Optional[date] = None
+    rows: List[SalesReportRow]
+    total_units: int
+    total_revenue: float
+    total_sales: int
+
+class ReceivableBuyer(BaseModel):
+    """Unpaid approved sales for one buyer; bucket amounts are by days since the sale."""
+    buyer_name: Optional[str] = None
+    sale_count: int
+    outstanding: float
+    oldest_sale: datetime
+    current: float
+    days_31_60: float
+    days_61_90: float
+    over_90: float
+
+class ReceivablesSettleRequest(BaseModel):
+    buyer_name: str
+    # Omit to settle every unpaid sale of the buyer
+    history_ids: Optional[List[int]] = None
+
+class ReceivablesSettlement(BaseModel):
+    buyer_name: str
+    settled_ids: List[int]
+    settled_count: int
+    settled_amount: float
+    history: ChangeHistory
+
+# Inventory Snapshot Schemas
+class InventoryAsOfItem(BaseModel):
+    product_id: int
+    # Current barcode and name; None when the product has since been deleted
+    barcode: Optional[str] = None
+    name: Optional[str] = None
+    quantity: int
+    price: Optional[float] = None
+    value: float
+
+class InventoryAsOf(BaseModel):
+    as_of: datetime
+    snapshot_taken_at: datetime
+    product_count: int
+    total_quantity: int
+    total_value: float
+    items: List[InventoryAsOfItem]
+
+class InventorySnapshot(BaseModel):
+    id: int
+    taken_at: datetime
+    product_count: int
+    total_quantity: int
+    total_value: float
+
+    model_config = ConfigDict(from_attributes=True)
+
+# Low Stock Schemas
+class LowStockItem(BaseModel):
+    product_id: int
+    barcode: str
+    name: str
+    category: Optional[str] = None
+    quantity: int
+    threshold: int
+    since: datetime
+
+class CategoryReorderThreshold(BaseModel):
+    category: str
+    threshold: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+class ReorderThresholdUpdate(BaseModel):
+    """``None`` removes the category's threshold so the default applies again."""
+    threshold: Optional[int] = Field(None, ge=0)
+
+class LowStockChange(BaseModel):
+    product_id: int
+    name: str
+    category: Optional[str] = None
+    quantity: int
+    threshold: int
+    low: bool
+
+# Reorder Suggestion Schemas
+class ReorderSuggestion(BaseModel):
+    product_id: int
+    barcode: str
+    name: str
+    category: Optional[str] = None
+    quantity: int
+    velocity: float
+    recent_velocity: float
+    days_of_cover: Optional[float] = None
+    reorder_quantity: int
+    computed_at: datetime
+
+class ReorderRefresh(BaseModel):
+    full: bool
+    recomputed: int
+    as_of: date
+
+# Stocktake Schemas
+MAX_STOCKTAKE_COUNTS = 10000
+
+class StocktakeCreate(BaseModel):
+    note: Optional[str] = None
+
+class StocktakeSession(BaseModel):
+    id: int
+    status: StocktakeStatus
+    note: Optional[str] = None
+    created_by_id: Optional[int] = None
+    created_at: datetime
+    applied_by_id: Optional[int] = None
+    applied_at: Optional[datetime] = None
 
     model_config = ConfigDict(from_attributes=True)
+
+class StocktakeCountIn(BaseModel):
+    barcode: str
+    counted_quantity: int = Field(..., ge=0)
+
+class StocktakeCountsSubmit(BaseModel):
+    """Duplicate barcodes are summed; a product counted again later replaces its earlier count."""
+    counts: List[StocktakeCountIn] = Field(..., min_length=1, max_length=MAX_STOCKTAKE_COUNTS)
+
+class StocktakeCountResult(BaseModel):
+    recorded: int
+    unknown: List[str]
+
+class StocktakeLine(BaseModel):
+    product_id: int
+    barcode: Optional[str] = None
+    name: Optional[str] = None
+    counted_quantity: int
+    system_quantity: int
+    variance: int
+    value_variance: Optional[float] = None
+    counted_at: datetime
+    applied: bool
+
+class StocktakeReport(BaseModel):
+    session: StocktakeSession
+    counted_lines: int
+    variance_lines: int
+    units_over: int
+    units_short: int
+    value_variance: float
+    lines: List[StocktakeLine]
+
+class StocktakeApply(BaseModel):
+    """Products whose variance to apply; all counted variances when omitted."""
+    product_ids: Optional[List[int]] = None
+
+class StocktakeApplyResult(BaseModel):
+    stocktake_id: int
+    adjusted: int
+    skipped: List[int]
+    history_ids: List[int]
+
+# History Archive Schemas
+class HistoryArchiveRun(BaseModel):
+    cutoff: datetime
+    moved: int
+
+class HistoryArchiveStatus(BaseModel):
+    """``consistent`` is False when the archive holds a different number of rows than were moved into it."""
+    cutoff: Optional[datetime] = None
+    hot_count: int
+    archive_count: int
+    archived_rows: int
+    consistent: bool
+
+# Dashboard Schemas
+class DashboardSummary(BaseModel):
+    """Home-screen counts and totals; sales figures are for the UTC day ``as_of``."""
+    as_of: date
+    computed_at: datetime
+    pending_total: int
+    pending_by_action: Dict[str, int]
+    pending_unclaimed: int
+    unpaid_count: int
+    unpaid_amount: float
+    unpaid_buyers: int
+    sales_today_revenue: float
+    sales_today_units: int
+    sales_today_count: int
+    low_stock_count: int
+    out_of_stock_count: int
+    product_count: int
+    active_product_count: int
+    category_count: int
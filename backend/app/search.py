@@ -0,0 +1,308 @@
+"""
+Server-side product search.
+
+Name matching uses the best index the database offers:
+
+* PostgreSQL with ``pg_trgm``: ``ILIKE`` substring plus trigram similarity,
+  backed by a GIN index (see the ``product_search`` migration).
+* SQLite with FTS5: an external-content ``products_fts`` table using the
+  trigram tokenizer (indexed substring matching, no fuzzy matches), kept in
+  sync by triggers created at startup.
+* Otherwise: an in-process trigram index rebuilt incrementally from the
+  product row-version change log, so writes from any worker reach it.
+
+Queries shorter than three characters have no trigram to look up, so
+outside PostgreSQL they fall back to a substring scan.
+
+Category, archived and barcode-prefix filters are always plain indexed SQL
+predicates, applied before candidates are cut to size. Candidates from
+every backend are re-ranked the same way so results are ordered
+consistently: exact name, then prefix, then substring, then fuzzy
+similarity.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import Float, Integer, case, func, or_, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from . import models, versioning
+from .database import engine
+
+BACKEND_PG_TRGM = "pg_trgm"
+BACKEND_FTS5 = "fts5"
+BACKEND_MEMORY = "memory"
+
+# Fetch more candidates than requested so re-ranking has room to reorder
+_CANDIDATE_FACTOR = 4
+_MIN_SIMILARITY = 0.2
+# In-memory index matches checked against the SQL filters per query
+_INDEX_CHUNK_SIZE = 500
+
+_backend: Optional[str] = None
+
+
+def _trigrams(value: str) -> set[str]:
+    padded = f"  {value.lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _similarity(a: set[str], b: set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _rank(name: str, query: str, similarity: float) -> float:
+    name_lower = name.lower()
+    query_lower = query.lower()
+    if name_lower == query_lower:
+        return 3.0 + similarity
+    if name_lower.startswith(query_lower):
+        return 2.0 + similarity
+    if query_lower in name_lower:
+        return 1.0 + similarity
+    return similarity
+
+
+class TrigramIndex:
+    """In-memory trigram index over product names, synced from row versions."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._postings: dict[str, set[int]] = {}
+        # Array copies of the postings, rebuilt on first use after a change
+        self._arrays: dict[str, np.ndarray] = {}
+        self._names: dict[int, str] = {}
+        # Trigram count of each indexed name, by product id
+        self._sizes = np.zeros(1024, dtype=np.int32)
+        self._version: Optional[int] = None
+
+    def _remove(self, product_id: int) -> None:
+        name = self._names.pop(product_id, None)
+        if name is None:
+            return
+        for gram in _trigrams(name):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(product_id)
+                self._arrays.pop(gram, None)
+                if not ids:
+                    del self._postings[gram]
+
+    def _add(self, product_id: int, name: str) -> None:
+        self._remove(product_id)
+        grams = _trigrams(name)
+        self._names[product_id] = name.lower()
+        if product_id >= len(self._sizes):
+            self._sizes = np.concatenate([self._sizes, np.zeros(max(product_id + 1, len(self._sizes)), np.int32)])
+        self._sizes[product_id] = len(grams)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(product_id)
+            self._arrays.pop(gram, None)
+
+    def _array(self, gram: str) -> np.ndarray:
+        array = self._arrays.get(gram)
+        if array is None:
+            ids = self._postings.get(gram, ())
+            array = self._arrays[gram] = np.fromiter(ids, dtype=np.int64, count=len(ids))
+        return array
+
+    def sync(self, db: Session) -> None:
+        version = versioning.current_version(db)
+        with self._lock:
+            if self._version == version:
+                return
+            if self._version is None:
+                rows = db.query(models.Product.id, models.Product.name).all()
+                removed = []
+            else:
+                rows = db.query(models.Product.id, models.Product.name).filter(
+                    models.Product.row_version > self._version
+                ).all()
+                removed = db.query(models.ProductTombstone.product_id).filter(
+                    models.ProductTombstone.row_version > self._version
+                ).all()
+            live = {product_id for product_id, _ in rows}
+            for (product_id,) in removed:
+                if product_id not in live:
+                    self._remove(product_id)
+            first_load = self._version is None
+            for product_id, name in rows:
+                self._add(product_id, name)
+            if first_load:
+                for gram in self._postings:
+                    self._array(gram)
+            self._version = version
+
+    def search(self, query: str) -> list[tuple[int, float]]:
+        """Every matching product id with its similarity, best first."""
+        grams = _trigrams(query)
+        query_lower = query.lower()
+        # Unpadded trigrams, which every name containing the query contains too
+        inner = {query_lower[i:i + 3] for i in range(len(query_lower) - 2)}
+        with self._lock:
+            postings = [self._array(gram) for gram in grams if gram in self._postings]
+            if not postings:
+                return []
+            # Shared trigrams per product id
+            counts = np.bincount(np.concatenate(postings))
+            ids = np.flatnonzero(counts)
+            shared = counts[ids]
+            similarity = shared / (len(grams) + self._sizes[ids] - shared)
+            keep = similarity >= _MIN_SIMILARITY
+            # Substring matches are kept below the minimum similarity too
+            if inner:
+                unsure = np.flatnonzero(~keep & (shared >= len(inner)))
+                names = self._names
+                keep[unsure] = [query_lower in names[product_id] for product_id in ids[unsure].tolist()]
+        ids, similarity = ids[keep], similarity[keep]
+        order = np.argsort(-similarity, kind="stable")
+        return list(zip(ids[order].tolist(), similarity[order].tolist()))
+
+
+trigram_index = TrigramIndex()
+
+
+def _setup_sqlite_fts(connection) -> bool:
+    existed = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+    ).first() is not None
+    try:
+        connection.exec_driver_sql(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+            "name, content='products', content_rowid='id', tokenize='trigram')"
+        )
+    except DBAPIError:
+        return False
+    connection.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN "
+        "INSERT INTO products_fts(rowid, name) VALUES (new.id, new.name); END"
+    )
+    connection.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN "
+        "INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', old.id, old.name); END"
+    )
+    connection.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name ON products BEGIN "
+        "INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+        "INSERT INTO products_fts(rowid, name) VALUES (new.id, new.name); END"
+    )
+    if not existed:
+        connection.exec_driver_sql("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+    return True
+
+
+def ensure_search_index() -> str:
+    """Pick the search backend for this database, creating SQLite FTS objects if needed."""
+    global _backend
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            installed = connection.execute(
+                text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            ).first()
+            _backend = BACKEND_PG_TRGM if installed else BACKEND_MEMORY
+        elif connection.dialect.name == "sqlite" and _setup_sqlite_fts(connection):
+            _backend = BACKEND_FTS5
+        else:
+            _backend = BACKEND_MEMORY
+    return _backend
+
+
+def get_backend() -> str:
+    return _backend or ensure_search_index()
+
+
+def _match_order(q: str):
+    """Exact name, then prefix, then any other match."""
+    name = func.lower(models.Product.name)
+    q_lower = q.lower()
+    return case((name == q_lower, 0), (name.startswith(q_lower, autoescape=True), 1), else_=2)
+
+
+def _name_candidates(db: Session, query, q: str, limit: int):
+    """Return [(product, similarity)] for the best ``limit`` products whose name matches ``q``."""
+    backend = get_backend()
+    substring = models.Product.name.icontains(q, autoescape=True)
+    q_grams = _trigrams(q)
+
+    if backend == BACKEND_PG_TRGM:
+        similarity = func.similarity(models.Product.name, q)
+        rows = query.add_columns(similarity).filter(
+            or_(substring, models.Product.name.op("%")(q))
+        ).order_by(similarity.desc()).limit(limit).all()
+        return [(product, float(score)) for product, score in rows]
+
+    if len(q) < 3:
+        # Shorter than a trigram, so neither index can help: a substring scan,
+        # shortest names first as they are the closest matches
+        products = query.filter(substring).order_by(
+            _match_order(q), func.length(models.Product.name), models.Product.id
+        ).limit(limit).all()
+    elif backend == BACKEND_FTS5:
+        # The trigram tokenizer turns a quoted phrase into an indexed substring match
+        match = '"' + q.replace('"', '""') + '"'
+        matches = text(
+            "SELECT rowid AS id, rank FROM products_fts WHERE products_fts MATCH :match"
+        ).bindparams(match=match).columns(id=Integer, rank=Float).subquery("fts")
+        # Filters apply before the limit; bm25 rank orders matches within a tier
+        products = query.join(matches, matches.c.id == models.Product.id).order_by(
+            _match_order(q), matches.c.rank, models.Product.id
+        ).limit(limit).all()
+    else:
+        trigram_index.sync(db)
+        scores = trigram_index.search(q)
+        products = []
+        # Best matches first, a chunk at a time, until enough pass the SQL filters
+        chunk_size = min(limit, _INDEX_CHUNK_SIZE)
+        for start in range(0, len(scores), chunk_size):
+            chunk = scores[start:start + chunk_size]
+            found = {
+                product.id: product
+                for product in query.filter(models.Product.id.in_([product_id for product_id, _ in chunk]))
+            }
+            products.extend(found[product_id] for product_id, _ in chunk if product_id in found)
+            if len(products) >= limit:
+                break
+        products = products[:limit]
+    return [(product, _similarity(q_grams, _trigrams(product.name))) for product in products]
+
+
+def search_products(
+    db: Session,
+    q: Optional[str] = None,
+    barcode_prefix: Optional[str] = None,
+    category: Optional[str] = None,
+    include_archived: bool = False,
+    limit: int = 50,
+):
+    """Return [(product, score)] best first."""
+    query = db.query(models.Product)
+    if not include_archived:
+        query = query.filter(models.Product.is_archived == False)
+    if category:
+        query = query.filter(models.Product.category == category)
+    if barcode_prefix:
+        query = query.filter(models.Product.barcode.startswith(barcode_prefix, autoescape=True))
+        if db.get_bind().dialect.name == "sqlite":
+            # SQLite LIKE is case-insensitive and skips the index; a BINARY range uses it
+            query = query.filter(
+                models.Product.barcode >= barcode_prefix,
+                models.Product.barcode < barcode_prefix + "\uffff",
+            )
+
+    if not q:
+        products = query.order_by(models.Product.barcode).limit(limit).all()
+        return [(product, 1.0) for product in products]
+
+    candidates = _name_candidates(db, query, q, limit * _CANDIDATE_FACTOR)
+    ranked = sorted(
+        ((product, _rank(product.name, q, similarity)) for product, similarity in candidates),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    return ranked[:limit]
@@ -0,0 +1,128 @@
+"""
+Single-flight coalescing for hot read endpoints.
+
+After each broadcast many clients request the same list within a few
+milliseconds. Endpoints route their query + serialization through
+``single_flight.do(key, produce)``: the first request for a key runs
+``produce`` and every identical request that arrives meanwhile waits for and
+shares its serialized bytes instead of running its own query.
+
+Keys combine the request's ETag (path, query string, Accept and the data
+versions behind the payload) with the caller's role, so a request never
+joins a computation for different data or a different authorization scope.
+Optionally the result is kept for ``SINGLEFLIGHT_WINDOW_SECONDS`` to absorb
+stragglers; the default of 0 disables that micro-cache.
+
+Endpoints run in the threadpool, so waiting uses threading primitives.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Hashable, Optional, Union
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from .config import settings
+
+# Prune expired micro-cache entries once it grows past this size
+_MAX_RECENT = 256
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self, window_seconds: float = 0.0) -> None:
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._inflight: dict[Hashable, _Call] = {}
+        self._recent: dict[Hashable, tuple[float, Any]] = {}
+        self.executions = 0
+        self.coalesced = 0
+        self.window_hits = 0
+
+    def do(self, key: Hashable, produce: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            recent = self._recent.get(key)
+            if recent is not None and recent[0] > now:
+                self.window_hits += 1
+                return recent[1]
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = produce()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+                if self.window_seconds and call.error is None:
+                    self._remember(key, call.result)
+            call.event.set()
+        return call.result
+
+    def _remember(self, key: Hashable, result: Any) -> None:
+        now = time.monotonic()
+        if len(self._recent) >= _MAX_RECENT:
+            self._recent = {k: v for k, v in self._recent.items() if v[0] > now}
+        self._recent[key] = (now + self.window_seconds, result)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "window_hits": self.window_hits,
+                "in_flight": len(self._inflight),
+                "window_seconds": self.window_seconds,
+            }
+
+
+single_flight = SingleFlight(window_seconds=settings.SINGLEFLIGHT_WINDOW_SECONDS)
+
+_adapters: dict[Any, TypeAdapter] = {}
+
+
+def serialize_rows(schema: Any, rows: Any) -> bytes:
+    """Validate ORM rows against ``schema`` (e.g. ``List[schemas.Product]``) and dump JSON bytes."""
+    adapter = _adapters.get(schema)
+    if adapter is None:
+        adapter = _adapters[schema] = TypeAdapter(schema)
+    return adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+
+def coalesced_json(
+    key: Hashable,
+    produce: Callable[[], Union[bytes, tuple[bytes, dict[str, str]]]],
+    headers: dict[str, str],
+) -> Response:
+    """``produce`` returns the JSON body, or the body plus headers derived from it (shared too)."""
+    result = single_flight.do(key, produce)
+    if isinstance(result, tuple):
+        body, extra_headers = result
+        headers = {**headers, **extra_headers}
+    else:
+        body = result
+    return Response(content=body, media_type="application/json", headers=headers)
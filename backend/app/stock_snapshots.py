@@ -0,0 +1,376 @@
+"""
+Point-in-time inventory reconstruction.
+
+Every flush that creates, deletes, or changes the quantity or price of a
+product appends a row to ``stock_movements`` in the same transaction, so the
+log covers approvals, direct edits and imports alike. Periodically a compact
+snapshot of every product's quantity and price is copied into
+``inventory_snapshot_items`` with one ``INSERT ... SELECT``.
+
+Quantities are base plus pending quantity-ledger deltas: ledger approvals
+log their own movement, and folding deltas into the product row logs none
+(see quantity_ledger.py).
+
+``inventory_as_of(ts)`` starts from the newest snapshot taken at or before
+``ts`` and applies only the movements the snapshot did not see, aggregated per
+product in SQL.
+
+Which movements a snapshot saw:
+
+- SQLite: writers hold the database lock from their first write to commit,
+  so a movement that was still uncommitted during the copy always gets a
+  higher ID than ``last_movement_id``.
+- PostgreSQL: IDs come from a sequence before commit, so a transaction that
+  was open during the copy can commit a lower ID afterwards. Each movement
+  records its transaction ID, and the snapshot records its own visibility
+  (``txid_current_snapshot()``). Replay adds the movements that snapshot could
+  not see, whatever their ID. The copy runs in a REPEATABLE READ transaction
+  so the product rows and the visibility match.
+
+Snapshots are taken by a background thread in each worker (the first worker
+to find one due takes it) or by running ``python -m app.stock_snapshots``
+from cron with ``INVENTORY_SNAPSHOT_INTERVAL_SECONDS=0``.
+"""
+from __future__ import annotations
+
+import datetime
+import logging
+import threading
+from typing import Optional
+
+from sqlalchemy import and_, case, event, func, insert, inspect, literal, or_, select, text
+from sqlalchemy.orm import Session
+
+from . import models, quantity_ledger
+from .config import settings
+from .database import SessionLocal, engine
+
+logger = logging.getLogger(__name__)
+
+# IN-list size when resolving the latest movement per product
+_CHUNK_SIZE = 500
+# Upper bound on how long a due snapshot waits for the scheduler to notice it
+_MAX_CHECK_SECONDS = 300
+# Arbitrary key for the PostgreSQL advisory lock that serializes snapshot jobs
+_SNAPSHOT_LOCK_KEY = 72_410_042
+
+
+def _stock_changed(product: models.Product) -> bool:
+    state = inspect(product)
+    return state.attrs.quantity.history.has_changes() or state.attrs.price.history.has_changes()
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_stock_movements(session: Session, flush_context, instances) -> None:
+    new = [obj for obj in session.new if isinstance(obj, models.Product)]
+    # Products whose pending deltas were folded or discarded count even when
+    # the quantity ends up unchanged
+    taken = session.info.get("ledger_taken", {})
+    changed = [
+        obj for obj in session.dirty
+        if isinstance(obj, models.Product) and (_stock_changed(obj) or obj.id in taken)
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, models.Product)]
+    if not (new or changed or deleted):
+        return
+
+    # Committed quantities, since attribute history is empty when the old value was never loaded
+    ids = [obj.id for obj in changed + deleted if obj.id is not None]
+    committed = dict(
+        session.connection().execute(
+            select(models.Product.id, models.Product.quantity).where(models.Product.id.in_(ids))
+        ).all()
+    ) if ids else {}
+
+    # Pending ledger deltas leave with the product
+    deleted_ids = [obj.id for obj in deleted if obj.id is not None]
+    discarded = quantity_ledger.take_pending(session.connection(), deleted_ids) if deleted_ids else {}
+
+    pending = session.info.setdefault("stock_movements", [])
+    for obj in new:
+        pending.append((obj, obj.quantity or 0, False))
+    for obj in changed:
+        delta = obj.quantity - committed.get(obj.id, obj.quantity) - quantity_ledger.pop_taken(session, obj.id)
+        # A fold alone moves quantity from the ledger to the row
+        if delta or inspect(obj).attrs.price.history.has_changes():
+            pending.append((obj, delta, False))
+    for obj in deleted:
+        delta = -committed.get(obj.id, 0) - discarded.get(obj.id, 0) - quantity_ledger.pop_taken(session, obj.id)
+        pending.append((obj, delta, True))
+
+
+def _postgresql(connection) -> bool:
+    return connection.dialect.name == "postgresql"
+
+
+@event.listens_for(Session, "after_flush")
+def _write_stock_movements(session: Session, flush_context) -> None:
+    # After the flush new products have their IDs
+    pending = session.info.pop("stock_movements", None)
+    if not pending:
+        return
+    now = datetime.datetime.utcnow()
+    connection = session.connection()
+    stmt = insert(models.StockMovement.__table__)
+    if _postgresql(connection):
+        stmt = stmt.values(txid=func.txid_current())
+    connection.execute(
+        stmt,
+        [
+            {
+                "product_id": obj.id,
+                "quantity_delta": delta,
+                "price": obj.price,
+                "deleted": deleted,
+                "created_at": now,
+            }
+            for obj, delta, deleted in pending
+        ],
+    )
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_stock_movements(session: Session) -> None:
+    session.info.pop("stock_movements", None)
+    session.info.pop("ledger_taken", None)
+
+
+@event.listens_for(Session, "after_commit")
+def _clear_ledger_taken(session: Session) -> None:
+    session.info.pop("ledger_taken", None)
+
+
+def log_ledger_write(connection, product: models.Product, delta: int) -> None:
+    """Movement for a quantity-ledger write, which changes no product row for the flush hooks to see."""
+    stmt = insert(models.StockMovement.__table__)
+    if _postgresql(connection):
+        stmt = stmt.values(txid=func.txid_current())
+    connection.execute(stmt, {
+        "product_id": product.id,
+        "quantity_delta": delta,
+        "price": product.price,
+        "deleted": False,
+        "created_at": datetime.datetime.utcnow(),
+    })
+
+
+def log_deleted_products(connection, product_ids: list[int]) -> None:
+    """
+    Movements for products about to be removed by a set-based DELETE, which
+    the flush hooks cannot see. Their pending ledger deltas are dropped and
+    counted in the movement.
+    """
+    product = models.Product.__table__
+    quantity = product.c.quantity
+    discarded = quantity_ledger.take_pending(connection, product_ids)
+    if discarded:
+        quantity = quantity + case(discarded, value=product.c.id, else_=0)
+    columns = ["product_id", "quantity_delta", "price", "deleted", "created_at"]
+    values = [
+        product.c.id,
+        -quantity,
+        product.c.price,
+        literal(True),
+        literal(datetime.datetime.utcnow()),
+    ]
+    if _postgresql(connection):
+        columns.append("txid")
+        values.append(func.txid_current())
+    connection.execute(
+        insert(models.StockMovement.__table__).from_select(
+            columns, select(*values).where(product.c.id.in_(product_ids))
+        )
+    )
+
+
+def take_snapshot() -> Optional[models.InventorySnapshot]:
+    """
+    Copy every product's quantity and price into a new snapshot. Returns None
+    when another worker is taking one at the same moment (PostgreSQL only).
+    """
+    if engine.dialect.name == "postgresql":
+        # A session of its own: the isolation level must be set before its transaction begins
+        db = SessionLocal(bind=engine.execution_options(isolation_level="REPEATABLE READ"))
+    else:
+        db = SessionLocal()
+    try:
+        return _copy_inventory(db)
+    finally:
+        db.close()
+
+
+def _copy_inventory(db: Session) -> Optional[models.InventorySnapshot]:
+    visibility = visibility_xmin = None
+    if _postgresql(db.connection()):
+        # The first statement fixes the transaction's view of products and movements
+        if not db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _SNAPSHOT_LOCK_KEY}).scalar():
+            db.rollback()
+            return None
+        visibility, visibility_xmin = db.execute(
+            text("SELECT txid_current_snapshot()::text, txid_snapshot_xmin(txid_current_snapshot())")
+        ).one()
+
+    last_movement_id = db.query(func.coalesce(func.max(models.StockMovement.id), 0)).scalar()
+    # Base plus pending ledger deltas, matching the movements
+    quantity = quantity_ledger.available_quantity_column()
+    product_count, total_quantity, total_value = db.query(
+        func.count(models.Product.id),
+        func.coalesce(func.sum(quantity), 0),
+        func.coalesce(func.sum(quantity * models.Product.price), 0.0),
+    ).one()
+    snapshot = models.InventorySnapshot(
+        taken_at=datetime.datetime.utcnow(),
+        last_movement_id=last_movement_id,
+        visibility=visibility,
+        visibility_xmin=visibility_xmin,
+        product_count=product_count,
+        total_quantity=total_quantity,
+        total_value=total_value,
+    )
+    db.add(snapshot)
+    db.flush()
+
+    items = models.InventorySnapshotItem.__table__
+    db.execute(
+        insert(items).from_select(
+            ["snapshot_id", "product_id", "quantity", "price"],
+            select(literal(snapshot.id), models.Product.id, quantity, models.Product.price),
+        )
+    )
+    db.commit()
+    db.refresh(snapshot)
+    return snapshot
+
+
+def snapshot_due(db: Session, interval_seconds: float) -> bool:
+    latest = db.query(func.max(models.InventorySnapshot.taken_at)).scalar()
+    if latest is None:
+        return True
+    return latest <= datetime.datetime.utcnow() - datetime.timedelta(seconds=interval_seconds)
+
+
+def run_due_snapshot(interval_seconds: float) -> None:
+    db = SessionLocal()
+    try:
+        due = snapshot_due(db, interval_seconds)
+    finally:
+        db.close()
+    if due:
+        take_snapshot()
+
+
+def ensure_inventory_snapshot() -> None:
+    """Take the baseline snapshot on startup; movements are only logged from then on."""
+    db = SessionLocal()
+    try:
+        missing = db.query(models.InventorySnapshot.id).first() is None
+    finally:
+        db.close()
+    if missing:
+        take_snapshot()
+
+
+_stop = threading.Event()
+
+
+def _scheduler_loop(interval_seconds: float) -> None:
+    while not _stop.wait(min(interval_seconds, _MAX_CHECK_SECONDS)):
+        try:
+            run_due_snapshot(interval_seconds)
+        except Exception:
+            logger.exception("Scheduled inventory snapshot failed")
+
+
+def start_snapshot_scheduler() -> None:
+    interval = settings.INVENTORY_SNAPSHOT_INTERVAL_SECONDS
+    if interval <= 0:
+        return
+    _stop.clear()
+    threading.Thread(
+        target=_scheduler_loop, args=(interval,), name="inventory-snapshots", daemon=True
+    ).start()
+
+
+def stop_snapshot_scheduler() -> None:
+    _stop.set()
+
+
+def inventory_as_of(db: Session, ts: datetime.datetime) -> Optional[dict]:
+    """
+    Every product's quantity and price at ``ts`` (naive UTC), or None when
+    ``ts`` predates the first snapshot.
+    """
+    snapshot = db.query(models.InventorySnapshot).filter(
+        models.InventorySnapshot.taken_at <= ts
+    ).order_by(models.InventorySnapshot.taken_at.desc(), models.InventorySnapshot.id.desc()).first()
+    if snapshot is None:
+        return None
+
+    state = {
+        product_id: [quantity, price]
+        for product_id, quantity, price in db.query(
+            models.InventorySnapshotItem.product_id,
+            models.InventorySnapshotItem.quantity,
+            models.InventorySnapshotItem.price,
+        ).filter(models.InventorySnapshotItem.snapshot_id == snapshot.id)
+    }
+
+    movement = models.StockMovement
+    unseen = movement.id > snapshot.last_movement_id
+    if snapshot.visibility is not None:
+        # Lower IDs from transactions that were still open during the copy
+        unseen = or_(unseen, and_(
+            movement.txid >= snapshot.visibility_xmin,
+            text(
+                "NOT txid_visible_in_snapshot(stock_movements.txid, CAST(:visibility AS txid_snapshot))"
+            ).bindparams(visibility=snapshot.visibility),
+        ))
+    deltas = db.query(
+        movement.product_id, func.sum(movement.quantity_delta), func.max(movement.id)
+    ).filter(unseen, movement.created_at <= ts).group_by(movement.product_id).all()
+
+    # The newest movement per product carries its price and whether it was deleted
+    latest_ids = [latest_id for _, _, latest_id in deltas]
+    latest = {}
+    for start in range(0, len(latest_ids), _CHUNK_SIZE):
+        chunk = latest_ids[start:start + _CHUNK_SIZE]
+        for row in db.query(movement.id, movement.price, movement.deleted).filter(movement.id.in_(chunk)):
+            latest[row.id] = row
+    for product_id, delta, latest_id in deltas:
+        last = latest[latest_id]
+        if last.deleted:
+            state.pop(product_id, None)
+            continue
+        quantity = state.get(product_id, [0, None])[0] + (delta or 0)
+        state[product_id] = [quantity, last.price]
+
+    names = {
+        row.id: row
+        for row in db.query(models.Product.id, models.Product.barcode, models.Product.name)
+    }
+    items = []
+    for product_id in sorted(state):
+        quantity, price = state[product_id]
+        current = names.get(product_id)
+        items.append({
+            "product_id": product_id,
+            "barcode": current.barcode if current else None,
+            "name": current.name if current else None,
+            "quantity": quantity,
+            "price": price,
+            "value": quantity * (price or 0.0),
+        })
+    return {
+        "as_of": ts,
+        "snapshot_taken_at": snapshot.taken_at,
+        "product_count": len(items),
+        "total_quantity": sum(item["quantity"] for item in items),
+        "total_value": sum(item["value"] for item in items),
+        "items": items,
+    }
+
+
+if __name__ == "__main__":
+    # Cron entry point: python -m app.stock_snapshots
+    taken = take_snapshot()
+    print(f"Inventory snapshot {taken.id} taken at {taken.taken_at}" if taken else "Snapshot already running")
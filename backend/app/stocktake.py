@@ -0,0 +1,250 @@
+"""
+Stocktake (cycle count) sessions.
+
+Counts arrive in bulk, as JSON or an uploaded sheet. Each batch is joined to
+the products' current quantities in a single pandas pass. In that pass:
+
+- duplicate barcodes in a batch are summed (one product counted in several places)
+- unknown barcodes are reported back
+- the variance (counted minus the system quantity at the moment of counting)
+  is stored per product
+
+A later count of the same product in the same session replaces the earlier one.
+
+Applying a session adds each selected line's variance to its product in one
+transaction, so sales approved between counting and applying are kept. Each
+adjusted product gets one compact ``update`` history row, and the whole
+session is announced with a single ``stocktake.applied`` event.
+"""
+from __future__ import annotations
+
+import datetime
+import io
+from typing import Iterable, Optional
+
+import pandas as pd
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import crud, models, quantity_ledger
+from .events import hub
+
+# IN-list size when resolving barcodes and locking products
+_CHUNK_SIZE = 500
+
+SHEET_EXTENSIONS = (".xlsx", ".xls", ".csv")
+
+
+def create_session(db: Session, user: models.User, note: Optional[str] = None) -> models.StocktakeSession:
+    session = models.StocktakeSession(note=note, created_by_id=user.id)
+    db.add(session)
+    db.commit()
+    db.refresh(session)
+    return session
+
+
+def _open_session(db: Session, session_id: int, lock: bool = False) -> models.StocktakeSession:
+    query = db.query(models.StocktakeSession).filter(models.StocktakeSession.id == session_id)
+    if lock:
+        query = query.with_for_update()
+    session = query.first()
+    if session is None:
+        raise LookupError("Stocktake not found")
+    if session.status != models.StocktakeStatus.open:
+        raise ValueError(f"Stocktake is already {session.status.value}.")
+    return session
+
+
+def _stock_for_barcodes(db: Session, barcodes: list[str]) -> pd.DataFrame:
+    product = models.Product
+    rows = []
+    for start in range(0, len(barcodes), _CHUNK_SIZE):
+        chunk = barcodes[start:start + _CHUNK_SIZE]
+        rows.extend(db.query(product.barcode, product.id, quantity_ledger.available_quantity_column()).filter(product.barcode.in_(chunk)).all())
+    return pd.DataFrame(rows, columns=["barcode", "product_id", "system_quantity"])
+
+
+def record_counts(db: Session, session_id: int, counts: Iterable[tuple[str, int]]) -> dict:
+    """Store counted quantities for a session; returns how many products were recorded and the unknown barcodes."""
+    _open_session(db, session_id)
+    frame = pd.DataFrame(list(counts), columns=["barcode", "counted_quantity"])
+    if frame.empty:
+        return {"recorded": 0, "unknown": []}
+    frame["barcode"] = frame["barcode"].astype(str).str.strip()
+    frame = frame.groupby("barcode", as_index=False, sort=False)["counted_quantity"].sum()
+
+    merged = frame.merge(_stock_for_barcodes(db, frame["barcode"].tolist()), on="barcode", how="left")
+    found = merged["product_id"].notna()
+    known = merged[found].astype({"product_id": "int64", "system_quantity": "int64"})
+    known = known.assign(variance=known["counted_quantity"] - known["system_quantity"])
+
+    if not known.empty:
+        table = models.StocktakeCount.__table__
+        connection = db.connection()
+        dialect_insert = postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.session_id, table.c.product_id],
+            set_={
+                name: stmt.excluded[name]
+                for name in ("counted_quantity", "system_quantity", "variance", "counted_at")
+            },
+        )
+        now = datetime.datetime.utcnow()
+        connection.execute(stmt, [
+            {
+                "session_id": session_id,
+                "product_id": product_id,
+                "counted_quantity": counted,
+                "system_quantity": system,
+                "variance": variance,
+                "counted_at": now,
+                "applied": False,
+            }
+            for product_id, counted, system, variance in zip(
+                known["product_id"].tolist(),
+                known["counted_quantity"].tolist(),
+                known["system_quantity"].tolist(),
+                known["variance"].tolist(),
+            )
+        ])
+    db.commit()
+    return {"recorded": len(known), "unknown": merged.loc[~found, "barcode"].tolist()}
+
+
+def read_counts_sheet(contents: bytes, filename: str) -> list[tuple[str, int]]:
+    """(barcode, counted quantity) pairs from an Excel or CSV sheet with barcode and count columns."""
+    if filename.lower().endswith(".csv"):
+        df = pd.read_csv(io.BytesIO(contents), dtype=str)
+    else:
+        df = pd.read_excel(io.BytesIO(contents), dtype=str)
+    df.columns = df.columns.astype(str).str.strip().str.lower()
+
+    barcode_column = next((col for col in df.columns if "barcode" in col or "code" in col), None)
+    count_column = next(
+        (col for col in df.columns if any(word in col for word in ("count", "quantity", "qty", "stock"))),
+        None,
+    )
+    if barcode_column is None or count_column is None:
+        raise ValueError(f"Could not detect barcode and count columns. Available columns: {list(df.columns)}")
+
+    df = df[[barcode_column, count_column]].dropna()
+    counted = pd.to_numeric(df[count_column], errors="coerce")
+    invalid = counted.isna() | (counted < 0) | (counted % 1 != 0)
+    if invalid.any():
+        # +2 for the header row and 1-based sheet rows
+        rows = (df.index[invalid] + 2).tolist()
+        raise ValueError(f"Counts must be whole numbers of at least 0 (rows {rows}).")
+    return list(zip(df[barcode_column].tolist(), counted.astype("int64").tolist()))
+
+
+def variance_report(db: Session, session_id: int) -> Optional[dict]:
+    session = db.query(models.StocktakeSession).filter(models.StocktakeSession.id == session_id).first()
+    if session is None:
+        return None
+    count = models.StocktakeCount
+    product = models.Product
+    rows = db.query(
+        count.product_id,
+        product.barcode,
+        product.name,
+        count.counted_quantity,
+        count.system_quantity,
+        count.variance,
+        (count.variance * product.price).label("value_variance"),
+        count.counted_at,
+        count.applied,
+    ).outerjoin(product, product.id == count.product_id).filter(
+        count.session_id == session_id
+    ).order_by(count.product_id).all()
+
+    lines = [row._asdict() for row in rows]
+    return {
+        "session": session,
+        "counted_lines": len(lines),
+        "variance_lines": sum(1 for line in lines if line["variance"]),
+        "units_over": sum(line["variance"] for line in lines if line["variance"] > 0),
+        "units_short": -sum(line["variance"] for line in lines if line["variance"] < 0),
+        "value_variance": float(sum(line["value_variance"] or 0.0 for line in lines)),
+        "lines": lines,
+    }
+
+
+def apply_session(db: Session, session_id: int, user: models.User, product_ids: Optional[list[int]] = None) -> dict:
+    """
+    Apply the session's variances (only those for ``product_ids`` when given)
+    in one transaction and close it. Lines that were not selected stay
+    unapplied.
+    """
+    session = _open_session(db, session_id, lock=True)
+    count = models.StocktakeCount
+    query = db.query(count).filter(count.session_id == session_id, count.variance != 0)
+    if product_ids is not None:
+        query = query.filter(count.product_id.in_(set(product_ids)))
+    lines = {line.product_id: line for line in query}
+    if product_ids is not None:
+        missing = set(product_ids) - lines.keys()
+        if missing:
+            raise ValueError(f"No variance counted for products {sorted(missing)}.")
+
+    ids = sorted(lines)
+    # Variances are relative, so pending ledger deltas must be in the base first
+    quantity_ledger.fold_pending(db, ids)
+    products = {}
+    for start in range(0, len(ids), _CHUNK_SIZE):
+        chunk = ids[start:start + _CHUNK_SIZE]
+        # Lock so concurrent approvals wait rather than interleave (no-op on SQLite)
+        for product in db.query(models.Product).filter(models.Product.id.in_(chunk)).with_for_update():
+            products[product.id] = product
+
+    usernames = crud.history_snapshot(db, None, session.created_by_id, user.id)
+    entries = []
+    for product_id in ids:
+        product = products.get(product_id)
+        if product is None:
+            # Deleted since it was counted
+            continue
+        line = lines[product_id]
+        if product.quantity + line.variance < 0:
+            raise ValueError(f"Adjusting {product.barcode} by {line.variance} would make its quantity negative.")
+        product.quantity += line.variance
+        line.applied = True
+        entries.append(models.ChangeHistory(
+            product_id=product_id,
+            quantity_change=line.variance,
+            action=models.ChangeRequestAction.update,
+            status=models.ChangeRequestStatus.approved,
+            requester_id=session.created_by_id,
+            reviewer_id=user.id,
+            **{**usernames, "unit_price": product.price, "product_name": product.name, "barcode": product.barcode},
+        ))
+    db.add_all(entries)
+    session.status = models.StocktakeStatus.applied
+    session.applied_by_id = user.id
+    session.applied_at = datetime.datetime.utcnow()
+    db.flush()
+    adjusted = [entry.product_id for entry in entries]
+    history_ids = [entry.id for entry in entries]
+    db.commit()
+
+    # One event for the whole session; clients refetch the listed products
+    hub.publish_from_thread({
+        "type": "stocktake.applied",
+        "stocktake_id": session_id,
+        "product_ids": adjusted,
+        "history_ids": history_ids,
+    })
+    return {
+        "stocktake_id": session_id,
+        "adjusted": len(adjusted),
+        "skipped": sorted(set(ids) - set(adjusted)),
+        "history_ids": history_ids,
+    }
+
+
+def cancel_session(db: Session, session_id: int) -> models.StocktakeSession:
+    session = _open_session(db, session_id, lock=True)
+    session.status = models.StocktakeStatus.cancelled
+    db.commit()
+    db.refresh(session)
+    return session
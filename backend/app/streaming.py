@@ -0,0 +1,53 @@
+"""
+NDJSON streaming for large list endpoints.
+
+When a client sends ``Accept: application/x-ndjson`` the list is written one
+JSON object per line while the query is still being read, using
+``yield_per`` (a server-side cursor on PostgreSQL) so memory stays flat no
+matter how many rows are requested.
+
+FastAPI closes ``get_db`` sessions before a streaming body is sent, so the
+generator opens and closes its own session.
+"""
+from typing import Callable, Iterator
+
+import orjson
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Query, Session
+
+from .database import SessionLocal
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_BATCH_SIZE = 500
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def ndjson_response(
+    build_query: Callable[[Session], Query],
+    skip: int,
+    limit: int,
+    headers: dict[str, str] | None = None,
+) -> StreamingResponse:
+    """Stream ``build_query(db)[skip:skip + limit]`` as NDJSON, one row mapping per line."""
+
+    def generate() -> Iterator[bytes]:
+        db = SessionLocal()
+        try:
+            query = build_query(db).offset(skip).limit(limit).yield_per(STREAM_BATCH_SIZE)
+            lines = []
+            for row in query:
+                lines.append(orjson.dumps(row._asdict()))
+                # One chunk per fetched batch keeps per-message overhead low
+                if len(lines) >= STREAM_BATCH_SIZE:
+                    yield b"\n".join(lines) + b"\n"
+                    lines = []
+            if lines:
+                yield b"\n".join(lines) + b"\n"
+        finally:
+            db.close()
+
+    return StreamingResponse(generate(), media_type=NDJSON_MEDIA_TYPE, headers=headers)
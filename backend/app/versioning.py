@@ -0,0 +1,220 @@
+"""
+Data versions for delta sync and conditional GETs.
+
+Every transaction that writes rows of a tracked model bumps that resource
+family's counter in ``sync_counters``. Products additionally get a fresh
+version stamped on each written row (or on a tombstone for deletes).
+
+Flushes only note what was written. The counters are bumped and the versions
+stamped just before commit, so a counter row is locked from that point until
+the commit finishes rather than for the whole transaction. Because it stays
+locked through the commit, versions still become visible in order: a client
+polling ``/api/products/changes?since=<version>`` never skips a write, and an
+ETag built from the counters changes whenever the data behind it does.
+
+The hooks run on every ORM session, so crud functions, routers and imports
+are all covered without each of them remembering to bump a version.
+Set-based writes that bypass the ORM report their products with
+``record_product_writes`` and ``record_product_deletes``.
+
+Quantity-ledger writes (quantity_ledger.py) leave the product row alone.
+They bump one of the ``products.ledger.<slot>`` counters instead, so
+concurrent sales only meet when they pick the same slot. Conditional GETs
+include the sum of these counters in the products version. The product gets
+a new row version when its deltas are folded.
+"""
+import datetime
+
+from sqlalchemy import event, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+
+PRODUCTS_COUNTER = "products"
+HISTORY_COUNTER = "history"
+USERS_COUNTER = "users"
+REQUESTS_COUNTER = "requests"
+# Prefix of the per-slot counters bumped by quantity-ledger writes; their sum
+# is reported under this name next to the products counter
+LEDGER_COUNTER = "products.ledger"
+
+# Model -> resource family whose counter its writes bump
+_FAMILIES = {
+    models.Product: PRODUCTS_COUNTER,
+    models.ChangeHistory: HISTORY_COUNTER,
+    models.User: USERS_COUNTER,
+    models.ChangeRequest: REQUESTS_COUNTER,
+}
+
+# Keeps IN lists well under SQLite's bound-parameter limit
+_CHUNK_SIZE = 500
+
+
+def reserve_versions(connection, name: str, count: int) -> int:
+    """Advance counter ``name`` by ``count`` and return the first reserved value."""
+    counter = models.SyncCounter.__table__
+    result = connection.execute(
+        update(counter)
+        .where(counter.c.name == name)
+        .values(value=counter.c.value + count)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(counter).values(name=name, value=count))
+    last = connection.execute(select(counter.c.value).where(counter.c.name == name)).scalar_one()
+    return last - count + 1
+
+
+def set_counter(connection, name: str, value: int) -> None:
+    """Overwrite counter ``name``; for watermarks rather than versions."""
+    counter = models.SyncCounter.__table__
+    result = connection.execute(update(counter).where(counter.c.name == name).values(value=value))
+    if result.rowcount == 0:
+        connection.execute(insert(counter).values(name=name, value=value))
+
+
+def current_version(db: Session, name: str = PRODUCTS_COUNTER) -> int:
+    value = db.query(models.SyncCounter.value).filter(models.SyncCounter.name == name).scalar()
+    return value or 0
+
+
+def current_versions(db: Session, names) -> dict[str, int]:
+    """
+    Read several counters in one query. Asking for the products counter also
+    returns the summed ledger counters under ``LEDGER_COUNTER``.
+    """
+    names = list(names)
+    counter = models.SyncCounter
+    condition = counter.name.in_(names)
+    if PRODUCTS_COUNTER in names:
+        condition = or_(condition, counter.name.like(f"{LEDGER_COUNTER}.%"))
+    found = {name: 0 for name in names}
+    if PRODUCTS_COUNTER in names:
+        found[LEDGER_COUNTER] = 0
+    for name, value in db.query(counter.name, counter.value).filter(condition):
+        if name.startswith(f"{LEDGER_COUNTER}."):
+            found[LEDGER_COUNTER] += value
+        else:
+            found[name] = value
+    return found
+
+
+def ledger_version(db: Session) -> int:
+    """Sum of the ledger counters; it grows with every committed ledger write."""
+    return current_versions(db, [PRODUCTS_COUNTER])[LEDGER_COUNTER]
+
+
+def _pending(session: Session) -> dict:
+    return session.info.setdefault(
+        "sync_versions", {"families": set(), "written": set(), "new": [], "removed": {}}
+    )
+
+
+def record_product_writes(session: Session, product_ids) -> None:
+    """Stamp ``product_ids`` with fresh versions when ``session`` commits."""
+    pending = _pending(session)
+    pending["families"].add(PRODUCTS_COUNTER)
+    pending["written"].update(product_ids)
+
+
+def record_ledger_write(session: Session, slot: int) -> None:
+    """Bump ledger counter ``slot`` when ``session`` commits; the product row is not touched."""
+    _pending(session)["families"].add(f"{LEDGER_COUNTER}.{slot}")
+
+
+def record_product_deletes(session: Session, rows) -> None:
+    """Record tombstones for deleted products (``id``, ``barcode`` rows) when ``session`` commits."""
+    pending = _pending(session)
+    pending["families"].add(PRODUCTS_COUNTER)
+    pending["removed"].update((row.id, row.barcode) for row in rows)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_writes(session: Session, flush_context, instances) -> None:
+    families = set()
+    new_products, written, removed = [], [], []
+    for obj in session.new:
+        family = _FAMILIES.get(type(obj))
+        if family:
+            families.add(family)
+            if family == PRODUCTS_COUNTER:
+                new_products.append(obj)
+    for obj in session.dirty:
+        family = _FAMILIES.get(type(obj))
+        if family and session.is_modified(obj, include_collections=False):
+            families.add(family)
+            if family == PRODUCTS_COUNTER:
+                written.append(obj.id)
+    for obj in session.deleted:
+        family = _FAMILIES.get(type(obj))
+        if family:
+            families.add(family)
+            if family == PRODUCTS_COUNTER:
+                removed.append(obj)
+    if not families:
+        return
+    pending = _pending(session)
+    pending["families"].update(families)
+    # New products get their IDs during the flush; read them at commit
+    pending["new"].extend(new_products)
+    pending["written"].update(written)
+    pending["removed"].update((obj.id, obj.barcode) for obj in removed)
+
+
+def _stamp_products(connection, ids: list[int], first_version: int, now: datetime.datetime) -> None:
+    products = models.Product.__table__
+    for start in range(0, len(ids), _CHUNK_SIZE):
+        chunk = ids[start:start + _CHUNK_SIZE]
+        # Distinct, ordered versions so delta sync can page through them
+        ranked = select(
+            products.c.id,
+            (func.row_number().over(order_by=products.c.id) + (first_version + start - 1)).label("version"),
+        ).where(products.c.id.in_(chunk)).subquery()
+        connection.execute(
+            update(products)
+            .where(products.c.id == ranked.c.id)
+            .values(row_version=ranked.c.version, updated_at=now)
+        )
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_versions(session: Session) -> None:
+    # Commit flushes after this hook; flush first so every write is collected
+    session.flush()
+    pending = session.info.pop("sync_versions", None)
+    if not pending:
+        return
+
+    connection = session.connection()
+    removed = pending["removed"]
+    written = sorted(
+        ({obj.id for obj in pending["new"]} | pending["written"]) - set(removed)
+    )
+    # Rows before counters: writers that update a product through the ORM
+    # already hold its row when they get here
+    for start in range(0, len(written), _CHUNK_SIZE):
+        connection.execute(
+            select(models.Product.id)
+            .where(models.Product.id.in_(written[start:start + _CHUNK_SIZE]))
+            .order_by(models.Product.id)
+            .with_for_update()
+        )
+    # Lock counters in a fixed order so concurrent writers cannot deadlock
+    for family in sorted(pending["families"]):
+        if family != PRODUCTS_COUNTER:
+            reserve_versions(connection, family, 1)
+            continue
+        version = reserve_versions(connection, family, max(len(written) + len(removed), 1))
+        # Naive UTC, like the columns
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        _stamp_products(connection, written, version, now)
+        version += len(written)
+        if removed:
+            connection.execute(insert(models.ProductTombstone.__table__), [
+                {"product_id": product_id, "barcode": barcode, "row_version": version + index, "deleted_at": now}
+                for index, (product_id, barcode) in enumerate(sorted(removed.items()))
+            ])
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_versions(session: Session) -> None:
+    session.info.pop("sync_versions", None)
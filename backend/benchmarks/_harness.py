@@ -0,0 +1,91 @@
+"""
+Shared setup for the benchmarks.
+
+The app reads its settings at import, so a benchmark calls ``configure``
+before anything imports ``app``, and compares settings by running each
+variant in its own process with ``run_variant``. Without ``DATABASE_URL``
+every process gets a throwaway SQLite database. SQLite runs one writer at a
+time, so point ``DATABASE_URL`` at PostgreSQL to measure lock contention.
+"""
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+_BACKEND = Path(__file__).resolve().parents[1]
+
+
+def configure(**env) -> None:
+    os.environ.update({name: str(value) for name, value in env.items()})
+    if not os.environ.get("DATABASE_URL"):
+        os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='bstock-bench-')}/bench.db"
+    os.environ.setdefault("SECRET_KEY", "bench-secret-key")
+    sys.path.insert(0, str(_BACKEND))
+
+
+@contextmanager
+def app_client():
+    """A TestClient logged in as the master account, with the startup hooks run."""
+    from fastapi.testclient import TestClient
+
+    from app.config import settings
+    from app.main import app
+
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/token", data={"username": settings.MASTER_USERNAME, "password": settings.MASTER_PASSWORD}
+        )
+        response.raise_for_status()
+        client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+        yield client
+
+
+def create_products(client, quantities, category: str = "Bench", names=None) -> list[dict]:
+    tag = uuid.uuid4().hex[:8]
+    response = client.post("/api/products/", json=[
+        {
+            "barcode": f"{tag}-{index}",
+            "name": names[index] if names else f"{tag}-{index}",
+            "price": 2.0,
+            "quantity": quantity,
+            "category": category,
+        }
+        for index, quantity in enumerate(quantities)
+    ])
+    response.raise_for_status()
+    return response.json()
+
+
+def run_variant(module: str, env: dict, args: list[str]) -> dict:
+    """Run ``module`` in a child process with ``env`` added; it prints one JSON result line."""
+    completed = subprocess.run(
+        [sys.executable, "-m", module, "--child", *args],
+        cwd=_BACKEND,
+        env={**os.environ, **{name: str(value) for name, value in env.items()}},
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"{module} {env} failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def timing_summary(samples: list[float]) -> dict:
+    """p50/p95/max of ``samples`` (seconds) in milliseconds."""
+    return {
+        "p50_ms": round(percentile(samples, 0.5) * 1000, 2),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2),
+    }
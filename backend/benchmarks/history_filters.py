@@ -0,0 +1,160 @@
+"""
+History filter benchmark on a multi-million-row ``change_history``.
+
+Answers "sales by one clerk last week" three ways:
+
+* the old way: page through ``/api/history/sales`` with ``skip`` until the
+  rows are older than a week and filter in the client;
+* with ``requester_id``/``start`` filters and cursor paging, as now;
+* the same, with the filter indexes of ``20261019_history_filter_indexes``
+  dropped, to show what they carry.
+
+Then times one deep page reached with ``skip`` against the same page reached
+with a cursor.
+
+    cd backend
+    python -m benchmarks.history_filters --rows 2000000
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import random
+import time
+
+from ._harness import app_client, configure
+
+CLERKS = 20
+PAGE = 1000
+# Added by the 20261019_history_filter_indexes migration
+FILTER_INDEXES = (
+    "ix_change_history_timestamp_id",
+    "ix_change_history_action_timestamp",
+    "ix_change_history_product_id",
+    "ix_change_history_requester_id",
+    "ix_change_history_reviewer_id",
+    "ix_change_history_buyer_name",
+    "ix_change_history_barcode",
+)
+
+
+def _seed(rows: int, rng: random.Random, now: datetime.datetime) -> list[int]:
+    from sqlalchemy import insert, select
+
+    from app import models
+    from app.database import engine
+
+    with engine.begin() as connection:
+        connection.execute(insert(models.User.__table__), [
+            {"username": f"bench-clerk-{index}", "hashed_password": "-", "role": models.UserRole.clerk,
+             "is_active": True}
+            for index in range(CLERKS)
+        ])
+        clerks = list(connection.execute(
+            select(models.User.id).where(models.User.username.like("bench-clerk-%"))
+        ).scalars())
+        span = 365 * 24 * 3600
+        for offset in range(0, rows, 50000):
+            connection.execute(insert(models.ChangeHistory.__table__), [
+                {
+                    "product_id": None,
+                    "barcode": f"{rng.randrange(1000):013d}",
+                    "product_name": "Bench product",
+                    "unit_price": 2.0,
+                    "quantity_change": -1,
+                    "action": models.ChangeRequestAction.sell if rng.random() < 0.8 else models.ChangeRequestAction.add,
+                    "status": models.ChangeRequestStatus.approved,
+                    "requester_id": rng.choice(clerks),
+                    "timestamp": now - datetime.timedelta(seconds=rng.randrange(span)),
+                    "buyer_name": f"buyer-{rng.randrange(200)}",
+                    "payment_status": models.PaymentStatus.paid,
+                }
+                for _ in range(min(50000, rows - offset))
+            ])
+    return clerks
+
+
+def _client_side(client, clerk: int, start: datetime.datetime) -> tuple[int, int, float]:
+    started = time.perf_counter()
+    found = fetched = skip = 0
+    while True:
+        page = client.get("/api/history/sales", params={"compact": True, "skip": skip, "limit": PAGE}).json()
+        fetched += len(page)
+        found += sum(1 for row in page if row["requester_id"] == clerk
+                     and datetime.datetime.fromisoformat(row["timestamp"]) >= start)
+        if len(page) < PAGE or datetime.datetime.fromisoformat(page[-1]["timestamp"]) < start:
+            return found, fetched, time.perf_counter() - started
+        skip += PAGE
+
+
+def _server_side(client, clerk: int, start: datetime.datetime) -> tuple[int, int, float]:
+    started = time.perf_counter()
+    found = 0
+    params = {"compact": True, "limit": PAGE, "requester_id": clerk, "start": start.isoformat()}
+    while True:
+        response = client.get("/api/history/sales", params=params)
+        found += len(response.json())
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            return found, found, time.perf_counter() - started
+        params["cursor"] = cursor
+
+
+def _drop_filter_indexes() -> None:
+    from sqlalchemy import text
+
+    from app.database import engine
+
+    with engine.begin() as connection:
+        for name in FILTER_INDEXES:
+            connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def _deep_page(client, depth: int) -> dict:
+    params = {"compact": True, "limit": PAGE}
+    started = time.perf_counter()
+    client.get("/api/history/", params={**params, "skip": depth * PAGE}).raise_for_status()
+    by_skip = time.perf_counter() - started
+
+    cursor = None
+    for _ in range(depth):
+        cursor = client.get("/api/history/", params={**params, **({"cursor": cursor} if cursor else {})}) \
+            .headers["x-next-cursor"]
+    started = time.perf_counter()
+    client.get("/api/history/", params={**params, "cursor": cursor}).raise_for_status()
+    by_cursor = time.perf_counter() - started
+    return {"depth_rows": depth * PAGE, "skip_ms": round(by_skip * 1000, 1), "cursor_ms": round(by_cursor * 1000, 1)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--deep-page", type=int, default=500, help="page number for the skip vs cursor check")
+    args = parser.parse_args()
+
+    configure()
+    rng = random.Random(41)
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    start = now - datetime.timedelta(days=7)
+    with app_client() as client:
+        started = time.perf_counter()
+        clerks = _seed(args.rows, rng, now)
+        print(f"seeded {args.rows} history rows in {time.perf_counter() - started:.1f}s; "
+              f"sales by one of {CLERKS} clerks in the last 7 days")
+
+        results = {}
+        for label, run in (("client-side filter, skip paging", _client_side),
+                           ("SQL filters, cursor paging", _server_side)):
+            results[label] = run(client, clerks[0], start)
+        deep = _deep_page(client, args.deep_page)
+        _drop_filter_indexes()
+        results["SQL filters, filter indexes dropped"] = _server_side(client, clerks[0], start)
+
+        for label, (found, fetched, elapsed) in results.items():
+            print(f"  {label:<38} {json.dumps({'matches': found, 'rows_sent': fetched, 'ms': round(elapsed * 1000, 1)})}")
+        print(f"  deep page, skip vs cursor             {json.dumps(deep)}")
+
+
+if __name__ == "__main__":
+    main()
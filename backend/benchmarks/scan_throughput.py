@@ -0,0 +1,115 @@
+"""
+Scan-throughput benchmark for the barcode cache (barcode_cache.py).
+
+Threads look up barcodes with ``GET /api/products/{barcode}`` the way
+scanners do: most scans hit a small set of popular products. A writer edits
+popular products a few times a second, so invalidation is part of the run.
+Runs once with the cache off (``BARCODE_CACHE_SIZE=0``) and once with it
+on, and reports scans per second, latency and the cache hit ratio.
+
+    cd backend
+    python -m benchmarks.scan_throughput --products 20000 --scans 20000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ._harness import app_client, configure, run_variant, timing_summary
+
+
+def _seed(count: int) -> list[tuple[int, str]]:
+    from sqlalchemy import insert, select
+
+    from app import models
+    from app.database import engine
+
+    table = models.Product.__table__
+    with engine.begin() as connection:
+        connection.execute(insert(table), [
+            {"barcode": f"{index:013d}", "name": f"Product {index}", "price": 1.0, "quantity": 1000,
+             "category": "Bench"}
+            for index in range(count)
+        ])
+        return [tuple(row) for row in connection.execute(select(table.c.id, table.c.barcode).order_by(table.c.id))]
+
+
+def _child(args) -> dict:
+    configure()
+    rng = random.Random(31)
+    with app_client() as client:
+        products = _seed(args.products)
+        hot = products[:max(len(products) // 50, 1)]
+        # 80% of scans go to the 2% most popular products
+        barcodes = [
+            (rng.choice(hot) if rng.random() < 0.8 else rng.choice(products))[1]
+            for _ in range(args.scans)
+        ]
+
+        stop = threading.Event()
+        writes = 0
+
+        def writer() -> None:
+            nonlocal writes
+            while not stop.wait(1 / args.writes_per_second):
+                product_id, barcode = rng.choice(hot)
+                body = client.get(f"/api/products/{barcode}").json()
+                body["quantity"] += 1
+                client.put(f"/api/products/{product_id}", json=body).raise_for_status()
+                writes += 1
+
+        def scan(barcode: str) -> float:
+            started = time.perf_counter()
+            client.get(f"/api/products/{barcode}").raise_for_status()
+            return time.perf_counter() - started
+
+        writer_thread = threading.Thread(target=writer, daemon=True) if args.writes_per_second > 0 else None
+        if writer_thread:
+            writer_thread.start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            latencies = list(pool.map(scan, barcodes))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        if writer_thread:
+            writer_thread.join()
+        stats = client.get("/api/products/cache/stats").json()
+
+    return {
+        "scans_per_second": round(len(latencies) / elapsed, 1),
+        **timing_summary(latencies),
+        "hit_ratio": round(stats.get("hit_ratio", 0.0), 3),
+        "writes": writes,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--scans", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--writes-per-second", type=float, default=5.0)
+    parser.add_argument("--cache-size", type=int, default=10000)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(_child(args)))
+        return
+
+    passed = [
+        "--products", str(args.products), "--scans", str(args.scans), "--threads", str(args.threads),
+        "--writes-per-second", str(args.writes_per_second),
+    ]
+    print(f"{args.scans} scans over {args.products} products, {args.threads} threads, "
+          f"{args.writes_per_second:g} writes/s")
+    for label, size in (("cache off", 0), (f"cache of {args.cache_size}", args.cache_size)):
+        result = run_variant("benchmarks.scan_throughput", {"BARCODE_CACHE_SIZE": size}, passed)
+        print(f"  {label:<18} {json.dumps(result)}")
+
+
+if __name__ == "__main__":
+    main()
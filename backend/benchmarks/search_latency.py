@@ -0,0 +1,109 @@
+"""
+Latency benchmark for ``GET /api/products/search`` (search.py).
+
+Seeds a synthetic catalogue, then times each kind of query on every search
+backend this database can use: exact name, prefix, substring, two-letter
+substring, misspelling, category filter and barcode prefix. Each line
+reports p50/p95 and whether p95 is within ``--target-ms``. Two-letter
+queries have no trigram to look up and scan the table, so they are held to
+``--scan-target-ms`` instead. The exit status is 1 when any kind misses its
+target.
+
+    cd backend
+    python -m benchmarks.search_latency --products 200000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import time
+
+from ._harness import app_client, configure, timing_summary
+
+_WORDS = [
+    "cola", "lemon", "orange", "mango", "water", "sparkling", "diet", "zero", "classic", "juice",
+    "milk", "yoghurt", "butter", "cheese", "bread", "rice", "pasta", "flour", "sugar", "salt",
+    "coffee", "tea", "cocoa", "biscuit", "chips", "soap", "shampoo", "tissue", "battery", "candle",
+]
+_SIZES = ["250ml", "330ml", "500ml", "1l", "1.5l", "2l", "100g", "250g", "500g", "1kg"]
+_CATEGORIES = [f"Category {n}" for n in range(40)]
+
+
+def _seed(count: int, rng: random.Random) -> list[str]:
+    from sqlalchemy import insert
+
+    from app import models
+    from app.database import engine
+
+    names = []
+    with engine.begin() as connection:
+        for start in range(0, count, 5000):
+            rows = []
+            for index in range(start, min(start + 5000, count)):
+                name = f"{' '.join(rng.sample(_WORDS, 2)).title()} {rng.choice(_SIZES)} #{index}"
+                names.append(name)
+                rows.append({
+                    "barcode": f"{index:012d}", "name": name, "price": 1.0, "quantity": 10,
+                    "category": rng.choice(_CATEGORIES), "is_archived": index % 20 == 0,
+                })
+            connection.execute(insert(models.Product.__table__), rows)
+    return names
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=100, help="timed queries per kind and backend")
+    parser.add_argument("--target-ms", type=float, default=100.0, help="p95 target per query kind")
+    parser.add_argument("--scan-target-ms", type=float, default=250.0, help="p95 target for two-letter queries")
+    args = parser.parse_args()
+    configure()
+    from app import search
+
+    rng = random.Random(33)
+    with app_client() as client:
+        started = time.perf_counter()
+        names = _seed(args.products, rng)
+        print(f"{args.products} products seeded in {time.perf_counter() - started:.1f}s")
+
+        def misspelt(name: str) -> str:
+            word = name.split()[0].lower()
+            position = rng.randrange(1, len(word))
+            return word[:position] + word[position + 1:] + " " + name.split()[1].lower()
+
+        kinds = {
+            "exact": lambda: {"q": rng.choice(names)},
+            "prefix": lambda: {"q": rng.choice(names)[:8]},
+            "substring": lambda: {"q": rng.choice(names).split()[1][1:]},
+            "two letters": lambda: {"q": rng.choice(_WORDS)[1:3]},
+            "misspelt": lambda: {"q": misspelt(rng.choice(names))},
+            "with category": lambda: {"q": rng.choice(_WORDS), "category": rng.choice(_CATEGORIES)},
+            "barcode prefix": lambda: {"barcode": f"{rng.randrange(args.products):012d}"[:9]},
+        }
+        backends = [search.get_backend()]
+        if search.BACKEND_MEMORY not in backends:
+            backends.append(search.BACKEND_MEMORY)
+
+        within_target = True
+        for backend in backends:
+            search._backend = backend
+            # Warm-up, which also builds the in-memory index
+            client.get("/api/products/search", params={"q": "cola"}).raise_for_status()
+            for kind, params in kinds.items():
+                latencies = []
+                for _ in range(args.queries):
+                    query = params()
+                    began = time.perf_counter()
+                    client.get("/api/products/search", params=query).raise_for_status()
+                    latencies.append(time.perf_counter() - began)
+                result = timing_summary(latencies)
+                ok = result["p95_ms"] <= (args.scan_target_ms if kind == "two letters" else args.target_ms)
+                within_target &= ok
+                print(f"  {backend:<8} {kind:<15} {json.dumps({**result, 'within_target': ok})}")
+    sys.exit(0 if within_target else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Shared fixtures. The app reads its settings at import, so the environment
+points it at a throwaway SQLite database before anything imports ``app``.
+"""
+import os
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+
+import pytest
+
+_DB_DIR = tempfile.mkdtemp(prefix="bstock-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DB_DIR}/test.db"
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    # Entering the client runs the startup hooks (migrations, master account, baseline snapshot)
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client):
+    response = client.post(
+        "/api/token",
+        data={"username": settings.MASTER_USERNAME, "password": settings.MASTER_PASSWORD},
+    )
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def make_products(client, admin_headers):
+    """Create products with unique barcodes; tests share one database."""
+    def make(*quantities, price=2.0, category="Tests"):
+        tag = uuid.uuid4().hex[:8]
+        response = client.post(
+            "/api/products/",
+            json=[
+                {"barcode": f"{tag}-{index}", "name": f"{tag}-{index}", "price": price,
+                 "quantity": quantity, "category": category}
+                for index, quantity in enumerate(quantities)
+            ],
+            headers=admin_headers,
+        )
+        assert response.status_code == 201, response.text
+        return response.json()
+    return make
@@ -0,0 +1,59 @@
+"""
+Barcode cache: writes from another worker reach this worker's cache through
+the products change log, also when many lookups sync at once.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from app import crud, models, versioning
+from app.barcode_cache import BarcodeCache
+from app.database import SessionLocal
+
+
+def _lookup(cache, barcode):
+    db = SessionLocal()
+    try:
+        return cache.get_or_load(db, barcode, lambda: crud.get_product_by_barcode(db, barcode))
+    finally:
+        db.close()
+
+
+def _set_quantity(product_id, quantity):
+    # Stands in for another worker: only the global cache hears about this commit
+    db = SessionLocal()
+    try:
+        db.query(models.Product).filter(models.Product.id == product_id).one().quantity = quantity
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_other_workers_writes_are_picked_up(client, make_products):
+    (product,) = make_products(5)
+    cache = BarcodeCache(max_size=100, ttl_seconds=3600, sync_interval_seconds=0)
+    assert _lookup(cache, product["barcode"]).quantity == 5
+    assert _lookup(cache, product["barcode"]).quantity == 5
+    assert cache.hits == 1
+
+    _set_quantity(product["id"], 9)
+    assert _lookup(cache, product["barcode"]).quantity == 9
+
+
+def test_concurrent_syncs_end_on_the_latest_version(client, make_products):
+    products = make_products(*range(20))
+    cache = BarcodeCache(max_size=100, ttl_seconds=3600, sync_interval_seconds=0)
+    barcodes = [product["barcode"] for product in products]
+
+    def scan(round_):
+        return [_lookup(cache, barcode) for barcode in barcodes[round_ % 5::5]]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(scan, range(40)))
+        _set_quantity(products[3]["id"], 100)
+        list(pool.map(scan, range(40)))
+
+    db = SessionLocal()
+    try:
+        assert cache._seen_version == versioning.current_version(db)
+    finally:
+        db.close()
+    assert _lookup(cache, products[3]["barcode"]).quantity == 100
@@ -0,0 +1,95 @@
+"""
+Bulk archive, restore and delete bypass the ORM flush hooks, so the
+bookkeeping those hooks normally do must still happen: row versions and
+tombstones, barcode cache entries, category counts and stock movements.
+"""
+import datetime
+import uuid
+
+import pytest
+
+from app import models
+from app.barcode_cache import barcode_cache
+from app.database import SessionLocal
+
+
+@pytest.fixture
+def category():
+    return f"bulk-{uuid.uuid4().hex[:8]}"
+
+
+def _bulk(client, headers, action, product_ids):
+    response = client.post(f"/api/products/bulk/{action}", json={"product_ids": product_ids}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert sorted(response.json()["product_ids"]) == sorted(product_ids)
+    return response.json()
+
+
+def _version(client, headers):
+    return client.get("/api/products/changes", params={"since": 0}, headers=headers).json()["version"]
+
+
+def _changes(client, headers, since, product_ids):
+    body = client.get("/api/products/changes", params={"since": since}, headers=headers).json()
+    changed = {row["id"]: row for row in body["changed"] if row["id"] in product_ids}
+    deleted = {row["product_id"]: row for row in body["deleted"] if row["product_id"] in product_ids}
+    return changed, deleted
+
+
+def _counts(client, headers, category):
+    rows = client.get("/api/products/categories/counts", headers=headers).json()
+    return next(((row["product_count"], row["active_count"]) for row in rows if row["name"] == category), (0, 0))
+
+
+def _warm_cache(client, headers, products):
+    for product in products:
+        assert client.get(f"/api/products/{product['barcode']}", headers=headers).status_code == 200
+    return {product["barcode"] for product in products} <= set(barcode_cache._entries)
+
+
+def test_bulk_archive_and_restore_keep_the_books(client, admin_headers, make_products, category):
+    products = make_products(4, 6, category=category)
+    ids = [product["id"] for product in products]
+    assert _counts(client, admin_headers, category) == (2, 2)
+
+    for action, archived, counts in (("archive", True, (2, 0)), ("restore", False, (2, 2))):
+        since = _version(client, admin_headers)
+        assert _warm_cache(client, admin_headers, products)
+        _bulk(client, admin_headers, action, ids)
+
+        changed, deleted = _changes(client, admin_headers, since, ids)
+        assert set(changed) == set(ids) and not deleted
+        assert all(row["row_version"] > since and row["is_archived"] is archived for row in changed.values())
+        assert not {product["barcode"] for product in products} & set(barcode_cache._entries)
+        assert _counts(client, admin_headers, category) == counts
+
+
+def test_bulk_delete_keeps_the_books(client, admin_headers, make_products, category):
+    started = datetime.datetime.utcnow()
+    products = make_products(4, 6, category=category)
+    ids = [product["id"] for product in products]
+    since = _version(client, admin_headers)
+    assert _warm_cache(client, admin_headers, products)
+
+    _bulk(client, admin_headers, "delete", ids)
+
+    changed, deleted = _changes(client, admin_headers, since, ids)
+    assert not changed and set(deleted) == set(ids)
+    assert all(row["row_version"] > since for row in deleted.values())
+    assert {row["barcode"] for row in deleted.values()} == {product["barcode"] for product in products}
+    assert not {product["barcode"] for product in products} & set(barcode_cache._entries)
+    assert all(
+        client.get(f"/api/products/{product['barcode']}", headers=admin_headers).status_code == 404
+        for product in products
+    )
+    assert _counts(client, admin_headers, category) == (0, 0)
+
+    db = SessionLocal()
+    try:
+        movement = models.StockMovement
+        logged = db.query(movement.product_id, movement.quantity_delta).filter(
+            movement.product_id.in_(ids), movement.deleted.is_(True), movement.created_at >= started
+        ).all()
+    finally:
+        db.close()
+    assert sorted(logged) == sorted(zip(ids, (-4, -6)))
@@ -0,0 +1,50 @@
+"""
+Dashboard summary: catalogue figures come from the category registry and
+match what a scan of ``products`` would report.
+"""
+import uuid
+
+from sqlalchemy import func
+
+from app import models
+from app.database import SessionLocal
+
+
+def _catalogue_from_products():
+    db = SessionLocal()
+    try:
+        product = models.Product
+        return {
+            "product_count": db.query(func.count(product.id)).scalar(),
+            "active_product_count": db.query(func.count(product.id)).filter(product.is_archived.is_(False)).scalar(),
+            "category_count": db.query(func.count(product.category.distinct())).scalar(),
+        }
+    finally:
+        db.close()
+
+
+def _summary(client, headers):
+    response = client.get("/api/dashboard/summary", headers=headers)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    return {key: body[key] for key in ("product_count", "active_product_count", "category_count")}
+
+
+def test_catalogue_counts_follow_writes(client, admin_headers, make_products):
+    category = uuid.uuid4().hex
+    a, b = make_products(1, 2, category=category)
+    make_products(3, category=uuid.uuid4().hex)
+    assert _summary(client, admin_headers) == _catalogue_from_products()
+
+    response = client.post("/api/products/bulk/archive", json={"product_ids": [a["id"]]}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert _summary(client, admin_headers) == _catalogue_from_products()
+
+    # Emptying a category drops it from the count
+    categories = _summary(client, admin_headers)["category_count"]
+    for product in (a, b):
+        response = client.delete(f"/api/products/{product['id']}", headers=admin_headers)
+        assert response.status_code == 200, response.text
+    summary = _summary(client, admin_headers)
+    assert summary == _catalogue_from_products()
+    assert summary["category_count"] == categories - 1
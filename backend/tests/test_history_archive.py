@@ -0,0 +1,103 @@
+"""
+Keyset paging over history that is split between the live table and the
+archive: every page boundary, including ties at the cutoff's sides, walks
+each matching row exactly once and in order, with or without filters.
+"""
+import datetime
+import uuid
+
+import pytest
+
+from app import history_archive, models
+from app.database import SessionLocal
+
+
+@pytest.fixture
+def split_history():
+    """A buyer's sales on both sides of the archive cutoff, after archiving."""
+    buyer = f"buyer-{uuid.uuid4().hex[:8]}"
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+    old = datetime.datetime(2026, 3, 1)
+    sales = [
+        (now - datetime.timedelta(days=1), models.PaymentStatus.paid),
+        (now - datetime.timedelta(days=2), models.PaymentStatus.paid),
+        (now - datetime.timedelta(days=2), models.PaymentStatus.paid),
+        (old, models.PaymentStatus.paid),
+        (old, models.PaymentStatus.paid),
+        (old, models.PaymentStatus.paid),
+        # Unpaid sales are never archived, so this one stays hot among the archived rows
+        (old - datetime.timedelta(days=14), models.PaymentStatus.unpaid),
+        (old - datetime.timedelta(days=28), models.PaymentStatus.paid),
+    ]
+    db = SessionLocal()
+    try:
+        rows = [
+            models.ChangeHistory(
+                action=models.ChangeRequestAction.sell, status=models.ChangeRequestStatus.approved,
+                quantity_change=-1, buyer_name=buyer, payment_status=payment_status, timestamp=moment,
+            )
+            for moment, payment_status in sales
+        ]
+        # The archiver never moves the newest row, so keep one of another buyer's last
+        rows.append(models.ChangeHistory(
+            action=models.ChangeRequestAction.sell, status=models.ChangeRequestStatus.approved,
+            quantity_change=-1, buyer_name="walk-in", payment_status=models.PaymentStatus.paid, timestamp=now,
+        ))
+        db.add_all(rows)
+        db.commit()
+        # Newest first, as history is listed
+        entries = sorted(
+            ((row.timestamp, row.id, row.payment_status) for row in rows[:-1]),
+            key=lambda entry: (entry[0], entry[1]),
+            reverse=True,
+        )
+        history_archive.archive_cold_history(db, older_than_days=30)
+        archived = {
+            row_id for (row_id,) in db.query(models.ChangeHistoryArchive.id)
+            .filter(models.ChangeHistoryArchive.buyer_name == buyer)
+        }
+    finally:
+        db.close()
+    assert len(archived) == 4
+    return buyer, entries, archived
+
+
+def _walk(client, headers, view, params):
+    seen = []
+    while True:
+        response = client.get(f"/api/history/{view}", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        seen += [row["id"] for row in response.json()]
+        if "x-next-cursor" not in response.headers:
+            return seen
+        params = {**params, "cursor": response.headers["x-next-cursor"]}
+
+
+@pytest.mark.parametrize("compact", [False, True])
+@pytest.mark.parametrize("limit", [2, 3])
+def test_cursor_paging_crosses_the_archive_boundary(client, admin_headers, split_history, compact, limit):
+    buyer, entries, archived = split_history
+    params = {"buyer_name": buyer, "compact": compact, "limit": limit}
+    assert _walk(client, admin_headers, "sales", params) == [row_id for _, row_id, _ in entries]
+
+    # Offset paging over the same rows agrees
+    pages = [
+        client.get("/api/history/sales", params={**params, "skip": skip}, headers=admin_headers).json()
+        for skip in range(0, len(entries), limit)
+    ]
+    assert [row["id"] for page in pages for row in page] == [row_id for _, row_id, _ in entries]
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_filters_apply_to_archived_rows(client, admin_headers, split_history, compact):
+    buyer, entries, archived = split_history
+    params = {
+        "buyer_name": buyer, "compact": compact, "limit": 2, "payment_status": "paid",
+        "start": "2026-01-01T00:00:00", "end": "2026-06-01T00:00:00",
+    }
+    seen = _walk(client, admin_headers, "sales", params)
+    assert set(seen) == archived
+    assert seen == [row_id for _, row_id, _ in entries if row_id in archived]
+
+    unpaid = _walk(client, admin_headers, "unpaid", {"buyer_name": buyer, "compact": compact, "limit": 1})
+    assert unpaid == [row_id for _, row_id, status in entries if status == models.PaymentStatus.unpaid]
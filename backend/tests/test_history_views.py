@@ -0,0 +1,88 @@
+"""
+Sales and unpaid views keep sales of products deleted since: the rows render
+from the price, name and barcode recorded when the sale was approved. Cursor
+paging walks every row once, including rows that share a timestamp.
+"""
+import datetime
+import io
+import uuid
+
+import pandas as pd
+
+from app import models
+from app.database import SessionLocal
+
+
+def _sell(client, headers, product, quantity, buyer):
+    response = client.post("/api/inventory/request", json={
+        "barcode": product["barcode"], "action": "sell", "quantity_change": quantity,
+        "buyer_name": buyer, "payment_status": "unpaid",
+    }, headers=headers)
+    assert response.status_code == 200, response.text
+    response = client.put(f"/api/inventory/requests/{response.json()['id']}/approve", headers=headers)
+    assert response.status_code == 200, response.text
+
+
+def test_sales_of_deleted_products_stay_listed(client, admin_headers, make_products):
+    (product,) = make_products(10, price=4.0)
+    buyer = f"buyer-{uuid.uuid4().hex[:8]}"
+    _sell(client, admin_headers, product, 3, buyer)
+    response = client.delete(f"/api/products/{product['id']}", headers=admin_headers)
+    assert response.status_code == 200, response.text
+
+    for view in ("sales", "unpaid"):
+        for compact in (False, True):
+            response = client.get(
+                f"/api/history/{view}", params={"buyer_name": buyer, "compact": compact}, headers=admin_headers
+            )
+            assert response.status_code == 200, response.text
+            (row,) = response.json()
+            assert row.get("product_name") == product["name"]
+            assert row.get("unit_price", row.get("product_price")) == 4.0
+
+    (receivable,) = [
+        row for row in client.get("/api/history/receivables", headers=admin_headers).json()
+        if row["buyer_name"] == buyer
+    ]
+    assert receivable["sale_count"] == 1 and receivable["outstanding"] == 12.0
+
+    # The export link authenticates with a token query parameter
+    token = admin_headers["Authorization"].split(" ", 1)[1]
+    response = client.get("/api/history/sales/export", params={"buyer_name": buyer, "token": token})
+    assert response.status_code == 200, response.text
+    (exported,) = pd.read_excel(io.BytesIO(response.content)).to_dict("records")
+    assert exported["Product_Name"] == product["name"]
+    assert exported["Barcode"] == product["barcode"]
+    assert exported["Total_Amount"] == 12.0
+
+
+def test_cursor_paging_walks_tied_timestamps_once(client, admin_headers):
+    buyer = f"buyer-{uuid.uuid4().hex[:8]}"
+    moments = [datetime.datetime(2026, 1, 1)] * 5 + [datetime.datetime(2025, 12, 31)] * 2
+    db = SessionLocal()
+    try:
+        db.add_all([
+            models.ChangeHistory(
+                action=models.ChangeRequestAction.sell, status=models.ChangeRequestStatus.approved,
+                quantity_change=-1, buyer_name=buyer, payment_status=models.PaymentStatus.paid, timestamp=moment,
+            )
+            for moment in moments
+        ])
+        db.commit()
+        expected = [
+            row.id for row in db.query(models.ChangeHistory.id)
+            .filter(models.ChangeHistory.buyer_name == buyer)
+            .order_by(models.ChangeHistory.timestamp.desc(), models.ChangeHistory.id.desc())
+        ]
+    finally:
+        db.close()
+
+    seen, params = [], {"buyer_name": buyer, "compact": True, "limit": 2}
+    while True:
+        response = client.get("/api/history/sales", params=params, headers=admin_headers)
+        assert response.status_code == 200, response.text
+        seen += [row["id"] for row in response.json()]
+        if "x-next-cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["x-next-cursor"]
+    assert seen == expected
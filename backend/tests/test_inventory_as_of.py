@@ -0,0 +1,110 @@
+"""
+Replay checks for point-in-time inventory: quantities recorded from the live
+API at several moments must match what ``/api/inventory/as-of`` rebuilds for
+those moments, whether the moment falls before or after a snapshot.
+"""
+import datetime
+import time
+
+import pytest
+
+
+def _now() -> datetime.datetime:
+    # Movements are stamped in naive UTC; keep successive checkpoints apart
+    time.sleep(0.01)
+    moment = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    time.sleep(0.01)
+    return moment
+
+
+def _current(client, headers, products) -> dict:
+    state = {}
+    for product in products:
+        response = client.get(f"/api/products/{product['barcode']}", headers=headers)
+        if response.status_code == 200:
+            body = response.json()
+            state[body["id"]] = (body["quantity"], body["price"])
+    return state
+
+
+def _as_of(client, headers, ts, products) -> dict:
+    response = client.get("/api/inventory/as-of", params={"ts": ts.isoformat()}, headers=headers)
+    assert response.status_code == 200, response.text
+    ids = {product["id"] for product in products}
+    return {
+        item["product_id"]: (item["quantity"], item["price"])
+        for item in response.json()["items"]
+        if item["product_id"] in ids
+    }
+
+
+def _approve(client, headers, **body):
+    response = client.post("/api/inventory/request", json=body, headers=headers)
+    assert response.status_code == 200, response.text
+    response = client.put(f"/api/inventory/requests/{response.json()['id']}/approve", headers=headers)
+    assert response.status_code == 200, response.text
+
+
+def _snapshot(client, headers):
+    response = client.post("/api/inventory/snapshots", headers=headers)
+    assert response.status_code == 201, response.text
+
+
+def test_as_of_matches_recorded_quantities_around_snapshots(client, admin_headers, make_products):
+    a, b, c = make_products(10, 20, 30)
+    products = [a, b, c]
+    checkpoints = [(_now(), _current(client, admin_headers, products))]
+
+    # Before any new snapshot: approvals and a direct edit of quantity and price
+    _approve(client, admin_headers, barcode=a["barcode"], action="sell", quantity_change=3,
+             buyer_name="walk-in", payment_status="paid")
+    _approve(client, admin_headers, barcode=b["barcode"], action="add", quantity_change=5)
+    edit = {key: c[key] for key in ("barcode", "name", "category")}
+    response = client.put(f"/api/products/{c['id']}", json={**edit, "quantity": 7, "price": 4.5},
+                          headers=admin_headers)
+    assert response.status_code == 200, response.text
+    checkpoints.append((_now(), _current(client, admin_headers, products)))
+
+    _snapshot(client, admin_headers)
+
+    # After it: another sale, a single delete and a new product
+    _approve(client, admin_headers, barcode=b["barcode"], action="sell", quantity_change=2,
+             buyer_name="walk-in", payment_status="unpaid")
+    response = client.delete(f"/api/products/{a['id']}", headers=admin_headers)
+    assert response.status_code == 200, response.text
+    (d,) = make_products(12)
+    products.append(d)
+    checkpoints.append((_now(), _current(client, admin_headers, products)))
+
+    # Set-based delete, which writes its movements outside the flush hooks
+    response = client.post("/api/products/bulk/delete", json={"product_ids": [c["id"]]}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    _approve(client, admin_headers, barcode=d["barcode"], action="sell", quantity_change=4,
+             buyer_name="walk-in", payment_status="paid")
+    checkpoints.append((_now(), _current(client, admin_headers, products)))
+
+    _snapshot(client, admin_headers)
+    checkpoints.append((_now(), _current(client, admin_headers, products)))
+
+    for ts, recorded in checkpoints:
+        assert _as_of(client, admin_headers, ts, products) == recorded, ts
+
+
+def test_as_of_before_first_snapshot_is_not_found(client, admin_headers):
+    response = client.get("/api/inventory/as-of", params={"ts": "2000-01-01T00:00:00"}, headers=admin_headers)
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("snapshot_between", [False, True])
+def test_as_of_handles_repeated_changes_to_one_product(client, admin_headers, make_products, snapshot_between):
+    (product,) = make_products(50)
+    checkpoints = []
+    for step in range(4):
+        _approve(client, admin_headers, barcode=product["barcode"], action="sell", quantity_change=step + 1,
+                 buyer_name="walk-in", payment_status="paid")
+        if snapshot_between and step == 1:
+            _snapshot(client, admin_headers)
+        checkpoints.append((_now(), _current(client, admin_headers, [product])))
+
+    for ts, recorded in checkpoints:
+        assert _as_of(client, admin_headers, ts, [product]) == recorded, ts
@@ -0,0 +1,75 @@
+"""
+Delta sync: every product write path shows up in ``/api/products/changes``
+with a distinct, increasing version, and versions are only taken at commit.
+"""
+from app import models, versioning
+from app.database import SessionLocal
+
+
+def _changes(client, headers, since):
+    response = client.get("/api/products/changes", params={"since": since}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_writes_and_deletes_are_reported_in_version_order(client, admin_headers, make_products):
+    start = _changes(client, admin_headers, 0)["version"]
+    a, b, c = make_products(5, 6, 7)
+    edit = {key: a[key] for key in ("barcode", "name", "category", "price")}
+    response = client.put(f"/api/products/{a['id']}", json={**edit, "quantity": 9}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    response = client.post("/api/products/bulk/archive", json={"product_ids": [b["id"]]}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    response = client.delete(f"/api/products/{c['id']}", headers=admin_headers)
+    assert response.status_code == 200, response.text
+
+    changes = _changes(client, admin_headers, start)
+    changed = {product["id"]: product for product in changes["changed"]}
+    assert changed[a["id"]]["quantity"] == 9
+    assert changed[b["id"]]["is_archived"] is True
+    assert c["id"] not in changed
+    assert [row["product_id"] for row in changes["deleted"]] == [c["id"]]
+
+    # In ledger mode the last page also re-sends products with pending deltas
+    ours = {a["id"], b["id"], c["id"]}
+    versions = [product["row_version"] for product in changes["changed"] if product["id"] in ours] + [
+        row["row_version"] for row in changes["deleted"]
+    ]
+    assert len(set(versions)) == len(versions)
+    assert all(start < version <= changes["version"] for version in versions)
+    # Nothing new since the returned version
+    later = _changes(client, admin_headers, changes["version"])
+    assert not [row for row in later["changed"] if row["id"] in ours] and later["deleted"] == []
+
+
+def test_versions_are_taken_at_commit_not_at_flush(client, make_products):
+    (product,) = make_products(3)
+    db = SessionLocal()
+    try:
+        before = versioning.current_version(db)
+        row = db.query(models.Product).filter(models.Product.id == product["id"]).one()
+        row.quantity = 4
+        db.flush()
+        assert versioning.current_version(db) == before
+        db.commit()
+        assert versioning.current_version(db) == before + 1
+        assert db.query(models.Product.row_version).filter(models.Product.id == product["id"]).scalar() == before + 1
+    finally:
+        db.close()
+
+
+def test_rolled_back_writes_take_no_version(client, make_products):
+    (product,) = make_products(3)
+    db = SessionLocal()
+    try:
+        before = versioning.current_version(db)
+        row = db.query(models.Product).filter(models.Product.id == product["id"]).one()
+        row.quantity = 8
+        db.flush()
+        db.rollback()
+        row = db.query(models.Product).filter(models.Product.id == product["id"]).one()
+        row.price = 3.0
+        db.commit()
+        assert versioning.current_version(db) == before + 1
+    finally:
+        db.close()
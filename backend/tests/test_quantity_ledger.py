@@ -0,0 +1,298 @@
+"""
+Quantity-ledger mode. The ledger settings are read at import, so when the
+suite runs with the ledger off this module re-runs itself in a child pytest
+process with it on.
+"""
+import datetime
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from sqlalchemy import event
+
+from app import models, quantity_ledger, reorder, versioning
+from app.barcode_cache import BarcodeCache
+from app.database import SessionLocal, engine
+
+ledger_mode = pytest.mark.skipif(not quantity_ledger.enabled(), reason="runs in the ledger-mode child process")
+
+
+@pytest.mark.skipif(quantity_ledger.enabled(), reason="already in ledger mode")
+def test_in_ledger_mode():
+    env = {
+        **os.environ,
+        "QUANTITY_LEDGER_SLOTS": "4",
+        "QUANTITY_LEDGER_SAFETY_STOCK": "30",
+        "QUANTITY_LEDGER_COMPACT_SECONDS": "3600",
+    }
+    completed = subprocess.run(
+        [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", __file__],
+        cwd=Path(__file__).resolve().parents[1],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert completed.returncode == 0, completed.stdout + completed.stderr
+
+
+def _sell(client, headers, product, quantity):
+    response = client.post("/api/inventory/request", json={
+        "barcode": product["barcode"], "action": "sell", "quantity_change": quantity,
+        "buyer_name": "walk-in", "payment_status": "paid",
+    }, headers=headers)
+    assert response.status_code == 200, response.text
+    return client.put(f"/api/inventory/requests/{response.json()['id']}/approve", headers=headers)
+
+
+def _stored(product_id):
+    """(products.quantity, pending delta rows) as stored."""
+    db = SessionLocal()
+    try:
+        base = db.query(models.Product.quantity).filter(models.Product.id == product_id).scalar()
+        rows = db.query(models.ProductQuantityDelta).filter(models.ProductQuantityDelta.product_id == product_id).count()
+        return base, rows
+    finally:
+        db.close()
+
+
+def _quantity(client, headers, product):
+    return client.get(f"/api/products/{product['barcode']}", headers=headers).json()["quantity"]
+
+
+@ledger_mode
+def test_small_sale_goes_to_the_ledger_and_moves_versions(client, admin_headers, make_products):
+    (product,) = make_products(100)
+    listing = client.get("/api/products/", headers=admin_headers)
+    etag = listing.headers["etag"]
+    since = client.get("/api/products/changes", params={"since": 0}, headers=admin_headers).json()["version"]
+
+    assert _sell(client, admin_headers, product, 5).status_code == 200
+    assert _stored(product["id"]) == (100, 1)
+    assert _quantity(client, admin_headers, product) == 95
+
+    relisted = client.get("/api/products/", headers={**admin_headers, "If-None-Match": etag})
+    assert relisted.status_code == 200
+    changes = client.get("/api/products/changes", params={"since": since}, headers=admin_headers).json()
+    assert {row["id"]: row["quantity"] for row in changes["changed"]}[product["id"]] == 95
+
+
+@ledger_mode
+def test_small_sale_leaves_the_product_row_alone(client, admin_headers, make_products):
+    (product,) = make_products(100)
+    other_worker = BarcodeCache(max_size=10, ttl_seconds=600, sync_interval_seconds=0)
+    db = SessionLocal()
+    try:
+        other_worker.get_or_load(db, product["barcode"], lambda: None)
+        loader = lambda: db.query(models.Product).filter(models.Product.id == product["id"]).one()
+        assert other_worker.get_or_load(db, product["barcode"], loader).quantity == 100
+        before = versioning.current_version(db)
+    finally:
+        db.close()
+
+    statements = []
+    capture = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        assert _sell(client, admin_headers, product, 5).status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    assert not [
+        statement for statement in statements
+        if statement.startswith("UPDATE products") or ("FROM products" in statement and "FOR UPDATE" in statement)
+    ]
+
+    db = SessionLocal()
+    try:
+        assert versioning.current_version(db) == before
+        row = db.query(models.Product).filter(models.Product.id == product["id"]).one()
+        assert row.row_version == product["row_version"]
+        # Another worker's cache sees the ledger counters move and reloads
+        loader = lambda: db.query(models.Product).filter(models.Product.id == product["id"]).one()
+        assert other_worker.get_or_load(db, product["barcode"], loader).quantity == 95
+    finally:
+        db.close()
+
+
+@ledger_mode
+def test_ledger_sales_spread_the_rollup_over_slots(client, admin_headers, make_products):
+    (product,) = make_products(100)
+    for _ in range(12):
+        assert _sell(client, admin_headers, product, 1).status_code == 200
+    db = SessionLocal()
+    try:
+        rollup = models.SalesDailyRollup
+        rows = db.query(rollup.slot, rollup.units, rollup.sale_count).filter(rollup.product_id == product["id"]).all()
+    finally:
+        db.close()
+    assert len(rows) > 1
+    assert sum(units for _, units, _ in rows) == 12 and sum(count for _, _, count in rows) == 12
+
+    report = client.get("/api/reports/sales", params={"group_by": "product"}, headers=admin_headers).json()
+    (line,) = [row for row in report["rows"] if row["key"] == str(product["id"])]
+    assert line["units"] == 12
+
+
+@ledger_mode
+def test_ledger_writes_keep_low_stock_and_reorder_current(client, admin_headers, make_products):
+    (product,) = make_products(45)
+    db = SessionLocal()
+    try:
+        db.get(models.Product, product["id"]).reorder_threshold = 40
+        db.commit()
+    finally:
+        db.close()
+
+    def low():
+        rows = client.get("/api/inventory/low-stock", headers=admin_headers).json()
+        return {row["product_id"]: row["quantity"] for row in rows}.get(product["id"])
+
+    assert _sell(client, admin_headers, product, 6).status_code == 200
+    assert _stored(product["id"]) == (45, 1)
+    assert low() == 39
+    assert _sell(client, admin_headers, product, 2).status_code == 200
+    assert low() == 37
+
+    db = SessionLocal()
+    try:
+        (suggestion,) = reorder.compute_suggestions(db, datetime.datetime.utcnow().date(), [product["id"]])
+        assert suggestion["quantity"] == 37
+        quantity_ledger.compact(db)
+    finally:
+        db.close()
+    assert _stored(product["id"]) == (37, 0)
+    assert low() == 37
+
+    response = client.post("/api/inventory/request", json={
+        "barcode": product["barcode"], "action": "add", "quantity_change": 10,
+    }, headers=admin_headers)
+    assert client.put(f"/api/inventory/requests/{response.json()['id']}/approve", headers=admin_headers).status_code == 200
+    assert _stored(product["id"]) == (37, 1)
+    assert low() is None
+
+
+@ledger_mode
+@pytest.mark.parametrize("bulk", [False, True])
+def test_deletes_log_and_drop_pending_deltas(client, admin_headers, make_products, bulk):
+    (product,) = make_products(80)
+    assert _sell(client, admin_headers, product, 4).status_code == 200
+    assert _stored(product["id"]) == (80, 1)
+
+    if bulk:
+        response = client.post("/api/products/bulk/delete", json={"product_ids": [product["id"]]}, headers=admin_headers)
+    else:
+        response = client.delete(f"/api/products/{product['id']}", headers=admin_headers)
+    assert response.status_code == 200, response.text
+
+    assert _stored(product["id"]) == (None, 0)
+    db = SessionLocal()
+    try:
+        movement = models.StockMovement
+        last = db.query(movement).filter(movement.product_id == product["id"]).order_by(movement.id.desc()).first()
+    finally:
+        db.close()
+    assert last.deleted and last.quantity_delta == -76
+
+
+@ledger_mode
+def test_as_of_counts_ledger_sales_when_approved(client, admin_headers, make_products):
+    started = datetime.datetime.utcnow()
+    (product,) = make_products(90)
+
+    def as_of(ts):
+        response = client.get("/api/inventory/as-of", params={"ts": ts.isoformat()}, headers=admin_headers)
+        return {item["product_id"]: item["quantity"] for item in response.json()["items"]}[product["id"]]
+
+    def now():
+        time.sleep(0.01)
+        moment = datetime.datetime.utcnow()
+        time.sleep(0.01)
+        return moment
+
+    checkpoints = []
+    for quantity in (2, 3):
+        assert _sell(client, admin_headers, product, quantity).status_code == 200
+        checkpoints.append((now(), _quantity(client, admin_headers, product)))
+    assert client.post("/api/inventory/snapshots", headers=admin_headers).status_code == 201
+    assert _sell(client, admin_headers, product, 4).status_code == 200
+    checkpoints.append((now(), 81))
+
+    db = SessionLocal()
+    try:
+        quantity_ledger.compact(db)
+        movement = models.StockMovement
+        logged = db.query(movement.quantity_delta).filter(
+            movement.product_id == product["id"], movement.created_at >= started
+        ).order_by(movement.id).all()
+        # The creation and three sales; the fold logs none
+        assert [delta for (delta,) in logged] == [90, -2, -3, -4]
+    finally:
+        db.close()
+    assert _stored(product["id"]) == (81, 0)
+    checkpoints.append((now(), 81))
+
+    assert [as_of(ts) for ts, _ in checkpoints] == [88, 85, 81, 81]
+    assert [quantity for _, quantity in checkpoints] == [88, 85, 81, 81]
+
+
+@ledger_mode
+def test_large_sale_folds_into_the_locked_row(client, admin_headers, make_products):
+    (product,) = make_products(100)
+    assert _sell(client, admin_headers, product, 3).status_code == 200
+    assert _sell(client, admin_headers, product, quantity_ledger.ledger_sale_limit() + 1).status_code == 200
+    expected = 100 - 3 - quantity_ledger.ledger_sale_limit() - 1
+    assert _stored(product["id"]) == (expected, 0)
+    assert _quantity(client, admin_headers, product) == expected
+
+
+@ledger_mode
+def test_sale_into_the_safety_stock_uses_the_row(client, admin_headers, make_products):
+    (product,) = make_products(35)
+    assert _sell(client, admin_headers, product, 8).status_code == 200
+    assert _stored(product["id"]) == (27, 0)
+
+
+@ledger_mode
+def test_oversell_is_rejected(client, admin_headers, make_products):
+    (product,) = make_products(5)
+    response = _sell(client, admin_headers, product, 6)
+    assert response.status_code == 400
+    assert _quantity(client, admin_headers, product) == 5
+
+
+# Also runs with the ledger off, where approvals lock the product row
+def test_concurrent_sales_never_oversell(client, admin_headers, make_products):
+    (product,) = make_products(40)
+    request_ids = []
+    for _ in range(50):
+        response = client.post("/api/inventory/request", json={
+            "barcode": product["barcode"], "action": "sell", "quantity_change": 1,
+            "buyer_name": "walk-in", "payment_status": "paid",
+        }, headers=admin_headers)
+        request_ids.append(response.json()["id"])
+
+    def approve(request_id):
+        return client.put(f"/api/inventory/requests/{request_id}/approve", headers=admin_headers).status_code
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        statuses = list(pool.map(approve, request_ids))
+    assert statuses.count(200) == 40
+    assert statuses.count(400) == 10
+    assert _quantity(client, admin_headers, product) == 0
+
+
+@ledger_mode
+def test_compaction_folds_pending_deltas(client, admin_headers, make_products):
+    (product,) = make_products(60)
+    for quantity in (1, 2, 3):
+        assert _sell(client, admin_headers, product, quantity).status_code == 200
+    db = SessionLocal()
+    try:
+        quantity_ledger.compact(db)
+    finally:
+        db.close()
+    assert _stored(product["id"]) == (54, 0)
+    assert _quantity(client, admin_headers, product) == 54
@@ -0,0 +1,77 @@
+"""
+WebSocket updates: an open socket holds no database connection, so the
+number of checked-out pool connections does not grow with the socket count,
+the heartbeat interval that bounds each receive must be positive and each
+socket subscribes to a bounded number of topics.
+"""
+from contextlib import ExitStack
+
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import event
+
+from app.config import Settings
+from app.database import engine
+from app.events import hub
+
+
+def _token(headers) -> str:
+    return headers["Authorization"].split(" ", 1)[1]
+
+
+def test_pool_checkouts_stay_flat_as_sockets_grow(client, admin_headers, monkeypatch):
+    monkeypatch.setattr(hub, "max_connections_per_user", 0)
+    checked_out = {"now": 0, "peak": 0}
+
+    def on_checkout(*args):
+        checked_out["now"] += 1
+        checked_out["peak"] = max(checked_out["peak"], checked_out["now"])
+
+    def on_checkin(*args):
+        checked_out["now"] -= 1
+
+    event.listen(engine, "checkout", on_checkout)
+    event.listen(engine, "checkin", on_checkin)
+    try:
+        held = []
+        with ExitStack() as stack:
+            for count in range(1, 41):
+                socket = stack.enter_context(
+                    client.websocket_connect(f"/ws/updates?token={_token(admin_headers)}")
+                )
+                # A round trip, so the handler is past authentication and in its receive loop
+                socket.send_json({"action": "subscribe", "topics": ["products", f"product:{count}"]})
+                assert socket.receive_json()["type"] == "subscriptions"
+                if count in (1, 10, 40):
+                    held.append(checked_out["now"])
+        assert held == [0, 0, 0]
+        # Each handshake borrows one connection for the token lookup and returns it
+        assert checked_out["peak"] <= 1
+    finally:
+        event.remove(engine, "checkout", on_checkout)
+        event.remove(engine, "checkin", on_checkin)
+
+
+def test_heartbeat_interval_must_be_positive():
+    with pytest.raises(ValidationError):
+        Settings(WS_HEARTBEAT_INTERVAL_SECONDS=0)
+    assert Settings(WS_HEARTBEAT_INTERVAL_SECONDS=0.5).WS_HEARTBEAT_INTERVAL_SECONDS == 0.5
+
+
+def test_subscriptions_are_capped_per_connection(client, admin_headers, monkeypatch):
+    monkeypatch.setattr(hub, "max_topics_per_connection", 3)
+    with client.websocket_connect(f"/ws/updates?token={_token(admin_headers)}") as socket:
+        socket.send_json({"action": "subscribe", "topics": ["products", "product:1", "product:1"]})
+        assert socket.receive_json() == {"type": "subscriptions", "topics": ["product:1", "products"]}
+
+        # Over the cap: rejected as a whole, existing subscriptions kept
+        socket.send_json({"action": "subscribe", "topics": ["product:2", "product:3"]})
+        reply = socket.receive_json()
+        assert reply["type"] == "error" and "3 topics" in reply["detail"]
+
+        socket.send_json({"action": "subscribe", "topics": ["product:2", "products"]})
+        assert socket.receive_json()["topics"] == ["product:1", "product:2", "products"]
+        socket.send_json({"action": "unsubscribe", "topics": ["product:1"]})
+        socket.receive_json()
+        socket.send_json({"action": "subscribe", "topics": ["product:3"]})
+        assert socket.receive_json()["topics"] == ["product:2", "product:3", "products"]
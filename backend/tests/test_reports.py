@@ -0,0 +1,148 @@
+"""
+Sales reports and receivables: reports built from the daily rollup agree
+with the raw history rows, and ageing buckets follow the day, so the
+receivables ETag does too.
+"""
+import datetime
+import types
+import uuid
+
+from app import models, reports
+from app.database import SessionLocal
+
+
+def _shift_days(monkeypatch, days):
+    class ShiftedDatetime(datetime.datetime):
+        @classmethod
+        def utcnow(cls):
+            return datetime.datetime.utcnow() + datetime.timedelta(days=days)
+
+    monkeypatch.setattr(reports, "datetime", types.SimpleNamespace(
+        datetime=ShiftedDatetime, date=datetime.date, time=datetime.time, timedelta=datetime.timedelta,
+    ))
+
+
+def _sell(client, headers, product, quantity, buyer, payment_status="paid"):
+    response = client.post("/api/inventory/request", json={
+        "barcode": product["barcode"], "action": "sell", "quantity_change": quantity,
+        "buyer_name": buyer, "payment_status": payment_status,
+    }, headers=headers)
+    assert response.status_code == 200, response.text
+    response = client.put(f"/api/inventory/requests/{response.json()['id']}/approve", headers=headers)
+    assert response.status_code == 200, response.text
+
+
+def _report(client, headers, group_by):
+    today = datetime.datetime.utcnow().date().isoformat()
+    response = client.get(
+        "/api/reports/sales", params={"group_by": group_by, "start": today, "end": today}, headers=headers
+    )
+    assert response.status_code == 200, response.text
+    return {row["key"]: (row["units"], row["revenue"], row["sale_count"]) for row in response.json()["rows"]}
+
+
+def test_rollup_totals_match_raw_history(client, admin_headers, make_products):
+    category = f"report-{uuid.uuid4().hex[:8]}"
+    buyer = f"buyer-{uuid.uuid4().hex[:8]}"
+    a, b = make_products(50, 50, price=2.0, category=category)
+    _sell(client, admin_headers, a, 3, buyer)
+    _sell(client, admin_headers, b, 1, buyer)
+    # Later sales are counted at the new price, earlier ones keep theirs
+    edit = {key: a[key] for key in ("barcode", "name", "category")}
+    response = client.put(f"/api/products/{a['id']}", json={**edit, "quantity": 47, "price": 3.5},
+                          headers=admin_headers)
+    assert response.status_code == 200, response.text
+    _sell(client, admin_headers, a, 2, buyer)
+    _sell(client, admin_headers, a, 4, buyer)
+
+    db = SessionLocal()
+    try:
+        history = models.ChangeHistory
+        raw = {}
+        rows = db.query(history.product_id, history.quantity_change, history.unit_price).filter(
+            history.buyer_name == buyer, history.action == models.ChangeRequestAction.sell
+        )
+        for product_id, quantity, price in rows:
+            units, revenue, count = raw.get(str(product_id), (0, 0.0, 0))
+            raw[str(product_id)] = (units + abs(quantity), revenue + abs(quantity) * price, count + 1)
+    finally:
+        db.close()
+    assert raw == {str(a["id"]): (9, 27.0, 3), str(b["id"]): (1, 2.0, 1)}
+
+    by_product = _report(client, admin_headers, reports.GROUP_PRODUCT)
+    assert {key: by_product[key] for key in raw} == raw
+    total = tuple(sum(values) for values in zip(*raw.values()))
+    assert _report(client, admin_headers, reports.GROUP_CATEGORY)[category] == total
+    # Buyers are not in the rollup key, so this one is summed from history
+    assert _report(client, admin_headers, reports.GROUP_BUYER)[buyer] == total
+
+
+def test_receivables_etag_changes_with_the_day(client, admin_headers, monkeypatch):
+    response = client.get("/api/history/receivables", headers=admin_headers)
+    assert response.status_code == 200, response.text
+    etag = response.headers["etag"]
+    revalidate = {**admin_headers, "If-None-Match": etag}
+    assert client.get("/api/history/receivables", headers=revalidate).status_code == 304
+
+    _shift_days(monkeypatch, 1)
+    response = client.get("/api/history/receivables", headers=revalidate)
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_ageing_bucket_boundary_is_a_whole_day(client):
+    buyer = f"buyer-{uuid.uuid4().hex[:8]}"
+    today = datetime.datetime.utcnow().date()
+    # The earliest moment still in ``current`` today, and the one just before it
+    boundary = datetime.datetime.combine(today - datetime.timedelta(days=29), datetime.time.min)
+    db = SessionLocal()
+    try:
+        db.add_all([
+            models.ChangeHistory(
+                action=models.ChangeRequestAction.sell, status=models.ChangeRequestStatus.approved,
+                quantity_change=-1, unit_price=price, buyer_name=buyer,
+                payment_status=models.PaymentStatus.unpaid, timestamp=moment,
+            )
+            for moment, price in ((boundary, 10.0), (boundary - datetime.timedelta(seconds=1), 20.0))
+        ])
+        db.commit()
+
+        def buckets(as_of):
+            (row,) = [row for row in reports.receivables_ledger(db, as_of) if row["buyer_name"] == buyer]
+            return {name: row[name] for name, _, _ in reports.AGEING_BUCKETS}
+
+        assert buckets(today) == {"current": 10.0, "days_31_60": 20.0, "days_61_90": 0.0, "over_90": 0.0}
+        assert buckets(today + datetime.timedelta(days=1))["days_31_60"] == 30.0
+    finally:
+        db.close()
+
+
+def test_settling_some_of_a_buyers_sales(client, admin_headers, make_products):
+    buyer = f"buyer-{uuid.uuid4().hex[:8]}"
+    (product,) = make_products(20, price=5.0)
+    for quantity in (1, 2, 3):
+        _sell(client, admin_headers, product, quantity, buyer, payment_status="unpaid")
+    unpaid = client.get("/api/history/unpaid", params={"buyer_name": buyer, "compact": True},
+                        headers=admin_headers).json()
+    by_quantity = {abs(row["quantity_change"]): row["id"] for row in unpaid}
+    chosen = sorted([by_quantity[1], by_quantity[3]])
+
+    response = client.post("/api/history/receivables/settle", json={"buyer_name": buyer, "history_ids": chosen},
+                           headers=admin_headers)
+    assert response.status_code == 200, response.text
+    settlement = response.json()
+    assert (settlement["settled_ids"], settlement["settled_count"], settlement["settled_amount"]) == (chosen, 2, 20.0)
+
+    (receivable,) = [
+        row for row in client.get("/api/history/receivables", headers=admin_headers).json()
+        if row["buyer_name"] == buyer
+    ]
+    assert (receivable["sale_count"], receivable["outstanding"]) == (1, 10.0)
+    remaining = client.get("/api/history/unpaid", params={"buyer_name": buyer, "compact": True},
+                           headers=admin_headers).json()
+    assert [row["id"] for row in remaining] == [by_quantity[2]]
+
+    # Settled sales cannot be settled again
+    response = client.post("/api/history/receivables/settle", json={"buyer_name": buyer, "history_ids": chosen},
+                           headers=admin_headers)
+    assert response.status_code == 400
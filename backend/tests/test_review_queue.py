@@ -0,0 +1,90 @@
+"""
+Review leases: a claim racing an approval never leaves a lease on the
+resolved request, and a request leased to another reviewer cannot be
+approved.
+"""
+import threading
+import uuid
+
+import pytest
+
+from app import models, quantity_ledger
+from app.database import SessionLocal
+
+
+@pytest.fixture
+def reviewer_headers(client, admin_headers):
+    username = f"reviewer-{uuid.uuid4().hex[:8]}"
+    response = client.post("/api/users/", json={"username": username, "password": "pw", "role": "admin"},
+                           headers=admin_headers)
+    assert response.status_code == 200, response.text
+    response = client.post("/api/token", data={"username": username, "password": "pw"})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def _restock_request(client, headers, product):
+    response = client.post("/api/inventory/request", json={
+        "barcode": product["barcode"], "action": "add", "quantity_change": 5,
+    }, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def _leases(request_id):
+    db = SessionLocal()
+    try:
+        return db.query(models.ReviewLease).filter(models.ReviewLease.request_id == request_id).count()
+    finally:
+        db.close()
+
+
+def test_claim_during_approval_leaves_no_lease(client, admin_headers, reviewer_headers, make_products, monkeypatch):
+    (product,) = make_products(10)
+    request_id = _restock_request(client, admin_headers, product)
+    claimed = {}
+
+    def claim():
+        response = client.post("/api/inventory/requests/claim", json={"limit": 50, "actions": ["add"]},
+                               headers=reviewer_headers)
+        claimed["ids"] = [row["id"] for row in response.json()["requests"]]
+
+    adjust = quantity_ledger.adjust_quantity
+
+    def adjust_while_claiming(*args, **kwargs):
+        # The approval has resolved its lease; another reviewer claims now
+        claimer = threading.Thread(target=claim)
+        claimer.start()
+        claimer.join(timeout=0.5)
+        try:
+            return adjust(*args, **kwargs)
+        finally:
+            monkeypatch.setattr(quantity_ledger, "adjust_quantity", adjust)
+            claimed["thread"] = claimer
+
+    monkeypatch.setattr(quantity_ledger, "adjust_quantity", adjust_while_claiming)
+    response = client.put(f"/api/inventory/requests/{request_id}/approve", headers=admin_headers)
+    assert response.status_code == 200, response.text
+    claimed["thread"].join()
+
+    assert request_id not in claimed["ids"]
+    assert _leases(request_id) == 0
+
+
+def test_request_leased_to_another_reviewer_cannot_be_approved(client, admin_headers, reviewer_headers,
+                                                                make_products):
+    (product,) = make_products(10)
+    request_id = _restock_request(client, admin_headers, product)
+    response = client.post("/api/inventory/requests/claim", json={"limit": 50, "actions": ["add"]},
+                           headers=reviewer_headers)
+    assert request_id in [row["id"] for row in response.json()["requests"]]
+
+    response = client.put(f"/api/inventory/requests/{request_id}/approve", headers=admin_headers)
+    assert response.status_code == 409, response.text
+    assert _leases(request_id) == 1
+
+    response = client.put(f"/api/inventory/requests/{request_id}/approve", headers=reviewer_headers)
+    assert response.status_code == 200, response.text
+    assert _leases(request_id) == 0
+    response = client.put(f"/api/inventory/requests/{request_id}/approve", headers=reviewer_headers)
+    assert response.status_code == 404
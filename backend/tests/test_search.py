@@ -0,0 +1,63 @@
+"""
+Product search on the SQLite FTS5 backend and the in-memory trigram index:
+filters apply before results are cut to ``limit``, the best matches come
+first and queries shorter than a trigram still find substrings.
+"""
+import uuid
+
+import pytest
+
+from app import search
+
+
+@pytest.fixture(params=[search.BACKEND_FTS5, search.BACKEND_MEMORY])
+def backend(request, client, monkeypatch):
+    monkeypatch.setattr(search, "_backend", request.param)
+    return request.param
+
+
+def _create(client, headers, names, category):
+    tag = uuid.uuid4().hex[:8]
+    response = client.post("/api/products/", json=[
+        {"barcode": f"{tag}-{index}", "name": name, "price": 1.0, "quantity": 1, "category": category}
+        for index, name in enumerate(names)
+    ], headers=headers)
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def _search(client, headers, **params):
+    response = client.get("/api/products/search", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return [product["name"] for product in response.json()]
+
+
+def test_short_query_finds_substrings(client, admin_headers, backend):
+    category = uuid.uuid4().hex
+    _create(client, admin_headers, ["Cola", "Lemonade", "Water"], category)
+    assert _search(client, admin_headers, q="ol", category=category) == ["Cola"]
+
+
+def test_best_match_survives_the_limit(client, admin_headers, backend):
+    category = uuid.uuid4().hex
+    word = uuid.uuid4().hex[:10]
+    _create(client, admin_headers, [f"{word} family pack {n}" for n in range(30)] + [word], category)
+    assert _search(client, admin_headers, q=word, category=category, limit=1) == [word]
+    assert _search(client, admin_headers, q=word, category=category, limit=3)[0] == word
+
+
+def test_filters_apply_before_the_limit(client, admin_headers, backend):
+    category = uuid.uuid4().hex
+    word = uuid.uuid4().hex[:10]
+    archived = _create(client, admin_headers, [word] * 30, category)
+    response = client.post(
+        "/api/products/bulk/archive", json={"product_ids": [product["id"] for product in archived]},
+        headers=admin_headers,
+    )
+    assert response.status_code == 200, response.text
+    _create(client, admin_headers, [f"{word} in stock"], category)
+    # Other categories hold better matches too
+    _create(client, admin_headers, [word] * 10, uuid.uuid4().hex)
+
+    assert _search(client, admin_headers, q=word, category=category, limit=1) == [f"{word} in stock"]
+    assert len(_search(client, admin_headers, q=word, category=category, include_archived=True, limit=50)) == 31
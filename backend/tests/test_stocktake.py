@@ -0,0 +1,118 @@
+"""
+Stocktakes: how counts are recorded, and how applying adds the counted
+variances on top of whatever happened since, all or nothing.
+"""
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def stocktake(client, admin_headers):
+    response = client.post("/api/stocktakes/", json={"note": "cycle count"}, headers=admin_headers)
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+def _count(client, headers, stocktake_id, *counts):
+    response = client.post(f"/api/stocktakes/{stocktake_id}/counts", json={
+        "counts": [{"barcode": barcode, "counted_quantity": counted} for barcode, counted in counts],
+    }, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _lines(client, headers, stocktake_id):
+    response = client.get(f"/api/stocktakes/{stocktake_id}", headers=headers)
+    assert response.status_code == 200, response.text
+    return {line["product_id"]: line for line in response.json()["lines"]}
+
+
+def _apply(client, headers, stocktake_id, product_ids=None):
+    return client.post(f"/api/stocktakes/{stocktake_id}/apply", json={"product_ids": product_ids}, headers=headers)
+
+
+def _quantity(client, headers, product):
+    return client.get(f"/api/products/{product['barcode']}", headers=headers).json()["quantity"]
+
+
+def _sell(client, headers, product, quantity):
+    response = client.post("/api/inventory/request", json={
+        "barcode": product["barcode"], "action": "sell", "quantity_change": quantity,
+        "buyer_name": "walk-in", "payment_status": "paid",
+    }, headers=headers)
+    assert response.status_code == 200, response.text
+    response = client.put(f"/api/inventory/requests/{response.json()['id']}/approve", headers=headers)
+    assert response.status_code == 200, response.text
+
+
+def test_duplicate_barcodes_are_summed_and_unknown_ones_reported(client, admin_headers, make_products, stocktake):
+    a, b = make_products(10, 20)
+    unknown = f"missing-{uuid.uuid4().hex[:8]}"
+    result = _count(
+        client, admin_headers, stocktake, (a["barcode"], 3), (unknown, 1), (a["barcode"], 4), (b["barcode"], 20)
+    )
+    assert result == {"recorded": 2, "unknown": [unknown]}
+
+    lines = _lines(client, admin_headers, stocktake)
+    assert set(lines) == {a["id"], b["id"]}
+    line = lines[a["id"]]
+    assert (line["counted_quantity"], line["system_quantity"], line["variance"]) == (7, 10, -3)
+    assert lines[b["id"]]["variance"] == 0
+
+
+def test_a_recount_replaces_the_earlier_count(client, admin_headers, make_products, stocktake):
+    (product,) = make_products(10)
+    _count(client, admin_headers, stocktake, (product["barcode"], 5))
+    _count(client, admin_headers, stocktake, (product["barcode"], 8))
+    line = _lines(client, admin_headers, stocktake)[product["id"]]
+    assert (line["counted_quantity"], line["variance"]) == (8, -2)
+
+
+def test_apply_adds_the_variance_to_sales_made_since_counting(client, admin_headers, make_products, stocktake):
+    (product,) = make_products(10)
+    _count(client, admin_headers, stocktake, (product["barcode"], 12))
+    _sell(client, admin_headers, product, 3)
+
+    response = _apply(client, admin_headers, stocktake)
+    assert response.status_code == 200, response.text
+    assert response.json()["adjusted"] == 1
+    assert _quantity(client, admin_headers, product) == 9
+
+
+def test_apply_leaves_unselected_lines_unapplied(client, admin_headers, make_products, stocktake):
+    a, b = make_products(10, 10)
+    _count(client, admin_headers, stocktake, (a["barcode"], 11), (b["barcode"], 13))
+
+    response = _apply(client, admin_headers, stocktake, product_ids=[a["id"]])
+    assert response.status_code == 200, response.text
+    assert (_quantity(client, admin_headers, a), _quantity(client, admin_headers, b)) == (11, 10)
+    lines = _lines(client, admin_headers, stocktake)
+    assert (lines[a["id"]]["applied"], lines[b["id"]]["applied"]) == (True, False)
+
+
+def test_apply_skips_products_deleted_after_counting(client, admin_headers, make_products, stocktake):
+    a, b = make_products(10, 10)
+    _count(client, admin_headers, stocktake, (a["barcode"], 8), (b["barcode"], 9))
+    assert client.delete(f"/api/products/{a['id']}", headers=admin_headers).status_code == 200
+
+    response = _apply(client, admin_headers, stocktake)
+    assert response.status_code == 200, response.text
+    assert (response.json()["adjusted"], response.json()["skipped"]) == (1, [a["id"]])
+    assert _quantity(client, admin_headers, b) == 9
+
+
+def test_a_negative_result_rolls_back_the_whole_apply(client, admin_headers, make_products, stocktake):
+    # The good line has the lower ID, so it is adjusted before the bad one fails
+    good, bad = make_products(20, 10)
+    _count(client, admin_headers, stocktake, (good["barcode"], 25), (bad["barcode"], 2))
+    _sell(client, admin_headers, bad, 5)
+
+    response = _apply(client, admin_headers, stocktake)
+    assert response.status_code == 400
+    assert "negative" in response.json()["detail"]
+    assert (_quantity(client, admin_headers, good), _quantity(client, admin_headers, bad)) == (20, 5)
+    lines = _lines(client, admin_headers, stocktake)
+    assert not any(line["applied"] for line in lines.values())
+    report = client.get(f"/api/stocktakes/{stocktake}", headers=admin_headers).json()
+    assert report["session"]["status"] == "open"
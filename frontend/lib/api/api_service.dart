@@ -84,6 +84,11 @@ class ApiService {
       _channel!.stream.listen((event) {
         try {
           final Map<String, dynamic> msg = jsonDecode(event);
+          // Answer server heartbeats so the socket is not closed as idle
+          if (msg['type'] == 'ping') {
+            _channel?.sink.add(jsonEncode({'type': 'pong'}));
+            return;
+          }
           onMessage(msg);
         } catch (_) {}
       }, onError: (_) {